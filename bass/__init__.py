@@ -19,8 +19,12 @@
 """Main module of the BASS."""
 
 
+from array import array
+import bisect
+import difflib
 from enum import Enum
 import importlib
+import sys
 
 from orchid import matches
 
@@ -104,17 +108,179 @@ class DisassemblyException(MessageException):
 
 
 class Disassembly:
-	"""Represents a disassebly program."""
+	"""Represents a disassembled program. The lines (rows) are stored in
+	parallel arrays: addresses, code bytes (empty for a label line) and
+	instruction texts (the label followed by ':' for a label line) with
+	interned strings. Once built, index() must be called to build the
+	address index used by row_of(), nearest_label() and get_rows()."""
+
+	def __init__(self):
+		self.addrs = array('I')
+		self.codes = []
+		self.insts = []
+		self.labels = {}
+		self.index_addrs = array('I')		# sorted instruction addresses
+		self.index_rows = array('I')		# corresponding rows
+		self.label_addrs = array('I')		# sorted label addresses
+		self.label_names = []
+
+	def add_label(self, addr, label):
+		"""Add a label line."""
+		self.addrs.append(addr)
+		self.codes.append("")
+		self.insts.append(sys.intern(label + ":"))
+		self.labels.setdefault(label, addr)
+
+	def add_symbol(self, label, addr):
+		"""Record a label that has no line in the code."""
+		self.labels.setdefault(label, addr)
+
+	def add_inst(self, addr, code, inst):
+		"""Add an instruction line."""
+		self.addrs.append(addr)
+		self.codes.append(sys.intern(code))
+		self.insts.append(sys.intern(inst))
+
+	def index(self):
+		"""Build the address index."""
+		rows = sorted((addr, row) for (row, addr) in enumerate(self.addrs)
+			if self.codes[row])
+		self.index_addrs = array('I', (addr for (addr, _) in rows))
+		self.index_rows = array('I', (row for (_, row) in rows))
+		labels = sorted((addr, label) for (label, addr) in self.labels.items())
+		self.label_addrs = array('I', (addr for (addr, _) in labels))
+		self.label_names = [label for (_, label) in labels]
 
 	def get_code(self):
-		"""Return a list of triples (address, bytes, instruction) representing
-		the program."""
-		pass
+		"""Return a sequence of triples (address, bytes, instruction)
+		representing the program."""
+		return CodeView(self)
+
+	def get_size(self):
+		"""Get the number of lines."""
+		return len(self.addrs)
+
+	def get_address(self, row):
+		"""Get the address of a line."""
+		return self.addrs[row]
+
+	def is_label(self, row):
+		"""Test if a line is a label."""
+		return not self.codes[row]
+
+	def row_of(self, addr):
+		"""Get the line of the instruction at the given address or None."""
+		i = bisect.bisect_left(self.index_addrs, addr)
+		if i < len(self.index_addrs) and self.index_addrs[i] == addr:
+			return self.index_rows[i]
+		else:
+			return None
+
+	def nearest_label(self, addr):
+		"""Get the closest label before or at addr as a pair (label,
+		address) or None."""
+		i = bisect.bisect_right(self.label_addrs, addr) - 1
+		if i < 0:
+			return None
+		else:
+			return (self.label_names[i], self.label_addrs[i])
+
+	def get_rows(self, low, high):
+		"""Get the range of lines of the instructions whose address is in
+		[low, high[."""
+		i = bisect.bisect_left(self.index_addrs, low)
+		j = bisect.bisect_left(self.index_addrs, high)
+		if i >= j:
+			return range(0)
+		return range(self.index_rows[i], self.index_rows[j - 1] + 1)
 
 	def find_label(self, label):
 		"""Find a label and return its address. Return None if the label cannot
 		be found."""
-		return None
+		return self.labels.get(label)
+
+	def locate(self, addr):
+		"""Get the position of an address relative to its closest label as a
+		pair (label, offset) or None."""
+		label = self.nearest_label(addr)
+		if label is None:
+			return None
+		else:
+			return (label[0], addr - label[1])
+
+	def get_label(self, addr):
+		"""Get the name of an address relative to its closest label, as
+		"label" or "label+0xoffset", or None if there is no label before."""
+		pos = self.locate(addr)
+		if pos is None:
+			return None
+		(label, offset) = pos
+		if offset == 0:
+			return label
+		else:
+			return f"{label}+0x{offset:x}"
+
+	def resolve(self, label, offset):
+		"""Get the address of the instruction at offset from the label or
+		None if there is no such instruction."""
+		addr = self.labels.get(label)
+		if addr is None or self.row_of(addr + offset) is None:
+			return None
+		else:
+			return addr + offset
+
+	def get_keys(self):
+		"""Get the keys of the lines used to compare disassemblies: the code
+		of instructions and the label of label lines."""
+		return [code if code else inst for (code, inst) in zip(self.codes, self.insts)]
+
+	def diff(self, old):
+		"""Compare with an old disassembly and return the list of operations
+		(tag, i1, i2, j1, j2) transforming the lines i1 to i2 of old into the
+		lines j1 to j2 of this disassembly as difflib.SequenceMatcher does.
+		Rows of "equal" operations may differ by their address or their
+		instruction text."""
+		a = old.get_keys()
+		b = self.get_keys()
+		start = 0
+		size = min(len(a), len(b))
+		while start < size and a[start] == b[start]:
+			start += 1
+		end = 0
+		while end < size - start and a[-1 - end] == b[-1 - end]:
+			end += 1
+		matcher = difflib.SequenceMatcher(None,
+			a[start:len(a) - end], b[start:len(b) - end], autojunk=False)
+		ops = []
+		if start:
+			ops.append(("equal", 0, start, 0, start))
+		for (tag, i1, i2, j1, j2) in matcher.get_opcodes():
+			ops.append((tag, i1 + start, i2 + start, j1 + start, j2 + start))
+		if end:
+			ops.append(("equal", len(a) - end, len(a), len(b) - end, len(b)))
+		return ops
+
+
+class CodeView:
+	"""Read-only sequence of the lines of a disassembly as triples
+	(address, bytes, instruction)."""
+
+	def __init__(self, disasm):
+		self.disasm = disasm
+
+	def __len__(self):
+		return len(self.disasm.addrs)
+
+	def __getitem__(self, row):
+		d = self.disasm
+		if isinstance(row, slice):
+			return list(zip(d.addrs[row], d.codes[row], d.insts[row]))
+		return (d.addrs[row], d.codes[row], d.insts[row])
+
+	def __iter__(self):
+		d = self.disasm
+		return zip(d.addrs, d.codes, d.insts)
+
 
 class ApplicationPane:
 	"""Interface shared by all components of the application."""
@@ -139,8 +305,10 @@ class ApplicationPane:
 		"""Called just before the simulator is deleted."""
 		pass
 
-	def on_sim_update(self, session, sim):
-		"""Called each time the simulator state needs to be updated."""
+	def on_sim_update(self, session, sim, changes):
+		"""Called each time the simulator state needs to be updated. changes
+		is the ChangeSet since the previous update and allows to skip the
+		update of parts that have not changed."""
 		pass
 
 	def on_sim_release(self, session, sim):
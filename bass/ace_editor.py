@@ -17,6 +17,13 @@ MODEL = Model(
 	#	"test.js",
 	#	"https://cdn.jsdelivr.net/npm/ace-builds@1.35.0/src-min-noconflict/ace.js"
 	#],
+	style = """
+.ace-current-line {
+	position: absolute;
+	background: yellow;
+	opacity: 0.5;
+}
+""",
 	script = """
 function ace_new(msg) {
 	const id = msg['id'];
@@ -82,6 +89,41 @@ function ace_paste(msg) {
 			editor.session.insert(editor.getCursorPosition(), data[i].getType("text/plain"));
 }
 
+function ace_mark(msg) {
+	const component = document.getElementById(msg.id);
+	const editor = component.ace_editor;
+	if(component.ace_marker != undefined)
+		editor.session.removeMarker(component.ace_marker);
+	component.ace_marker = undefined;
+	if(msg.line != null) {
+		const Range = ace.require("ace/range").Range;
+		component.ace_marker = editor.session.addMarker(
+			new Range(msg.line, 0, msg.line, 1), "ace-current-line", "fullLine");
+		editor.scrollToLine(msg.line, true, true, function() {});
+	}
+}
+
+function ace_cursor(event, editor) {
+	const row = editor.getCursorPosition().row;
+	if(editor.bass_row != row) {
+		editor.bass_row = row;
+		ui_send({ "id": editor.container.id, "action": "ace_cursor", "row": row });
+	}
+}
+
+function ace_track(msg) {
+	const component = document.getElementById(msg.id);
+	const editor = component.ace_editor;
+	if(editor.bass_track != undefined)
+		editor.selection.off("changeCursor", editor.bass_track);
+	editor.bass_track = undefined;
+	editor.bass_row = undefined;
+	if(msg.on) {
+		editor.bass_track = function(event) { ace_cursor(event, editor); };
+		editor.selection.on("changeCursor", editor.bass_track);
+	}
+}
+
 function ace_focus(msg) {
 	const component = document.getElementById(msg.id);
 	const editor = component.ace_editor;
@@ -111,6 +153,8 @@ class Editor(Component):
 		self.add_class("editor")
 		self.generated = False
 		self.fun = None
+		self.line = None
+		self.on_cursor = None
 
 	def expands_horizontal(self):
 		return True
@@ -125,6 +169,10 @@ class Editor(Component):
 		out.write("</div>")
 		self.call("ace_new", {"id": self.get_id()})
 		self.call("ace_set", {"id": self.get_id(), "content": self.text})
+		if self.line is not None:
+			self.call("ace_mark", {"id": self.get_id(), "line": self.line})
+		if self.on_cursor is not None:
+			self.call("ace_track", {"id": self.get_id(), "on": True})
 		self.generated = True
 
 	def get_content(self, fun):
@@ -132,9 +180,27 @@ class Editor(Component):
 		self.fun = fun
 		self.call("ace_get", {"id": self.get_id()})
 
+	def mark(self, line):
+		"""Highlight the given line (starting at 0) or remove the highlight
+		if line is None."""
+		if line != self.line:
+			self.line = line
+			if self.online():
+				self.call("ace_mark", {"id": self.get_id(), "line": line})
+
+	def track_cursor(self, fun):
+		"""Call fun with the line (starting at 0) of the cursor each time it
+		changes. If fun is None, stop the tracking."""
+		self.on_cursor = fun
+		if self.online():
+			self.call("ace_track", {"id": self.get_id(), "on": fun is not None})
+
 	def receive(self, msg, handler):
 		if msg['action'] == 'ace_get':
 			self.fun(msg['content'])
+		elif msg['action'] == 'ace_cursor':
+			if self.on_cursor is not None:
+				self.on_cursor(int(msg['row']))
 		else:
 			VGroup.receive(self, msg, handler)
 
@@ -176,6 +242,9 @@ class CodeEditor(VGroup, bass.ApplicationPane):
 
 		# make editor
 		self.file = file
+		self.session = None
+		self.sim = None
+		self.lines = None
 		text = file.load()
 		self.editor = Editor(text)
 
@@ -226,3 +295,46 @@ class CodeEditor(VGroup, bass.ApplicationPane):
 	def save(self, interface):
 		"""Save the current file."""
 		self.on_save(None, lambda: None)
+
+	def update_line(self):
+		"""Highlight the source line of the current PC, if it is in the file."""
+		pos = None
+		if self.sim is not None and self.lines is not None:
+			pos = self.lines.find(self.sim.get_pc())
+		if pos is not None and pos[0] == self.file.get_name():
+			self.editor.mark(pos[1] - 1)
+		else:
+			self.editor.mark(None)
+
+	def select_line(self, row):
+		"""Called when the cursor is moved to row during a simulation to
+		make the first instruction of the line the current position."""
+		if self.lines is not None:
+			addr = self.lines.find_address(self.file.get_name(), row + 1)
+			if addr is not None:
+				self.session.get_current_addr().set(addr)
+
+	def on_begin(self, session):
+		self.session = session
+
+	def on_end(self, session):
+		self.session = None
+
+	def on_compiled(self, session):
+		self.lines = session.get_project().get_lines()
+		if self.lines.is_empty():
+			self.lines = None
+
+	def on_sim_start(self, session, sim):
+		self.sim = sim
+		self.editor.track_cursor(self.select_line)
+		self.update_line()
+
+	def on_sim_stop(self, session, sim):
+		self.sim = None
+		self.editor.track_cursor(None)
+		self.update_line()
+
+	def on_sim_update(self, session, sim, changes):
+		if changes.pc_moved:
+			self.update_line()
@@ -18,13 +18,39 @@
 
 """Common architecture useful definitions."""
 
+import array
+from collections import Counter
+import copy
 from enum import IntEnum
+import struct
+from time import perf_counter
 
 from bass import Format, MessageException, RegDisplay
+from bass import breaks, elf
+
+PAGE_SIZE = 4096		# size of memory pages saved in checkpoints
+MAX_STACK_PAGES = 64	# maximum number of stack pages saved in checkpoints
+
+def read_words(read, addr, size):
+	"""Read size bytes at addr using read, a function reading the 32-bit
+	word at an aligned address. The bytes are returned in little-endian
+	order."""
+	first = addr & ~3
+	count = (addr + size - first + 3) >> 2
+	data = struct.pack(f"<{count}I", *map(read, range(first, first + count*4, 4)))
+	return data[addr - first:addr - first + size]
+
+
+def get_page_range(addr, size):
+	"""Get the range of addresses of the pages containing the size bytes
+	at addr."""
+	return range(addr & ~(PAGE_SIZE - 1), addr + size, PAGE_SIZE)
+
 
 class Run(IntEnum):
 	OK = 0		# execution reached end
 	BP = 1		# breakpoint encountered
+	WATCH = 2	# watched memory written
 
 
 class SimException(MessageException):
@@ -130,6 +156,227 @@ class CPSRegister(Register):
 		Register.__init__(self, "CPSR", index, self.FORMAT, handle, aliases)
 
 
+class Checkpoint:
+	"""State of a simulator at a given date: registers values (in the order of
+	Arch.get_registers()), address of the next instruction, content of
+	memory pages (as a dictionary page address -> bytes) and frames of the
+	call stack (None if the calls are not tracked)."""
+
+	def __init__(self, date, pc, regs, pages, calls=None):
+		self.date = date
+		self.pc = pc
+		self.regs = regs
+		self.pages = pages
+		self.calls = calls
+
+	def get_date(self):
+		"""Get the date of the checkpoint."""
+		return self.date
+
+	def get_size(self):
+		"""Get the approximate size in bytes of the checkpoint."""
+		return len(self.pages) * PAGE_SIZE + len(self.regs) * 8
+
+
+class ChangeSet:
+	"""Changes of the state of a simulator since the previous update of the
+	display:
+	* regs -- numbers (in Arch.get_registers() order) of changed registers,
+	* values -- values of all the registers,
+	* blocks -- new content of the changed tracked memory blocks as a
+	  dictionary (address, size) -> bytes,
+	* pc_moved -- True if the PC has changed,
+	* io -- True if the board may have produced I/O events.
+	Only tracked blocks (see Simulator.track_block()) are examined."""
+
+	def __init__(self, regs, values, blocks, pc_moved, io):
+		self.regs = regs
+		self.values = values
+		self.blocks = blocks
+		self.pc_moved = pc_moved
+		self.io = io
+
+	def is_empty(self):
+		"""Test if nothing has changed."""
+		return not self.regs and not self.blocks and not self.pc_moved \
+			and not self.io
+
+	def get_block(self, addr, size):
+		"""Get the new content of the tracked size bytes at addr or None if
+		they have not changed."""
+		return self.blocks.get((addr, size))
+
+
+class Trace:
+	"""Ring buffer recording the addresses of the last executed instructions
+	(at most size) and, optionally, the changed registers. The addresses
+	are stored in an array; the register changes are stored as pairs
+	(register number, value) in a ring of 2*size entries so that older
+	instructions may lose their register changes."""
+
+	MAGIC = b"BTRC\x01"
+
+	def __init__(self, size, regs=False):
+		self.size = size
+		self.regs = regs
+		self.pcs = array.array('I', bytes(4 * size))
+		self.count = 0
+		if regs:
+			self.dsize = 2 * size
+			self.starts = array.array('Q', bytes(8 * size))
+			self.dregs = array.array('B', bytes(self.dsize))
+			self.dvals = array.array('I', bytes(4 * self.dsize))
+			self.dcount = 0
+
+	def record(self, pc):
+		"""Record the execution of the instruction at pc."""
+		i = self.count % self.size
+		self.pcs[i] = pc
+		if self.regs:
+			self.starts[i] = self.dcount
+		self.count += 1
+
+	def record_regs(self, old, new):
+		"""Record the registers changed by the last recorded instruction
+		from the old and new register values. Return new."""
+		if old != new:
+			for (num, (x, y)) in enumerate(zip(old, new)):
+				if x != y:
+					j = self.dcount % self.dsize
+					self.dregs[j] = num
+					self.dvals[j] = y & 0xffffffff
+					self.dcount += 1
+		return new
+
+	def get_length(self):
+		"""Get the number of recorded instructions still in the buffer."""
+		return min(self.count, self.size)
+
+	def get_count(self):
+		"""Get the total number of recorded instructions."""
+		return self.count
+
+	def get_entries(self, first, count):
+		"""Get the entries from first (0 being the oldest in the buffer) as
+		a list of pairs (address, changes) where changes is a list of pairs
+		(register number, value) or None if unknown."""
+		base = self.count - self.get_length()
+		entries = []
+		for a in range(base + first, min(base + first + count, self.count)):
+			i = a % self.size
+			changes = None
+			if self.regs:
+				start = self.starts[i]
+				end = self.starts[(a + 1) % self.size] if a + 1 < self.count \
+					else self.dcount
+				if start >= self.dcount - self.dsize:
+					changes = [(self.dregs[j % self.dsize], self.dvals[j % self.dsize])
+						for j in range(start, end)]
+			entries.append((self.pcs[i], changes))
+		return entries
+
+	def encode(self, first, count):
+		"""Encode the entries from first as bytes: for each entry, the
+		address (32-bit) and the number of register changes (8-bit, 255 if
+		unknown) followed by the changes as register number (8-bit) and value
+		(32-bit). Numbers are in little endian."""
+		out = bytearray()
+		for (pc, changes) in self.get_entries(first, count):
+			if changes is None:
+				out += struct.pack("<IB", pc, 255)
+			else:
+				out += struct.pack("<IB", pc, len(changes))
+				for (num, value) in changes:
+					out += struct.pack("<BI", num, value)
+		return bytes(out)
+
+
+class Profile:
+	"""Execution profile of the code of a program: for each instruction, the
+	number of executions and the number of times the branch has been taken
+	(that is, the next instruction is not the following one). Counters are
+	stored in arrays indexed by (address - base) / INST_SIZE."""
+
+	INST_SIZE = 4
+
+	def __init__(self, base, top):
+		self.base = base
+		self.size = (top - base + self.INST_SIZE - 1) // self.INST_SIZE
+		self.counts = array.array('Q', bytes(8 * self.size))
+		self.taken = array.array('Q', bytes(8 * self.size))
+
+	def clear(self):
+		"""Reset all counters."""
+		self.counts = array.array('Q', bytes(8 * self.size))
+		self.taken = array.array('Q', bytes(8 * self.size))
+
+	def get_base(self):
+		"""Get the address of the first profiled instruction."""
+		return self.base
+
+	def index(self, addr):
+		"""Get the index of the counters of the given address or None if it is
+		not profiled."""
+		i = (addr - self.base) // self.INST_SIZE
+		if 0 <= i < self.size:
+			return i
+		else:
+			return None
+
+	def get_count(self, addr):
+		"""Get the number of executions of the instruction at addr."""
+		i = self.index(addr)
+		return 0 if i is None else self.counts[i]
+
+	def get_taken(self, addr):
+		"""Get the number of taken branches of the instruction at addr."""
+		i = self.index(addr)
+		return 0 if i is None else self.taken[i]
+
+	def get_max(self):
+		"""Get the maximum number of executions of an instruction."""
+		return max(self.counts, default=0)
+
+
+class CallStack:
+	"""Shadow call stack maintained during the execution: each frame is a
+	pair (address of the call instruction, called address), the innermost
+	call being the last one. A return pops the frames up to the call it
+	returns to (returns not matching a call are ignored) and the oldest
+	frames are dropped beyond MAX_DEPTH frames."""
+
+	NONE = ""
+	CALL = "call"
+	RETURN = "return"
+
+	MAX_DEPTH = 4096
+	INST_SIZE = 4
+
+	def __init__(self, frames=()):
+		self.frames = list(frames)
+
+	def update(self, kind, pc, npc):
+		"""Update the stack after the execution of the instruction at pc,
+		of the given kind (as returned by Arch.get_branch_kind()), npc being
+		the address of the next instruction. Plain branches are ignored."""
+		if kind == self.NONE or npc == pc + self.INST_SIZE:
+			return
+		frames = self.frames
+		if kind == self.CALL:
+			frames.append((pc, npc))
+			if len(frames) > self.MAX_DEPTH:
+				del frames[0]
+		else:
+			for i in range(len(frames) - 1, -1, -1):
+				if frames[i][0] + self.INST_SIZE == npc:
+					del frames[i:]
+					break
+
+	def get_frames(self):
+		"""Get the list of frames."""
+		return list(self.frames)
+
+
 class Arch:
 	"""Representation of an architecture."""
 
@@ -146,6 +393,23 @@ class Arch:
 		found."""
 		return None
 
+	def get_branch_kind(self, word):
+		"""Get the kind of the instruction word for the call stack:
+		CallStack.CALL, CallStack.RETURN or CallStack.NONE."""
+		return CallStack.NONE
+
+	def is_store(self, word):
+		"""Test if the instruction word may write the memory. Return None if
+		the architecture cannot decode the stores: the watched memory is
+		then compared after each instruction."""
+		return None
+
+	def get_store(self, word, pc, sim):
+		"""Get the memory written by the instruction word at pc if it is
+		executed in the current state of sim, as a pair (address, size),
+		or None if it writes nothing."""
+		return None
+
 
 class Simulator:
 	"""Interface to the simulator."""
@@ -153,6 +417,29 @@ class Simulator:
 	def __init__(self, template):
 		"""Build a simulator."""
 		self.template = template
+		self.image_pages = []
+		self.stack_top = None
+		self.initial = None
+		self.batch_result = None
+		self.batch_time = 0
+		self.code_range = None
+		self.profiling = False
+		self.profile = None
+		self.sent_profile = None	# counters given by get_profile_delta()
+		self.tracked = {}			# (address, size) -> last content
+		self.track_counts = Counter()
+		self.tracked_pages = set()	# pages containing tracked blocks
+		self.last_regs = None
+		self.last_pc = None
+		self.conds = {}				# breakpoint address -> BreakCondition
+		self.watches = {}			# (address, size) -> last content
+		self.watch_hit = None
+		self.trace = None
+		self.calls = None
+		self.branches = {}			# instruction address -> branch kind
+		self.stores = {}			# instruction address -> may write memory
+		self.watch_pages = set()	# addresses of the pages of the watches
+		self.saved_counters = None
 
 	def get_template(self):
 		"""Get the template that supports the simulator."""
@@ -171,6 +458,30 @@ class Simulator:
 		"""Release the simulator."""
 		pass
 
+	def recycle(self):
+		"""Prepare the simulator to be reused for another program: the
+		executable, the breakpoints and the state are forgotten."""
+		self.image_pages = []
+		self.stack_top = None
+		self.initial = None
+		self.code_range = None
+		self.profiling = False
+		self.profile = None
+		self.sent_profile = None
+		self.tracked = {}
+		self.track_counts.clear()
+		self.tracked_pages = set()
+		self.last_regs = None
+		self.last_pc = None
+		self.conds = {}
+		self.watches = {}
+		self.watch_hit = None
+		self.trace = None
+		self.calls = None
+		self.branches = {}
+		self.stores = {}
+		self.watch_pages = set()
+
 	def set_breakpoint(self, addr):
 		"""Set a breakpoint to the given address."""
 		pass
@@ -179,6 +490,210 @@ class Simulator:
 		"""Clear a breakpoint."""
 		pass
 
+	def set_condition(self, addr, cond, hits=1):
+		"""Set the condition of the breakpoint at addr: cond is a tree built
+		by breaks.parse_condition() or None and the execution only stops
+		at the breakpoint from the hits-th time the condition holds on."""
+		if cond is None and hits <= 1:
+			self.conds.pop(addr, None)
+		else:
+			self.conds[addr] = breaks.BreakCondition(
+				None if cond is None else breaks.compile_condition(cond, self),
+				hits)
+
+	def check_break(self, pc):
+		"""Called when the execution reaches the breakpoint at pc: return
+		True if the execution has to stop according to its condition."""
+		cond = self.conds.get(pc)
+		return cond is None or cond.check()
+
+	def reset_hits(self):
+		"""Reset the hit counters of the breakpoints."""
+		for cond in self.conds.values():
+			cond.reset()
+
+	def save_counters(self):
+		"""Save the hit counters of the breakpoints, the profile and the
+		trace so that they can be put back by restore_counters() after the
+		replay of an execution."""
+		self.saved_counters = (
+			{addr: cond.count for (addr, cond) in self.conds.items()},
+			copy.deepcopy(self.profile),
+			copy.deepcopy(self.trace)
+		)
+
+	def restore_counters(self):
+		"""Put back the counters saved by save_counters()."""
+		if self.saved_counters is None:
+			return
+		(hits, self.profile, self.trace) = self.saved_counters
+		self.saved_counters = None
+		for (addr, cond) in self.conds.items():
+			cond.count = hits.get(addr, 0)
+
+	def add_watch(self, addr, size):
+		"""Add a watchpoint: the execution stops (with Run.WATCH) after an
+		instruction writing in the size bytes at addr (if the architecture
+		cannot decode the stores, after an instruction changing them)."""
+		self.watches[(addr, size)] = None
+		self.update_watch_pages()
+
+	def remove_watch(self, addr, size):
+		"""Remove a watchpoint."""
+		self.watches.pop((addr, size), None)
+		self.update_watch_pages()
+
+	def update_watch_pages(self):
+		"""Compute the set of the pages containing watched memory."""
+		self.watch_pages = {page
+			for (addr, size) in self.watches
+			for page in range(addr & ~(PAGE_SIZE - 1), addr + size, PAGE_SIZE)}
+
+	def get_watches(self):
+		"""Get the watchpoints as a list of pairs (address, size)."""
+		return list(self.watches)
+
+	def get_watch_hit(self):
+		"""Get the watchpoint, as a pair (address, size), that stopped the
+		last execution or None."""
+		return self.watch_hit
+
+	def update_watches(self):
+		"""Record the current content of the watched memory."""
+		self.watch_hit = None
+		for key in self.watches:
+			self.watches[key] = self.read_block(*key)
+
+	def check_watches(self):
+		"""Called after an instruction that may write the memory when the
+		stores cannot be decoded: return True if a watched memory has changed
+		and record it as hit."""
+		for (key, old) in self.watches.items():
+			data = self.read_block(*key)
+			if data != old:
+				self.watches[key] = data
+				self.watch_hit = key
+				return True
+		return False
+
+	def is_store(self, pc):
+		"""Test if the instruction at pc may write the memory (None if the
+		stores cannot be decoded, see Arch.is_store())."""
+		try:
+			return self.stores[pc]
+		except KeyError:
+			store = self.get_arch().is_store(self.get_word(pc))
+			self.stores[pc] = store
+			return store
+
+	def check_store(self, addr, size):
+		"""Called after a store of size bytes at addr: return True if it
+		writes a watched memory and record it as hit."""
+		if addr & ~(PAGE_SIZE - 1) not in self.watch_pages \
+		and (addr + size - 1) & ~(PAGE_SIZE - 1) not in self.watch_pages:
+			return False
+		for (waddr, wsize) in self.watches:
+			if addr < waddr + wsize and waddr < addr + size:
+				self.watch_hit = (waddr, wsize)
+				return True
+		return False
+
+	def is_instrumented(self):
+		"""Test if run_instrumented() has to be used to run the program."""
+		return bool(self.watches) or self.trace is not None \
+			or self.calls is not None
+
+	def run_instrumented(self, time, breaks, until=None):
+		"""Implementation of run_batch() when there are watchpoints or the
+		trace or the call stack are enabled: the instructions are executed
+		one by one by step() (that maintains the call stack), recorded in the
+		trace and the stores are checked against the watchpoints."""
+		self.update_watches()
+		watching = bool(self.watches)
+		trace = self.trace
+		regs = self.get_registers() if trace is not None and trace.regs else None
+		start = self.get_date()
+		date = start
+		res = Run.OK
+		while date - start < time:
+			pc = self.get_pc()
+			if watching:
+				store = self.is_store(pc)
+				access = None
+				if store:
+					access = self.get_arch().get_store(self.get_word(pc), pc, self)
+			self.step()
+			if self.get_date() == date:
+				break
+			date = self.get_date()
+			if trace is not None:
+				trace.record(pc)
+				if regs is not None:
+					regs = trace.record_regs(regs, self.get_registers())
+			if watching and (access is not None and self.check_store(*access)
+			or store is None and self.check_watches()):
+				res = Run.WATCH
+				break
+			pc = self.get_pc()
+			if pc in breaks and (pc == until or self.check_break(pc)):
+				res = Run.BP
+				break
+		return (res, date - start)
+
+	def enable_trace(self, size, regs=False):
+		"""Enable the trace of the executed instructions in a ring buffer of
+		size entries, recording also the changed registers if regs is True.
+		A size of 0 disables the trace."""
+		self.trace = Trace(size, regs) if size > 0 else None
+
+	def clear_trace(self):
+		"""Empty the trace, if any."""
+		if self.trace is not None:
+			self.trace = Trace(self.trace.size, self.trace.regs)
+
+	def get_trace_length(self):
+		"""Get the number of instructions in the trace."""
+		return 0 if self.trace is None else self.trace.get_length()
+
+	def get_trace(self, first, count):
+		"""Get the entries of the trace from first (0 being the oldest
+		recorded) as in Trace.get_entries()."""
+		return [] if self.trace is None else self.trace.get_entries(first, count)
+
+	def read_trace(self, first, count):
+		"""Get the entries of the trace from first encoded as bytes (see
+		Trace.encode())."""
+		return b"" if self.trace is None else self.trace.encode(first, count)
+
+	def enable_calls(self, enable=True):
+		"""Enable or disable the tracking of the call stack. When enabled,
+		the stack starts empty."""
+		self.calls = CallStack() if enable else None
+
+	def clear_calls(self):
+		"""Empty the call stack, if tracked."""
+		if self.calls is not None:
+			self.calls = CallStack()
+
+	def restore_calls(self, cp):
+		"""Restore the call stack from the checkpoint cp."""
+		if self.calls is not None:
+			self.calls = CallStack(cp.calls or ())
+
+	def get_calls(self):
+		"""Get the frames of the call stack (see CallStack), an empty list
+		if the calls are not tracked."""
+		return [] if self.calls is None else self.calls.get_frames()
+
+	def get_branch_kind(self, pc):
+		"""Get the kind of the instruction at pc for the call stack (see
+		Arch.get_branch_kind())."""
+		kind = self.branches.get(pc)
+		if kind is None:
+			kind = self.get_arch().get_branch_kind(self.get_word(pc))
+			self.branches[pc] = kind
+		return kind
+
 	def get_pc(self):
 		"""Get the address of the PC."""
 		return None
@@ -188,18 +703,125 @@ class Simulator:
 		return None
 
 	def step(self):
-		"""Execute the current instruction and stop."""
+		"""Execute the current instruction and stop. The call stack, if
+		tracked, is updated."""
 		pass
 
-	def run(self, time):
-		"""Run the simulator the time in cycle.
+	def run(self, time, until=None):
+		"""Run the simulator the time in cycle. If until is not None, the
+		execution also stops before the instruction at this address as for
+		a breakpoint, without changing the breakpoints.
 		Returns a result of type Run."""
-		return Run.OK
+		return self.run_batch(time, until)[0]
+
+	def run_batch(self, time, until=None):
+		"""Run the simulator for at most time instructions in one call.
+		until is an optional one-shot stop address as for run().
+		Returns a pair (result of type Run, number of executed instructions)."""
+		return (Run.OK, 0)
+
+	def run_profiled(self, time, breaks, until=None):
+		"""Implementation of run_batch() when the profile is enabled:
+		the instructions are executed one by one to update the profile.
+		breaks is the set of breakpoint addresses (including until)."""
+		profile = self.profile
+		start = self.get_date()
+		date = start
+		pc = self.get_pc()
+		res = Run.OK
+		while date - start < time:
+			i = profile.index(pc)
+			self.step()
+			if self.get_date() == date:
+				break
+			date = self.get_date()
+			npc = self.get_pc()
+			if i is not None:
+				profile.counts[i] += 1
+				if npc != pc + profile.INST_SIZE:
+					profile.taken[i] += 1
+			pc = npc
+			if pc in breaks and (pc == until or self.check_break(pc)):
+				res = Run.BP
+				break
+		return (res, date - start)
+
+	def enable_profile(self, enable=True):
+		"""Enable or disable the execution profile. Enabling the profile
+		resets its counters."""
+		self.profiling = enable
+		if enable and self.code_range is not None:
+			self.profile = Profile(*self.code_range)
+		else:
+			self.profile = None
+
+	def clear_profile(self):
+		"""Reset the counters of the profile, if any."""
+		if self.profile is not None:
+			self.profile.clear()
+
+	def get_profile(self):
+		"""Get the execution profile (as a Profile object) or None if it is
+		not enabled."""
+		return self.profile
+
+	def get_profile_delta(self, full=False):
+		"""Get the changes of the profile since the previous call as a
+		triple (base, size, changes) where changes is a list of triples
+		(index, count, taken). If full is True, all non-zero counters are
+		given. Return None if the profile is not enabled. Used to maintain
+		a copy of the profile without transferring all its counters."""
+		profile = self.profile
+		if profile is None:
+			self.sent_profile = None
+			return None
+		sent = self.sent_profile
+		if full or sent is None or len(sent[0]) != profile.size:
+			zeros = array.array('Q', bytes(8 * profile.size))
+			sent = (zeros, zeros)
+		if profile.counts == sent[0] and profile.taken == sent[1]:
+			changes = []
+		else:
+			changes = [(i, count, taken)
+				for (i, (count, taken, old_count, old_taken))
+				in enumerate(zip(profile.counts, profile.taken, *sent))
+				if count != old_count or taken != old_taken]
+		self.sent_profile = (array.array('Q', profile.counts), array.array('Q', profile.taken))
+		return (profile.base, profile.size, changes)
+
+	def start_batch(self, time, until=None):
+		"""Start the execution of run_batch(time, until) whose result is
+		obtained by finish_batch(). Simulators not running in the server
+		process may execute the batch in parallel in between."""
+		start = perf_counter()
+		self.batch_result = self.run_batch(time, until)
+		self.batch_time = perf_counter() - start
+
+	def finish_batch(self):
+		"""Wait for the end of the execution started by start_batch() and
+		return its result."""
+		return self.batch_result
+
+	def get_batch_time(self):
+		"""Get the time (in seconds) taken to execute the last batch, not
+		including the waiting time before finish_batch()."""
+		return self.batch_time
+
+	def skip(self, time):
+		"""Run the simulator for time cycles ignoring the breakpoints."""
+		stop_date = self.get_date() + time
+		while self.get_date() < stop_date:
+			self.step()
 
 	def get_register(self, reg):
 		"""Get the value of a register."""
 		return None
 
+	def get_registers(self):
+		"""Get the values of all registers as a list in the order of
+		Arch.get_registers()."""
+		return [self.get_register(reg) for reg in self.get_arch().get_registers()]
+
 	def set_register(self, reg, value):
 		"""Set the value of a register."""
 		pass
@@ -233,4 +855,128 @@ class Simulator:
 		If there is no board, return None."""
 		return None
 
+	def setup_image(self, path):
+		"""Called just after the executable at path has been loaded to record
+		the memory pages it uses and to build the initial checkpoint used by
+		reset(). If the executable cannot be read, the initial checkpoint is
+		not built."""
+		self.initial = None
+		self.branches = {}
+		self.stores = {}
+		self.clear_calls()
+		try:
+			file = elf.File(path)
+			self.image_pages = file.get_pages(PAGE_SIZE)
+			self.code_range = file.get_code_range()
+		except elf.ELFException:
+			self.image_pages = []
+			self.code_range = None
+			self.enable_profile(self.profiling)
+			return
+		self.enable_profile(self.profiling)
+		sp = self.get_register(self.get_arch().find_register("SP"))
+		self.stack_top = (sp & ~(PAGE_SIZE - 1)) + PAGE_SIZE
+		self.initial = self.checkpoint()
+
+	def get_pages(self):
+		"""Get the addresses of the memory pages saved by a checkpoint:
+		pages of the executable and pages of the stack."""
+		pages = list(self.image_pages)
+		if self.stack_top is not None:
+			sp = self.get_register(self.get_arch().find_register("SP"))
+			addr = max(sp & ~(PAGE_SIZE - 1),
+				self.stack_top - MAX_STACK_PAGES * PAGE_SIZE)
+			while addr < self.stack_top:
+				if addr not in pages:
+					pages.append(addr)
+				addr += PAGE_SIZE
+		return pages
+
+	def read_block(self, addr, size):
+		"""Read size bytes of memory at addr and return them as bytes."""
+		return read_words(self.get_word, addr, size)
+
+	def read_page(self, addr):
+		"""Read the memory page at the given address as bytes."""
+		return self.read_block(addr, PAGE_SIZE)
+
+	def write_page(self, addr, page):
+		"""Write the memory page at the given address."""
+		pass
+
+	def checkpoint(self):
+		"""Take a checkpoint of the current state of the simulator and return
+		it as a Checkpoint object."""
+		return Checkpoint(
+			self.get_date(),
+			self.get_pc(),
+			self.get_registers(),
+			{addr: self.read_page(addr) for addr in self.get_pages()},
+			None if self.calls is None else self.calls.get_frames()
+		)
+
+	def restore(self, cp):
+		"""Restore the simulator in the state recorded by the passed
+		checkpoint."""
+		pass
+
+	def track_block(self, addr, size):
+		"""Ask for the change tracking of the size bytes at addr. Each call
+		must be matched by a call to untrack_block()."""
+		key = (addr, size)
+		self.track_counts[key] += 1
+		if key not in self.tracked:
+			self.tracked[key] = None
+			self.update_tracked_pages()
+
+	def untrack_block(self, addr, size):
+		"""Stop the change tracking of the size bytes at addr."""
+		key = (addr, size)
+		self.track_counts[key] -= 1
+		if self.track_counts[key] <= 0:
+			del self.track_counts[key]
+			self.tracked.pop(key, None)
+			self.update_tracked_pages()
+
+	def update_tracked_pages(self):
+		"""Compute the set of the pages containing tracked blocks."""
+		self.tracked_pages = {page
+			for (addr, size) in self.tracked
+			for page in get_page_range(addr, size)}
+
+	def has_io(self):
+		"""Test if the board may have produced I/O events since the previous
+		call to get_changes()."""
+		return False
+
+	def get_changes(self):
+		"""Get the changes since the previous call as a ChangeSet. As the
+		simulators do not signal their writes, the registers and the tracked
+		blocks are compared with their content at the previous call: only
+		the displayed memory is read."""
+		regs = self.get_registers()
+		last = self.last_regs
+		if last is None or len(last) != len(regs):
+			changed = set(range(len(regs)))
+		elif regs == last:
+			changed = set()
+		else:
+			changed = {i for (i, (x, y)) in enumerate(zip(regs, last)) if x != y}
+		self.last_regs = regs
+		blocks = {}
+		for (key, old) in self.tracked.items():
+			data = self.read_block(*key)
+			if data != old:
+				blocks[key] = data
+				self.tracked[key] = data
+		pc = self.get_pc()
+		pc_moved = pc != self.last_pc
+		self.last_pc = pc
+		return ChangeSet(changed, regs, blocks, pc_moved, self.has_io())
+
+	def get_initial(self):
+		"""Get the checkpoint taken just after the load of the executable.
+		Return None if there is no such checkpoint."""
+		return self.initial
+
 
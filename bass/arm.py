@@ -18,8 +18,11 @@
 
 """ARM configuration for bass."""
 
+import functools
+import struct
+
 import arm_gliss as arm
-from bass import arch
+from bass import arch, armdis
 
 class Arch(arch.Arch):
 	"""Architecture representation for ARM."""
@@ -33,6 +36,7 @@ class Arch(arch.Arch):
 	def __init__(self):
 		self.regs = None
 		self.map = None
+		self.store_regs = None
 
 	def get_name(self):
 		return "ARM"
@@ -78,6 +82,18 @@ class Arch(arch.Arch):
 		except KeyError:
 			return None
 
+	def get_branch_kind(self, word):
+		return armdis.branch_kind(word)
+
+	def is_store(self, word):
+		return armdis.is_store(word)
+
+	def get_store(self, word, pc, sim):
+		if self.store_regs is None:
+			self.store_regs = [self.find_register(name) for name in armdis.STORE_REGS]
+		regs = self.store_regs
+		return armdis.store_access(word, pc, lambda n: sim.get_register(regs[n]))
+
 
 class Simulator(arch.Simulator):
 
@@ -99,6 +115,7 @@ class Simulator(arch.Simulator):
 		self.date = 0
 		self.path = None
 		self.start = None
+		self.reg_keys = None
 
 		# build the simulator
 		self.pf = arm.new_platform()
@@ -108,18 +125,65 @@ class Simulator(arch.Simulator):
 
 	def load(self, path):
 		self.path = path
+		arm.reset_platform(self.pf)
+		arm.reset_state(self.state)
+		if self.loader is not None:
+			arm.loader_close(self.loader)
 		self.loader = arm.loader_open(self.path)
 		if self.loader is None:
 			raise arch.SimException(f"cannot load {self.path}")
 		arm.loader_load(self.loader, self.pf)
 		self.start = arm.loader_start(self.loader)
 		arm.set_next_address(self.sim, self.start)
+		self.date = 0
+		self.setup_image(path)
 
 	def reset(self):
+		self.clear_profile()
+		self.reset_hits()
+		self.clear_trace()
+		self.clear_calls()
+		if self.initial is not None:
+			self.restore(self.initial)
+		elif self.path is not None:
+			self.load(self.path)
+		else:
+			arm.reset_platform(self.pf)
+			arm.reset_state(self.state)
+			self.date = 0
+
+	def read_block(self, addr, size):
+		return arch.read_words(functools.partial(arm.mem_read32, self.mem),
+			addr, size)
+
+	def write_page(self, addr, page):
+		write = arm.mem_write32
+		mem = self.mem
+		for (i, word) in enumerate(struct.unpack(f"<{arch.PAGE_SIZE//4}I", page)):
+			write(mem, addr + i*4, word)
+
+	def restore(self, cp):
+		arm.reset_platform(self.pf)
+		arm.reset_state(self.state)
+		for (addr, page) in cp.pages.items():
+			self.write_page(addr, page)
+		for (reg, value) in zip(self.get_arch().get_registers(), cp.regs):
+			self.set_register(reg, value)
+		arm.set_next_address(self.sim, cp.pc)
+		self.date = cp.date
+		self.restore_calls(cp)
+
+	def recycle(self):
+		arch.Simulator.recycle(self)
+		self.breaks.clear()
+		self.path = None
+		self.start = None
+		self.date = 0
+		if self.loader is not None:
+			arm.loader_close(self.loader)
+			self.loader = None
 		arm.reset_platform(self.pf)
 		arm.reset_state(self.state)
-		if self.path is not None:
-			self.load(self.path)
 
 	def release(self):
 		self.pf = None
@@ -136,21 +200,158 @@ class Simulator(arch.Simulator):
 
 	def clear_breakpoint(self, addr):
 		self.breaks.discard(addr)
+		self.conds.pop(addr, None)
 		print(f"DEBUG: remove BP @ {hex(addr)}")
 
 	def step(self):
 		assert self.sim is not None
-		arm.step(self.sim)
+		if self.calls is None:
+			arm.step(self.sim)
+		else:
+			pc = arm.next_addr(self.sim)
+			kind = self.get_branch_kind(pc)
+			arm.step(self.sim)
+			self.calls.update(kind, pc, arm.next_addr(self.sim))
 		self.date += 1
 
-	def run(self, time):
+	def run_batch(self, time, until=None):
+		assert self.sim is not None
+
+		# bind everything locally to keep the loop as short as possible
+		sim = self.sim
+		step = arm.step
+		breaks = self.breaks
+		if until is not None and until not in breaks:
+			breaks = breaks | {until}
+
+		# watchpoints, trace or call stack: slowest loop
+		if self.is_instrumented():
+			return self.run_instrumented(time, breaks, until)
+
+		# profile enabled: slower loop
+		if self.profile is not None:
+			return self.run_profiled(time, breaks, until)
+
+		# no breakpoint: just execute the instructions
+		if not breaks:
+			for _ in range(time):
+				step(sim)
+			self.date += time
+			return (arch.Run.OK, time)
+
+		# look for breakpoints after each instruction
+		next_addr = arm.next_addr
+		check = self.check_break
+		count = 0
+		while count < time:
+			step(sim)
+			count += 1
+			pc = next_addr(sim)
+			if pc in breaks and (pc == until or check(pc)):
+				self.date += count
+				return (arch.Run.BP, count)
+		self.date += count
+		return (arch.Run.OK, count)
+
+	def run_profiled(self, time, breaks, until=None):
+		sim = self.sim
+		step = arm.step
+		next_addr = arm.next_addr
+		profile = self.profile
+		counts = profile.counts
+		taken = profile.taken
+		base = profile.base
+		size = profile.size
+		res = arch.Run.OK
+		count = 0
+		pc = next_addr(sim)
+		while count < time:
+			i = (pc - base) >> 2
+			step(sim)
+			count += 1
+			npc = next_addr(sim)
+			if 0 <= i < size:
+				counts[i] += 1
+				if npc != pc + 4:
+					taken[i] += 1
+			pc = npc
+			if pc in breaks and (pc == until or self.check_break(pc)):
+				res = arch.Run.BP
+				break
+		self.date += count
+		return (res, count)
+
+	def run_instrumented(self, time, breaks, until=None):
+		"""Only the instructions that may store in memory are decoded to check
+		the watchpoints and the kinds of branch are cached by address for
+		the call stack."""
+		self.watch_hit = None
+		sim = self.sim
+		step = arm.step
+		next_addr = arm.next_addr
+		read = arm.mem_read32
+		mem = self.mem
+		stores = self.stores
+		get_store = self.get_arch().get_store
+		check = self.check_store
+		watching = bool(self.watches)
+		profile = self.profile
+		trace = self.trace
+		calls = self.calls
+		branches = self.branches
+		get_kind = self.get_branch_kind
+		get_registers = self.get_registers
+		regs = get_registers() if trace is not None and trace.regs else None
+		res = arch.Run.OK
+		count = 0
+		pc = next_addr(sim)
+		while count < time:
+			if watching:
+				store = stores.get(pc)
+				if store is None:
+					store = armdis.is_store(read(mem, pc))
+					stores[pc] = store
+				access = get_store(read(mem, pc), pc, self) if store else None
+			if calls is not None:
+				kind = branches.get(pc)
+				if kind is None:
+					kind = get_kind(pc)
+			step(sim)
+			count += 1
+			npc = next_addr(sim)
+			if calls is not None and kind:
+				calls.update(kind, pc, npc)
+			if trace is not None:
+				trace.record(pc)
+				if regs is not None:
+					regs = trace.record_regs(regs, get_registers())
+			if profile is not None:
+				i = profile.index(pc)
+				if i is not None:
+					profile.counts[i] += 1
+					if npc != pc + 4:
+						profile.taken[i] += 1
+			pc = npc
+			if watching and access is not None and check(*access):
+				res = arch.Run.WATCH
+				break
+			if pc in breaks and (pc == until or self.check_break(pc)):
+				res = arch.Run.BP
+				break
+		self.date += count
+		return (res, count)
+
+	def skip(self, time):
 		assert self.sim is not None
-		stop_date = self.date + time
-		while self.date < stop_date:
-			self.step()
-			if self.breaks and self.get_pc() in self.breaks:
-				return arch.Run.BP
-		return arch.Run.OK
+		if self.calls is not None:
+			for _ in range(time):
+				self.step()
+			return
+		sim = self.sim
+		step = arm.step
+		for _ in range(time):
+			step(sim)
+		self.date += time
 
 	def get_pc(self):
 		return arm.next_addr(self.sim)
@@ -167,6 +368,15 @@ class Simulator(arch.Simulator):
 		assert self.state is not None
 		return arm.get_register(self.state, reg.handle, reg.index)
 
+	def get_registers(self):
+		assert self.state is not None
+		if self.reg_keys is None:
+			self.reg_keys = [(reg.handle, reg.index)
+				for reg in self.get_arch().get_registers()]
+		get = arm.get_register
+		state = self.state
+		return [get(state, handle, index) for (handle, index) in self.reg_keys]
+
 	def set_register(self, reg, value):
 		assert self.state is not None
 		arm.set_register(self.state, reg.handle, reg.index, value)
@@ -0,0 +1,386 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Disassembler of ARMv5T instructions (ARM mode) producing text close to
+the output of objdump."""
+
+CONDS = [
+	"eq", "ne", "cs", "cc", "mi", "pl", "vs", "vc",
+	"hi", "ls", "ge", "lt", "gt", "le", "", ""
+]
+
+REGS = [
+	"r0", "r1", "r2", "r3", "r4", "r5", "r6", "r7",
+	"r8", "r9", "sl", "fp", "ip", "sp", "lr", "pc"
+]
+
+# names of the registers passed to store_access() in the simulators
+STORE_REGS = [f"R{i}" for i in range(13)] + ["SP", "LR", "PC", "CPSR"]
+
+DP_OPS = [
+	"and", "eor", "sub", "rsb", "add", "adc", "sbc", "rsc",
+	"tst", "teq", "cmp", "cmn", "orr", "mov", "bic", "mvn"
+]
+
+SHIFTS = ["lsl", "lsr", "asr", "ror"]
+
+LDM_MODES = ["da", "", "db", "ib"]
+
+
+def word(w):
+	"""Format a data word."""
+	return f".word\t0x{w:08x}"
+
+def reg_list(w):
+	"""Format the register list of LDM/STM."""
+	return "{" + ", ".join(REGS[i] for i in range(16) if w & (1 << i)) + "}"
+
+def shifted_reg(w):
+	"""Format a register operand with its shift."""
+	rm = REGS[w & 0xf]
+	type = (w >> 5) & 0x3
+	if w & 0x10:
+		return f"{rm}, {SHIFTS[type]} {REGS[(w >> 8) & 0xf]}"
+	amount = (w >> 7) & 0x1f
+	if amount == 0:
+		if type == 0:
+			return rm
+		elif type == 3:
+			return f"{rm}, rrx"
+		else:
+			amount = 32
+	return f"{rm}, {SHIFTS[type]} #{amount}"
+
+def rotated_imm(w):
+	"""Get the value of a rotated immediate operand."""
+	rot = ((w >> 8) & 0xf) * 2
+	imm = w & 0xff
+	return ((imm >> rot) | (imm << (32 - rot))) & 0xffffffff
+
+def comment(value):
+	"""Build the comment objdump appends to an instruction for the value
+	of an immediate (only outside [-16, 32])."""
+	if value > 32 or value < -16:
+		return f"\t@ 0x{value & 0xffffffff:x}"
+	else:
+		return ""
+
+def imm_text(w):
+	"""Format the rotated immediate operand of w as objdump does: the
+	rotation is given explicitly if it is not the smallest one."""
+	value = rotated_imm(w)
+	rot = ((w >> 8) & 0xf) * 2
+	smallest = next(i for i in range(0, 32, 2)
+		if ((value << i) | (value >> ((32 - i) & 31))) & 0xffffffff <= 0xff)
+	if smallest != rot:
+		text = f"#{w & 0xff}, {rot}"
+	elif value >= 0x80000000:
+		text = f"#{value - 0x100000000}"
+	else:
+		text = f"#{value}"
+	return text + comment(value)
+
+
+def disassemble(w, addr, name=lambda addr: ""):
+	"""Disassemble the instruction word w at address addr. name is a function
+	giving the symbolic name (as " <label+offset>") of an address."""
+	cond = w >> 28
+	cs = CONDS[cond]
+	kind = (w >> 25) & 0x7
+
+	# unconditional instructions
+	if cond == 0xf:
+		if kind == 0b101:
+			target = (addr + 8 + (((w & 0xffffff) ^ 0x800000) - 0x800000) * 4
+				+ ((w >> 23) & 0x2)) & 0xffffffff
+			return f"blx\t{target:x}{name(target)}"
+		return word(w)
+
+	# data processing and miscellaneous
+	if kind <= 0b001:
+		if (w & 0x0ffffff0) == 0x012fff10:
+			return f"bx{cs}\t{REGS[w & 0xf]}"
+		if (w & 0x0ffffff0) == 0x012fff30:
+			return f"blx{cs}\t{REGS[w & 0xf]}"
+		if (w & 0x0fff0ff0) == 0x016f0f10:
+			return f"clz{cs}\t{REGS[(w >> 12) & 0xf]}, {REGS[w & 0xf]}"
+		if (w & 0x0ff000f0) == 0x01200070:
+			return f"bkpt\t0x{((w >> 4) & 0xfff0) | (w & 0xf):04x}"
+		if (w & 0x0fbf0fff) == 0x010f0000:
+			psr = "SPSR" if w & (1 << 22) else "CPSR"
+			return f"mrs{cs}\t{REGS[(w >> 12) & 0xf]}, {psr}"
+		if (w & 0x0fb0fff0) == 0x0120f000 or (w & 0x0fb0f000) == 0x0320f000:
+			psr = "SPSR" if w & (1 << 22) else "CPSR"
+			fields = "".join(c for (i, c) in zip((19, 18, 17, 16), "fsxc")
+				if w & (1 << i))
+			if kind == 0b001:
+				src = imm_text(w)
+			else:
+				src = REGS[w & 0xf]
+			return f"msr{cs}\t{psr}_{fields}, {src}"
+		if kind == 0b000 and (w & 0x90) == 0x90:
+			return disassemble_extra(w, addr, cs, name)
+		return disassemble_dp(w, cs)
+
+	# single load/store
+	if kind <= 0b011:
+		if kind == 0b011 and w & 0x10:
+			return word(w)
+		return disassemble_ls(w, addr, cs, name)
+
+	# multiple load/store
+	if kind == 0b100:
+		rn = (w >> 16) & 0xf
+		load = w & (1 << 20)
+		wb = w & (1 << 21)
+		mode = (w >> 23) & 0x3
+		regs = reg_list(w)
+		if w & (1 << 22):
+			regs += "^"
+		if rn == 13 and wb and ((load and mode == 1) or (not load and mode == 2)):
+			return f"{'pop' if load else 'push'}{cs}\t{regs}"
+		op = "ldm" if load else "stm"
+		return f"{op}{LDM_MODES[mode]}{cs}\t{REGS[rn]}{'!' if wb else ''}, {regs}"
+
+	# branches
+	if kind == 0b101:
+		target = (addr + 8 + (((w & 0xffffff) ^ 0x800000) - 0x800000) * 4) \
+			& 0xffffffff
+		op = "bl" if w & (1 << 24) else "b"
+		return f"{op}{cs}\t{target:x}{name(target)}"
+
+	# software interrupt
+	if kind == 0b111 and w & (1 << 24):
+		return f"svc{cs}\t0x{w & 0xffffff:08x}"
+
+	# coprocessor register transfers
+	if kind == 0b111 and w & 0x10:
+		op = "mrc" if w & (1 << 20) else "mcr"
+		return f"{op}{cs}\t{(w >> 8) & 0xf}, {(w >> 21) & 0x7}, " \
+			f"{REGS[(w >> 12) & 0xf]}, cr{(w >> 16) & 0xf}, cr{w & 0xf}, " \
+			f"{{{(w >> 5) & 0x7}}}"
+
+	return word(w)
+
+
+def disassemble_dp(w, cs):
+	"""Disassemble a data processing instruction."""
+	opcode = (w >> 21) & 0xf
+	op = DP_OPS[opcode]
+	rd = REGS[(w >> 12) & 0xf]
+	rn = REGS[(w >> 16) & 0xf]
+	if w & (1 << 25):
+		op2 = imm_text(w)
+	else:
+		op2 = shifted_reg(w)
+	if 8 <= opcode <= 11:
+		return f"{op}{cs}\t{rn}, {op2}"
+	s = "s" if w & (1 << 20) else ""
+	if opcode in (13, 15):
+		return f"{op}{s}{cs}\t{rd}, {op2}"
+	return f"{op}{s}{cs}\t{rd}, {rn}, {op2}"
+
+
+def disassemble_extra(w, addr, cs, name):
+	"""Disassemble multiplications, swaps and halfword transfers."""
+	rd = REGS[(w >> 12) & 0xf]
+	rn = REGS[(w >> 16) & 0xf]
+	rs = REGS[(w >> 8) & 0xf]
+	rm = REGS[w & 0xf]
+	s = "s" if w & (1 << 20) else ""
+	if (w & 0x0fc000f0) == 0x00000090:
+		if w & (1 << 21):
+			return f"mla{s}{cs}\t{rn}, {rm}, {rs}, {rd}"
+		else:
+			return f"mul{s}{cs}\t{rn}, {rm}, {rs}"
+	if (w & 0x0f8000f0) == 0x00800090:
+		op = ("s" if w & (1 << 22) else "u") + ("mlal" if w & (1 << 21) else "mull")
+		return f"{op}{s}{cs}\t{rd}, {rn}, {rm}, {rs}"
+	if (w & 0x0fb00ff0) == 0x01000090:
+		b = "b" if w & (1 << 22) else ""
+		return f"swp{b}{cs}\t{rd}, {rm}, [{rn}]"
+	sh = (w >> 5) & 0x3
+	load = w & (1 << 20)
+	if sh == 0 or (not load and sh != 1):
+		return word(w)
+	op = ("ldr" if load else "str") + ["", "h", "sb", "sh"][sh]
+	if w & (1 << 22):
+		offset = ((w >> 4) & 0xf0) | (w & 0xf)
+		return f"{op}{cs}\t{rd}, " + address_imm(w, addr, offset, name)
+	else:
+		return f"{op}{cs}\t{rd}, " + address_reg(w, rm)
+
+
+def disassemble_ls(w, addr, cs, name):
+	"""Disassemble a single word or byte load/store."""
+	if (w & 0x0fff0fff) == 0x052d0004:
+		return f"push{cs}\t{{{REGS[(w >> 12) & 0xf]}}}"
+	if (w & 0x0fff0fff) == 0x049d0004:
+		return f"pop{cs}\t{{{REGS[(w >> 12) & 0xf]}}}"
+	op = "ldr" if w & (1 << 20) else "str"
+	if w & (1 << 22):
+		op += "b"
+	if not w & (1 << 24) and w & (1 << 21):
+		op += "t"
+	rd = REGS[(w >> 12) & 0xf]
+	if w & (1 << 25):
+		return f"{op}{cs}\t{rd}, " + address_reg(w, shifted_reg(w))
+	else:
+		return f"{op}{cs}\t{rd}, " + address_imm(w, addr, w & 0xfff, name)
+
+
+def address_imm(w, addr, offset, name):
+	"""Format an addressing mode with an immediate offset."""
+	rn = (w >> 16) & 0xf
+	sign = "" if w & (1 << 23) else "-"
+	value = offset if sign == "" else -offset
+	if not w & (1 << 24):
+		return f"[{REGS[rn]}], #{sign}{offset}" + comment(value)
+	wb = "!" if w & (1 << 21) else ""
+	if rn == 15 and not wb:
+		target = (addr + 8 + value) & 0xffffffff
+		return f"[pc, #{sign}{offset}]\t@ {target:x}{name(target)}"
+	if offset == 0 and sign == "" and not wb:
+		return f"[{REGS[rn]}]"
+	return f"[{REGS[rn]}, #{sign}{offset}]{wb}" + comment(value)
+
+
+def address_reg(w, rm):
+	"""Format an addressing mode with a register offset."""
+	rn = REGS[(w >> 16) & 0xf]
+	sign = "" if w & (1 << 23) else "-"
+	if not w & (1 << 24):
+		return f"[{rn}], {sign}{rm}"
+	wb = "!" if w & (1 << 21) else ""
+	return f"[{rn}, {sign}{rm}]{wb}"
+
+
+def is_store(w):
+	"""Test if the instruction word w may write the memory (conservative:
+	coprocessor transfers and doubleword transfers are considered as
+	stores)."""
+	kind = (w >> 25) & 0x7
+	load = w & (1 << 20)
+	if kind == 0b000:
+		if (w & 0x0fb00ff0) == 0x01000090:
+			return True
+		return (w & 0x90) == 0x90 and (w & 0x60) != 0 and not load
+	if kind in (0b010, 0b011, 0b100, 0b110):
+		return not load
+	return False
+
+def cond_holds(w, cpsr):
+	"""Test if the condition of the instruction word w holds for the flags
+	of the status register cpsr."""
+	cond = w >> 28
+	if cond >= 0xe:
+		return True
+	n = (cpsr >> 31) & 1
+	z = (cpsr >> 30) & 1
+	c = (cpsr >> 29) & 1
+	v = (cpsr >> 28) & 1
+	res = [
+		z,
+		c,
+		n,
+		v,
+		c and not z,
+		n == v,
+		not z and n == v
+	][cond >> 1]
+	return bool(res) != bool(cond & 1)
+
+def shifted_value(w, value, cpsr):
+	"""Compute the register operand shifted by an immediate of the
+	instruction word w. value(n) gives the value of the register n."""
+	rm = value(w & 0xf)
+	type = (w >> 5) & 0x3
+	amount = (w >> 7) & 0x1f
+	if type == 0:
+		return (rm << amount) & 0xffffffff
+	elif type == 3:
+		if amount == 0:
+			return (rm >> 1) | (((cpsr >> 29) & 1) << 31)
+		return ((rm >> amount) | (rm << (32 - amount))) & 0xffffffff
+	if amount == 0:
+		amount = 32
+	if type == 2 and rm & 0x80000000:
+		rm -= 1 << 32
+	return (rm >> amount) & 0xffffffff
+
+def store_access(w, pc, reg):
+	"""Get the memory written by the instruction word w at pc as a pair
+	(address, size) or None if the instruction does not write the memory.
+	reg(n) gives the value of the register n (16 for the CPSR) before the
+	execution. Coprocessor stores are considered as writing one word."""
+	if not is_store(w):
+		return None
+	cpsr = reg(16)
+	if not cond_holds(w, cpsr):
+		return None
+	def value(n):
+		return pc + 8 if n == 15 else reg(n)
+	base = value((w >> 16) & 0xf)
+	kind = (w >> 25) & 0x7
+	up = w & (1 << 23)
+	if kind == 0b000:
+		if (w & 0x0fb00ff0) == 0x01000090:
+			return (base, 1 if w & (1 << 22) else 4)
+		sh = (w >> 5) & 0x3
+		if sh == 0b10:
+			return None
+		size = 2 if sh == 0b01 else 8
+		if w & (1 << 22):
+			offset = ((w >> 4) & 0xf0) | (w & 0xf)
+		else:
+			offset = value(w & 0xf)
+	elif kind == 0b010:
+		size = 1 if w & (1 << 22) else 4
+		offset = w & 0xfff
+	elif kind == 0b011:
+		size = 1 if w & (1 << 22) else 4
+		offset = shifted_value(w, value, cpsr)
+	elif kind == 0b100:
+		size = 4 * bin(w & 0xffff).count("1")
+		if up:
+			addr = base + 4 if w & (1 << 24) else base
+		else:
+			addr = base - size if w & (1 << 24) else base - size + 4
+		return (addr & 0xffffffff, size)
+	else:
+		size = 4
+		offset = (w & 0xff) * 4
+	if not up:
+		offset = -offset
+	addr = base + offset if w & (1 << 24) else base
+	return (addr & 0xffffffff, size)
+
+def branch_kind(w):
+	"""Get the kind of the instruction word w for a call stack: "call" for
+	BL and BLX, "return" for BX LR, MOV PC, LR, LDR PC from the stack and
+	LDM loading PC, "" else."""
+	if (w & 0xfe000000) == 0xfa000000:
+		return "call"
+	if w >> 28 == 0xf:
+		return ""
+	if (w & 0x0f000000) == 0x0b000000 or (w & 0x0ffffff0) == 0x012fff30:
+		return "call"
+	if (w & 0x0fffffff) in (0x012fff1e, 0x01a0f00e, 0x049df004) \
+	or (w & 0x0e108000) == 0x08108000:
+		return "return"
+	return ""
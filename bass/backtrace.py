@@ -0,0 +1,102 @@
+"""Pane displaying the call stack of the simulated program."""
+
+import html
+
+import orchid as orc
+from orchid.util import Buffer
+import bass
+from bass.trace import TableView
+
+
+class BacktracePane(orc.VGroup, bass.ApplicationPane):
+	"""Application pane displaying the call stack maintained by the
+	simulator. As the tracking of calls requires the slow execution loop,
+	it is disabled by default and enabled on demand: the stack then starts
+	empty (it is complete after a reset)."""
+
+	def __init__(self):
+		self.tracking = orc.Var(False)
+		track_action = orc.Action(self.toggle_tracking,
+			icon=orc.Icon("!stack"),
+			help="Start/stop the tracking of calls (it slows down the simulation).")
+		self.selector = orc.HGroup([
+			orc.Button(track_action)
+		])
+		self.selector.disable()
+		self.view = TableView("Call tracking disabled.")
+		orc.VGroup.__init__(self, [
+			self.selector,
+			self.view
+		])
+		self.session = None
+		self.sim = None
+		self.disasm = None
+
+	def expands_horizontal(self):
+		return True
+
+	def expands_vertical(self):
+		return True
+
+	def toggle_tracking(self, interface):
+		"""Start or stop the tracking of calls."""
+		self.tracking.set(not ~self.tracking)
+		if self.sim is not None:
+			with self.session.sim_lock:
+				self.sim.enable_calls(~self.tracking)
+				self.update()
+
+	def get_label(self, addr):
+		"""Get the address relative to the closest label."""
+		label = None if self.disasm is None else self.disasm.get_label(addr)
+		return "" if label is None else label
+
+	def update(self):
+		"""Display the call stack."""
+		if self.sim is None or not ~self.tracking:
+			self.view.show("Call tracking disabled.")
+			return
+		frames = self.sim.get_calls()
+		addrs = [self.sim.get_pc()] + [site for (site, _) in reversed(frames)]
+		funs = [fun for (_, fun) in reversed(frames)] + [None]
+		out = Buffer()
+		out.write("<table><tr><th></th><th>Function</th><th>Address</th>"
+			"<th>Location</th></tr>")
+		for (i, (addr, fun)) in enumerate(zip(addrs, funs)):
+			if fun is None:
+				pos = None if self.disasm is None else self.disasm.nearest_label(addr)
+				name = "" if pos is None else pos[0]
+			else:
+				name = self.get_label(fun)
+			out.write(f"<tr><td>#{i}</td><td>{html.escape(name)}</td>"
+				f"<td>{addr:08x}</td>"
+				f"<td>{html.escape(self.get_label(addr))}</td></tr>")
+		out.write("</table>")
+		self.view.show(str(out))
+
+	def on_begin(self, session):
+		self.session = session
+
+	def on_end(self, session):
+		self.session = None
+
+	def on_compiled(self, session):
+		try:
+			self.disasm = session.get_project().get_disasm()
+		except bass.DisassemblyException:
+			self.disasm = None
+
+	def on_sim_start(self, session, sim):
+		self.sim = sim
+		self.selector.enable()
+		sim.enable_calls(~self.tracking)
+		self.update()
+
+	def on_sim_stop(self, session, sim):
+		self.sim = None
+		self.selector.disable()
+		self.update()
+
+	def on_sim_update(self, session, sim, changes):
+		if changes.pc_moved and ~self.tracking and self.is_shown():
+			self.update()
@@ -0,0 +1,84 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Benchmark of the ARM simulator run loops.
+
+Usage: python3 -m bass.bench [--count N] [--quantum Q] [--bp ADDR] main.elf
+"""
+
+import argparse
+import sys
+import time
+
+from bass import arm, arch
+
+
+def legacy_run(sim, time):
+	"""Run loop as implemented before run_batch(): one step() and one
+	get_pc() per instruction."""
+	stop_date = sim.date + time
+	while sim.date < stop_date:
+		sim.step()
+		if sim.breaks and sim.get_pc() in sim.breaks:
+			return arch.Run.BP
+	return arch.Run.OK
+
+def batch_run(sim, time):
+	"""Run loop based on run_batch()."""
+	return sim.run_batch(time)[0]
+
+def measure(path, run, count, quantum, bps):
+	"""Measure the number of instructions per second of the run function.
+	The program is restarted each time it reaches the end."""
+	sim = arm.Simulator(None)
+	sim.load(path)
+	for bp in bps:
+		sim.set_breakpoint(bp)
+	done = 0
+	start = time.perf_counter()
+	while done < count:
+		date = sim.get_date()
+		res = run(sim, min(quantum, count - done))
+		done += sim.get_date() - date
+		if res == arch.Run.BP:
+			sim.reset()
+	duration = time.perf_counter() - start
+	sim.release()
+	return done / duration
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(prog="bass.bench",
+		description="Compare ARM simulator run loops.")
+	parser.add_argument('path', help="ELF executable to run.")
+	parser.add_argument('--count', type=int, default=1000000,
+		help="Number of instructions to execute.")
+	parser.add_argument('--quantum', type=int, default=1000,
+		help="Number of instructions per run call.")
+	parser.add_argument('--bp', action='append', default=[],
+		help="Breakpoint address (hexadecimal).")
+	args = parser.parse_args()
+	bps = [int(bp, 16) for bp in args.bp]
+
+	results = []
+	for (name, run) in [("legacy", legacy_run), ("batch", batch_run)]:
+		ips = measure(args.path, run, args.count, args.quantum, bps)
+		results.append(ips)
+		print(f"{name:8s} {ips:14.0f} inst/s")
+	print(f"speedup  {results[1] / results[0]:14.2f}")
+	sys.exit(0)
@@ -0,0 +1,164 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Conditions of breakpoints.
+
+A condition is a list of comparisons separated by "&&". A comparison is
+made of two values compared with ==, !=, <, <=, > or >= (unsigned) or of
+a single value meaning that it is not null. A value is written as the
+addresses of the memory pane: an hexadecimal constant, a label or a
+register, optionally followed by +OFFSET or -OFFSET (hexadecimal) or,
+between brackets, the address of the memory word to use. For example:
+
+	r0 == 0 && [counter] >= a
+
+The condition is parsed by the server as a tree of tuples (labels being
+replaced by their address) that can be sent to worker processes and then
+compiled by the simulator into Python closures."""
+
+import operator
+import re
+
+from bass import MessageException
+
+MASK = 0xffffffff
+
+COMPARISONS = {
+	"==": operator.eq,
+	"!=": operator.ne,
+	"<": operator.lt,
+	"<=": operator.le,
+	">": operator.gt,
+	">=": operator.ge
+}
+
+CMP_RE = re.compile(r"(==|!=|<=|>=|<|>)")
+
+
+class ConditionException(MessageException):
+	"""Exception raised for an invalid condition."""
+
+	def __init__(self, msg):
+		MessageException.__init__(self, msg)
+
+
+def parse_value(text, find_label, find_register):
+	"""Parse a value and return its tree."""
+	text = text.strip()
+	if text.startswith("[") and text.endswith("]"):
+		return ("mem", parse_value(text[1:-1], find_label, find_register))
+	for (op, kind) in (("+", "add"), ("-", "sub")):
+		p = text.find(op)
+		if p >= 0:
+			base = parse_value(text[:p], find_label, find_register)
+			try:
+				offset = int(text[p+1:], 16)
+			except ValueError:
+				raise ConditionException(f"bad offset in '{text}'") from None
+			return (kind, base, ("const", offset))
+	try:
+		return ("const", int(text, 16) & MASK)
+	except ValueError:
+		pass
+	addr = find_label(text)
+	if addr is not None:
+		return ("const", addr)
+	num = find_register(text)
+	if num is not None:
+		return ("reg", num)
+	raise ConditionException(f"unknown value '{text}'")
+
+def parse_condition(text, find_label, find_register):
+	"""Parse the condition text and return its tree. find_label gives the
+	address of a label or None and find_register gives the number of a
+	register (in Arch.get_registers() order) or None. Raise a
+	ConditionException if the condition is not valid."""
+	conds = []
+	for item in text.split("&&"):
+		parts = CMP_RE.split(item)
+		if len(parts) == 1:
+			conds.append(("cmp", "!=",
+				parse_value(parts[0], find_label, find_register), ("const", 0)))
+		elif len(parts) == 3:
+			conds.append(("cmp", parts[1],
+				parse_value(parts[0], find_label, find_register),
+				parse_value(parts[2], find_label, find_register)))
+		else:
+			raise ConditionException(f"bad comparison '{item.strip()}'")
+	return ("and", conds)
+
+
+def compile_value(tree, sim):
+	"""Compile the tree of a value into a function returning the value."""
+	kind = tree[0]
+	if kind == "const":
+		value = tree[1]
+		return lambda: value
+	elif kind == "reg":
+		reg = sim.get_arch().get_registers()[tree[1]]
+		get = sim.get_register
+		return lambda: get(reg)
+	elif kind == "mem":
+		addr = compile_value(tree[1], sim)
+		get = sim.get_word
+		return lambda: get(addr() & MASK)
+	elif kind == "add":
+		x = compile_value(tree[1], sim)
+		y = compile_value(tree[2], sim)
+		return lambda: (x() + y()) & MASK
+	else:
+		x = compile_value(tree[1], sim)
+		y = compile_value(tree[2], sim)
+		return lambda: (x() - y()) & MASK
+
+def compile_condition(tree, sim):
+	"""Compile the tree of a condition into a function returning True when
+	the condition holds for the current state of the simulator."""
+	conds = []
+	for (_, op, x, y) in tree[1]:
+		fun = COMPARISONS[op]
+		x = compile_value(x, sim)
+		y = compile_value(y, sim)
+		conds.append(lambda fun=fun, x=x, y=y: fun(x(), y()))
+	if len(conds) == 1:
+		return conds[0]
+	else:
+		return lambda: all(cond() for cond in conds)
+
+
+class BreakCondition:
+	"""Condition and hit count of a breakpoint in a simulator: the
+	execution stops at the breakpoint when the condition holds, from the
+	hits-th time on."""
+
+	def __init__(self, cond, hits):
+		self.cond = cond
+		self.hits = hits
+		self.count = 0
+
+	def reset(self):
+		"""Reset the hit counter."""
+		self.count = 0
+
+	def check(self):
+		"""Called when the breakpoint is reached: return True if the
+		execution has to stop."""
+		if self.cond is not None and not self.cond():
+			return False
+		self.count += 1
+		return self.count >= self.hits
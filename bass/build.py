@@ -0,0 +1,282 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Compilation of the projects by a bounded pool of threads."""
+
+from collections import deque, OrderedDict
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+
+class BuildJob:
+	"""Compilation of a project waiting in the queue or running."""
+
+	QUEUED = 0
+	RUNNING = 1
+	DONE = 2
+
+	def __init__(self, project):
+		self.project = project
+		self.callbacks = []
+		self.state = BuildJob.QUEUED
+		self.result = None
+		self.rerun = False
+
+	def get_project(self):
+		"""Get the compiled project."""
+		return self.project
+
+	def is_done(self):
+		"""Test if the compilation is completed."""
+		return self.state == BuildJob.DONE
+
+	def get_result(self):
+		"""Get the result of the compilation as a triple (command result,
+		output text, error text) or None if it is not completed."""
+		return self.result
+
+
+class CompileService:
+	"""Application-wide compilation service. The compilations are queued
+	in FIFO order and run by at most size threads (default to the number of
+	cores). A compilation asked for a project already waiting in the queue
+	is merged with the waiting one. If the project is being compiled, the
+	running job is marked to be run again once completed (the sources may
+	have changed since make started) and the callbacks are only called
+	after this second run."""
+
+	def __init__(self, size, log):
+		if size <= 0:
+			size = os.cpu_count() or 1
+		self.size = size
+		self.log = log
+		self.queue = deque()
+		self.running = []
+		self.cond = threading.Condition()
+		self.threads = []
+
+	def submit(self, project, on_done):
+		"""Ask for the compilation of the project. on_done is called with
+		the job as parameter, from a thread of the service, when the
+		compilation is completed. Return the job."""
+		with self.cond:
+			for job in self.queue:
+				if job.project is project:
+					job.callbacks.append(on_done)
+					return job
+			for job in self.running:
+				if job.project is project:
+					job.rerun = True
+					job.callbacks.append(on_done)
+					return job
+			job = BuildJob(project)
+			job.callbacks.append(on_done)
+			self.queue.append(job)
+			if len(self.threads) < self.size:
+				thread = threading.Thread(target=self.work, daemon=True)
+				self.threads.append(thread)
+				thread.start()
+			self.cond.notify()
+			return job
+
+	def get_position(self, job):
+		"""Get the position (starting at 1) of the job in the queue or 0 if
+		it is not waiting anymore."""
+		with self.cond:
+			try:
+				return self.queue.index(job) + 1
+			except ValueError:
+				return 0
+
+	def work(self):
+		"""Main loop of the compilation threads."""
+		while True:
+			with self.cond:
+				while not self.queue:
+					self.cond.wait()
+				job = self.queue.popleft()
+				job.state = BuildJob.RUNNING
+				self.running.append(job)
+			try:
+				result = job.project.compile()
+			except Exception as e:	# pylint: disable=broad-except
+				self.log(f"ERROR: compilation of {job.project} failed: {e}")
+				result = (-1, "", f"cannot compile: {e}")
+			with self.cond:
+				self.running.remove(job)
+				if job.rerun:
+					job.rerun = False
+					job.state = BuildJob.QUEUED
+					self.queue.appendleft(job)
+					self.cond.notify()
+					continue
+				job.result = result
+				job.state = BuildJob.DONE
+				callbacks = list(job.callbacks)
+			for callback in callbacks:
+				try:
+					callback(job)
+				except Exception as e:	# pylint: disable=broad-except
+					self.log(f"ERROR: compilation callback failed: {e}")
+
+
+class BuildCache:
+	"""Cache of the build results shared by all users. An entry is the
+	directory named by a hash of the template name and of the files used
+	to build a project: it contains the executable and its disassembly.
+	When the total size exceeds capacity (in bytes), the least recently
+	used entries are removed."""
+
+	EXEC = "exec"
+	DISASM = "disasm.txt"
+	TMP = ".tmp-"
+
+	def __init__(self, path, capacity, log):
+		self.path = path
+		self.capacity = capacity
+		self.log = log
+		self.lock = threading.Lock()
+		self.entries = OrderedDict()		# key -> size
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self.scan()
+
+	def scan(self):
+		"""Build the entry list from the cache directory."""
+		os.makedirs(self.path, exist_ok=True)
+		entries = []
+		for name in os.listdir(self.path):
+			path = os.path.join(self.path, name)
+			if name.startswith(self.TMP):
+				shutil.rmtree(path, ignore_errors=True)
+			else:
+				try:
+					size = sum(os.path.getsize(os.path.join(path, file))
+						for file in os.listdir(path))
+					entries.append((os.path.getmtime(path), name, size))
+				except OSError:
+					shutil.rmtree(path, ignore_errors=True)
+		for (_, name, size) in sorted(entries):
+			self.entries[name] = size
+			self.size += size
+		self.evict()
+
+	@staticmethod
+	def get_key(project):
+		"""Compute the key of the project: a hash of the template name, of
+		the Makefile and of the source files."""
+		template = project.get_template()
+		names = set(template.install) | set(template.sources)
+		names |= {file.get_name() for file in project.get_sources()}
+		names.discard(template.get_exec_name())
+		hash = hashlib.sha256(template.get_name().encode("UTF8"))
+		for name in sorted(names):
+			hash.update(b"\0" + name.encode("UTF8") + b"\0")
+			try:
+				with open(os.path.join(project.get_path(), name), "rb") as inp:
+					hash.update(inp.read())
+			except OSError:
+				hash.update(b"\1")
+		return hash.hexdigest()
+
+	def log_stats(self, what):
+		"""Log a cache access and the hit rate."""
+		total = self.hits + self.misses
+		self.log(f"build cache {what}: {self.hits} hits, {self.misses} misses "
+			f"({100 * self.hits / total:.1f}% hits), {len(self.entries)} entries, "
+			f"{self.size // 1024} KB")
+
+	def fetch(self, key, exec_path):
+		"""Look for the entry of the key. If found, the executable is copied
+		to exec_path (the project must not share the file of the cache) and
+		the disassembly text is returned. Else return None."""
+		with self.lock:
+			if key in self.entries:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				hit = True
+			else:
+				self.misses += 1
+				hit = False
+			self.log_stats("hit" if hit else "miss")
+		if not hit:
+			return None
+		path = os.path.join(self.path, key)
+		try:
+			with open(os.path.join(path, self.DISASM), encoding="UTF8") as inp:
+				disasm = inp.read()
+			(fd, tmp) = tempfile.mkstemp(prefix=self.TMP,
+				dir=os.path.dirname(exec_path) or ".")
+			os.close(fd)
+			try:
+				shutil.copyfile(os.path.join(path, self.EXEC), tmp)
+				os.replace(tmp, exec_path)
+			except OSError:
+				os.remove(tmp)
+				raise
+			os.utime(path)
+			return disasm
+		except OSError as e:
+			self.log(f"build cache: cannot use entry {key}: {e}")
+			self.remove(key)
+			return None
+
+	def store(self, key, exec_path, disasm):
+		"""Record the build result of the key."""
+		path = os.path.join(self.path, key)
+		if os.path.exists(path):
+			return
+		tmp = None
+		try:
+			tmp = tempfile.mkdtemp(prefix=self.TMP, dir=self.path)
+			shutil.copyfile(exec_path, os.path.join(tmp, self.EXEC))
+			with open(os.path.join(tmp, self.DISASM), "w", encoding="UTF8") as out:
+				out.write(disasm)
+			size = sum(os.path.getsize(os.path.join(tmp, file))
+				for file in os.listdir(tmp))
+			os.rename(tmp, path)
+		except OSError as e:
+			self.log(f"build cache: cannot store entry {key}: {e}")
+			if tmp is not None:
+				shutil.rmtree(tmp, ignore_errors=True)
+			return
+		with self.lock:
+			if key not in self.entries:
+				self.entries[key] = size
+				self.size += size
+			self.evict()
+
+	def remove(self, key):
+		"""Remove an entry."""
+		with self.lock:
+			size = self.entries.pop(key, None)
+			if size is not None:
+				self.size -= size
+		shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+
+	def evict(self):
+		"""Remove the least recently used entries until the size fits in the
+		capacity. Must be called with the lock taken."""
+		while self.size > self.capacity and self.entries:
+			(key, size) = self.entries.popitem(last=False)
+			self.size -= size
+			shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
@@ -18,8 +18,10 @@
 
 """CSim class module for interconnection with CSim library."""
 
+import struct
+
 from csim import Board, BoardError
-from bass import arch
+from bass import arch, armdis
 
 
 class Arch(arch.Arch):
@@ -48,6 +50,7 @@ class Arch(arch.Arch):
 		self.registers = None
 		self.name = self.core.get_name()
 		self.reg_map = {}
+		self.store_regs = None
 
 	def get_registers(self):
 		"""Get the list of register banks."""
@@ -64,6 +67,25 @@ class Arch(arch.Arch):
 		except KeyError:
 			return None
 
+	def get_branch_kind(self, word):
+		if self.core.get_component_name() == "arm":
+			return armdis.branch_kind(word)
+		else:
+			return arch.CallStack.NONE
+
+	def is_store(self, word):
+		if self.core.get_component_name() == "arm":
+			return armdis.is_store(word)
+		else:
+			return None
+
+	def get_store(self, word, pc, sim):
+		if self.store_regs is None:
+			self.get_registers()
+			self.store_regs = [self.find_register(name) for name in armdis.STORE_REGS]
+		regs = self.store_regs
+		return armdis.store_access(word, pc, lambda n: sim.get_register(regs[n]))
+
 	def make_register(self, reg, i):
 		"""Build a BASS register from a CSIM Register."""
 		try:
@@ -90,28 +112,63 @@ class Simulator(arch.Simulator):
 		except BoardError as exn:
 			raise arch.SimException(f"cannot load board {template.get_board_path()}: {exn}")
 		self.arch = Arch(self.board.get_core())
-		self.breaks = []
+		self.breaks = set()
+		self.path = None
+		self.date_base = 0
+		self.io_date = None
 
 	def load(self, path):
 		"""Load the executable with the passed path. If there is an error,
 		raises a SimException."""
 		try:
+			self.board.reset()
 			self.board.load_bin(path)
 		except BoardError as exn:
 			raise arch.SimException(f"error during load of {path}: {exn}.")
+		self.path = path
+		self.date_base = -self.board.get_date()
+		self.setup_image(path)
 
 	def reset(self):
 		"""Reset the simulator."""
+		self.clear_profile()
+		self.reset_hits()
+		self.clear_trace()
+		self.clear_calls()
+		if self.initial is not None:
+			self.restore(self.initial)
+		else:
+			self.board.reset()
+			self.date_base = -self.board.get_date()
+
+	def write_page(self, addr, page):
+		write = self.board.set_word_at
+		for (i, word) in enumerate(struct.unpack(f"<{arch.PAGE_SIZE//4}I", page)):
+			write(addr + i*4, word)
+
+	def restore(self, cp):
 		self.board.reset()
+		for (addr, page) in cp.pages.items():
+			self.write_page(addr, page)
+		for (reg, value) in zip(self.arch.get_registers(), cp.regs):
+			self.set_register(reg, value)
+		self.date_base = cp.date - self.board.get_date()
+		self.restore_calls(cp)
 
 	def release(self):
 		"""Release the simulator."""
 		self.board.release()
 		self.board = None
 
-	def set_break(self, addr):
-		"""Set a breakpoint to the given address."""
-		self.breaks.append(addr)
+	def recycle(self):
+		arch.Simulator.recycle(self)
+		for addr in self.breaks:
+			self.board.get_core().clear_break(addr)
+		self.breaks.clear()
+		self.path = None
+		self.board.reset()
+		self.date_base = -self.board.get_date()
+
 
 	def get_pc(self):
 		"""Get the address of the PC."""
@@ -123,7 +180,13 @@ class Simulator(arch.Simulator):
 
 	def step(self):
 		"""Execute the current instruction and stop."""
-		self.board.run(1)
+		if self.calls is None:
+			self.board.run(1)
+		else:
+			pc = self.board.get_pc()
+			kind = self.get_branch_kind(pc)
+			self.board.run(1)
+			self.calls.update(kind, pc, self.board.get_pc())
 
 	def get_register(self, reg):
 		"""Get the value of a register."""
@@ -143,7 +206,7 @@ class Simulator(arch.Simulator):
 
 	def get_date(self):
 		"""Get the date in cycles."""
-		return self.board.get_date()
+		return self.board.get_date() + self.date_base
 
 	def get_byte(self, addr):
 		"""Get the byte at the given address."""
@@ -157,19 +220,65 @@ class Simulator(arch.Simulator):
 		"""Get unsigned 32b integer."""
 		return self.board.word_at(addr)
 
+	def read_block(self, addr, size):
+		return arch.read_words(self.board.word_at, addr, size)
+
 	def get_board(self):
 		return self.board
 
+	def has_io(self):
+		date = self.board.get_date()
+		io = date != self.io_date
+		self.io_date = date
+		return io
+
 	def set_breakpoint(self, addr):
+		self.breaks.add(addr)
 		self.board.get_core().set_break(addr)
 
 	def clear_breakpoint(self, addr):
+		self.breaks.discard(addr)
+		self.conds.pop(addr, None)
 		self.board.get_core().clear_break(addr)
 
-	def run(self, time):
-		res = self.board.run(time)
+	def run_conditional(self, time, date, until=None):
+		"""Run the board until the date + time, going on after the
+		breakpoints whose condition does not hold. Return 0 if the time has
+		elapsed, non-zero if a breakpoint or until has been reached."""
+		while True:
+			res = self.board.run(time - (self.board.get_date() - date))
+			if res == 0:
+				return res
+			pc = self.board.get_pc()
+			if pc == until or self.check_break(pc):
+				return res
+			self.board.run(1)
+			if self.board.get_date() - date >= time:
+				return 0
+			pc = self.board.get_pc()
+			if pc == until or (pc in self.breaks and self.check_break(pc)):
+				return 1
+
+	def run_batch(self, time, until=None):
+		breaks = self.breaks if until is None else self.breaks | {until}
+		if self.is_instrumented():
+			return self.run_instrumented(time, breaks, until)
+		if self.profile is not None:
+			return self.run_profiled(time, breaks, until)
+		date = self.board.get_date()
+		if until is None or until in self.breaks:
+			# until is already a native breakpoint
+			res = self.run_conditional(time, date, until)
+		else:
+			core = self.board.get_core()
+			core.set_break(until)
+			try:
+				res = self.run_conditional(time, date, until)
+			finally:
+				core.clear_break(until)
+		count = self.board.get_date() - date
 		if res == 0:
-			return arch.Run.OK
+			return (arch.Run.OK, count)
 		else:
-			return arch.Run.BP
+			return (arch.Run.BP, count)
 
@@ -1,14 +1,20 @@
 
 """Module containing the classes of the user/project database."""
 
+import bisect
 import configparser
+import logging
 import os
 import os.path
 import re
 import shutil
 import subprocess
+import struct
+import threading
 
-from bass import find_symbol
+from bass import armdis, dwarf, elf, find_symbol
+from bass.arch import SimException
+from bass.remote import RemoteSimulator
 import bass
 
 class DataException(Exception):
@@ -36,8 +42,6 @@ class Disassembly(bass.Disassembly):
 
 	def __init__(self, output):
 		bass.Disassembly.__init__(self)
-		self.lines = []
-		self.labels = {}
 		base = ""
 		for line in output.split('\n'):
 
@@ -45,10 +49,7 @@ class Disassembly(bass.Disassembly):
 			match = self.LABEL_RE.match(line)
 			if match is not None:
 				base = match.group(1)
-				addr = int(base, 16)
-				label = match.group(2)
-				self.labels[label] = addr
-				self.lines.append((addr, "", f"{label}:"))
+				self.add_label(int(base, 16), match.group(2))
 				continue
 
 			# look for an instruction
@@ -57,17 +58,62 @@ class Disassembly(bass.Disassembly):
 				addr = match.group(1)
 				if len(addr) < len(base):
 					addr = base[0:len(base)-len(addr)] + addr
-				self.lines.append((int(addr, 16), match.group(2), match.group(3)))
+				self.add_inst(int(addr, 16), match.group(2), match.group(3))
 				continue
+		self.index()
 
-	def get_code(self):
-		return self.lines
 
-	def find_label(self, label):
+class ELFDisassembly(bass.Disassembly):
+	"""Disassembly built directly from an ARM ELF executable. Thumb code is
+	not supported: a DisassemblyException is raised (and objdump used)."""
+
+	def __init__(self, path):
+		bass.Disassembly.__init__(self)
 		try:
-			return self.labels[label]
-		except KeyError:
-			return None
+			file = elf.File(path)
+		except elf.ELFException as e:
+			raise bass.DisassemblyException(str(e)) from e
+		order = "<" if file.is_little_endian() else ">"
+
+		# collect symbols
+		names = {}
+		maps = []
+		for sym in file.get_symbols():
+			if sym.is_label():
+				self.add_symbol(sym.get_name(), sym.get_value())
+				names.setdefault(sym.get_value(), sym.get_name())
+			elif sym.is_mapping():
+				kind = sym.get_name()[1:2]
+				if kind == "t":
+					raise bass.DisassemblyException(f"{path}: Thumb code is not supported")
+				maps.append((sym.get_value(), kind == "d"))
+		maps.sort()
+		map_addrs = [addr for (addr, _) in maps]
+		self.index()
+
+		# disassemble executable sections
+		for sect in file.get_sections():
+			if not sect.is_executable():
+				continue
+			data = file.get_section_data(sect)
+			words = struct.unpack(f"{order}{len(data)//4}I", data[:len(data)//4*4])
+			for (i, word) in enumerate(words):
+				addr = sect.addr + i*4
+				if addr in names:
+					self.add_label(addr, names[addr])
+				m = bisect.bisect_right(map_addrs, addr) - 1
+				if m >= 0 and maps[m][1]:
+					inst = armdis.word(word)
+				else:
+					inst = armdis.disassemble(word, addr, self.get_name)
+				self.add_inst(addr, f"{word:08x}", inst)
+		self.index()
+
+	def get_name(self, addr):
+		"""Get the name of an address relative to the closest label as
+		displayed in instructions."""
+		label = self.get_label(addr)
+		return "" if label is None else f" <{label}>"
 
 
 class File:
@@ -103,6 +149,99 @@ class File:
 		os.remove(path)
 
 
+class SimulatorPool:
+	"""Pool of ready-to-use simulators of a template. At most size simulators
+	are kept: when a simulator is given back to a full pool, the oldest one
+	is evicted. Each time a simulator is taken, the pool is refilled in
+	the background."""
+
+	def __init__(self, template, size):
+		self.template = template
+		self.size = size
+		self.sims = []
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.filling = False
+
+	def fill(self):
+		"""Fill the pool with new simulators. May raise SimException or
+		DataException."""
+		while True:
+			with self.lock:
+				if len(self.sims) >= self.size:
+					return
+			sim = self.template.new_simulator()
+			with self.lock:
+				if len(self.sims) < self.size:
+					self.sims.append(sim)
+					sim = None
+			if sim is not None:
+				sim.release()
+
+	def refill(self):
+		"""Fill the pool in a background thread, unless a refill is already
+		running."""
+		with self.lock:
+			if self.filling or len(self.sims) >= self.size:
+				return
+			self.filling = True
+		threading.Thread(target=self.run_refill, daemon=True).start()
+
+	def run_refill(self):
+		"""Body of the refill thread. If a simulator cannot be built, the
+		error is logged by the template and the thread stops: the next get()
+		tries again."""
+		try:
+			self.template.prepare_simulators()
+		finally:
+			with self.lock:
+				self.filling = False
+
+	def get(self):
+		"""Get a simulator from the pool or build a new one if the pool is
+		empty. May raise SimException or DataException."""
+		sim = None
+		with self.lock:
+			if self.sims:
+				self.hits += 1
+				sim = self.sims.pop()
+			else:
+				self.misses += 1
+		self.refill()
+		if sim is None:
+			sim = self.template.new_simulator()
+		return sim
+
+	def put(self, sim):
+		"""Give back a simulator to the pool. A simulator that cannot be
+		recycled (for example, because its worker process has crashed) is
+		released instead."""
+		evicted = None
+		try:
+			sim.recycle()
+		except SimException as e:
+			self.template.app.log(f"dropping a simulator of {self.template.get_name()}: {e}")
+			sim.release()
+			return
+		with self.lock:
+			if self.size == 0:
+				evicted = sim
+			else:
+				if len(self.sims) >= self.size:
+					evicted = self.sims.pop(0)
+					self.evictions += 1
+				self.sims.append(sim)
+		if evicted is not None:
+			evicted.release()
+
+	def get_stats(self):
+		"""Get a tuple (hits, misses, evictions, available simulators)."""
+		with self.lock:
+			return (self.hits, self.misses, self.evictions, len(self.sims))
+
+
 class Template:
 	"""Represents a template."""
 
@@ -124,6 +263,10 @@ class Template:
 		self.enabled = True
 		self.label = name
 		self.order = 0
+		self.pool = None
+		self.quantum_min = 100
+		self.quantum_max = 1000000
+		self.disasm = None
 
 	def get_name(self):
 		"""Get the name of the template."""
@@ -161,6 +304,23 @@ class Template:
 		self.board = config.get("template", "board", fallback=None)
 		self.enabled = config.get("template", "enabled", fallback="yes") == "yes"
 		self.order = config.getint("template", "order", fallback=0)
+		self.quantum_min = config.getint("template", "quantum_min", fallback=self.quantum_min)
+		self.quantum_max = config.getint("template", "quantum_max", fallback=self.quantum_max)
+		self.disasm = config.get("template", "disasm",
+			fallback="elf" if self.arch == "arm" else "objdump")
+
+	def get_quantum_min(self):
+		"""Get the minimal size of a simulation quantum."""
+		return self.quantum_min
+
+	def get_quantum_max(self):
+		"""Get the maximal size of a simulation quantum."""
+		return self.quantum_max
+
+	def has_elf_disasm(self):
+		"""Test if the disassembly can be built directly from the executable
+		(instead of using the disassembler of the toolchain)."""
+		return self.disasm == "elf" or (self.disasm is None and self.arch == "arm")
 
 	def has_board(self):
 		"""Test if the template has a board."""
@@ -190,14 +350,48 @@ class Template:
 		"""Get the executable name."""
 		return self.exec
 
-	def get_simulator(self):
-		"""Get the simulator used by the project."""
+	def new_simulator(self):
+		"""Build a new simulator for the template. If the application runs
+		simulators in worker processes, a remote simulator is built, except
+		for templates with a board whose display needs the board in the
+		server process."""
+		workers = self.app.get_workers()
+		if workers is not None and not self.has_board():
+			return RemoteSimulator(self, workers)
 		if self.sim_cls is None:
 			self.sim_cls = find_symbol(self.sim, self.app.log)
 			if self.sim_cls is None:
 				raise DataException(f"cannot find class '{self.sim}'")
 		return self.sim_cls(self)
 
+	def get_pool(self):
+		"""Get the pool of simulators of the template."""
+		if self.pool is None:
+			self.pool = SimulatorPool(self, self.app.sim_pool)
+		return self.pool
+
+	def prepare_simulators(self):
+		"""Fill the pool of simulators of the template. Errors are only
+		logged."""
+		try:
+			self.get_pool().fill()
+		except (SimException, DataException) as e:
+			self.app.log(f"cannot prepare simulators for {self.name}: {e}")
+
+	def get_simulator(self):
+		"""Get the simulator used by the project (from the pool if
+		possible)."""
+		pool = self.get_pool()
+		sim = pool.get()
+		(hits, misses, evictions, avail) = pool.get_stats()
+		self.app.log(f"simulator pool {self.name}: {hits} hits, {misses} misses, "
+			f"{evictions} evictions, {avail} available", logging.DEBUG)
+		return sim
+
+	def release_simulator(self, sim):
+		"""Give back a simulator obtained by get_simulator()."""
+		self.get_pool().put(sim)
+
 
 class Project:
 	"""The project of a user."""
@@ -210,6 +404,8 @@ class Project:
 		self.template = template
 		self.path = None
 		self.disasm = None
+		self.lines = None
+		self.lock = threading.Lock()	# protects disasm and lines
 
 	def get_name(self):
 		"""Get the name of the project."""
@@ -309,8 +505,20 @@ class Project:
 		return self.name
 
 	def compile(self):
-		"""Compile the project. Return a triple (command result, output text, error text)."""
-		self.disasm = None
+		"""Compile the project. Return a triple (command result, output text, error text).
+		If the sources has already been built, the executable and its
+		disassembly are taken from the build cache of the application.
+		The disassembly of the previous executable remains available until
+		the new one is built."""
+		elf_disasm = self.get_template().has_elf_disasm()
+		cache = self.app.get_build_cache()
+		key = None
+		if cache is not None:
+			key = cache.get_key(self)
+			output = cache.fetch(key, self.get_exec_path())
+			if output is not None:
+				self.prepare_disasm(None if elf_disasm else Disassembly(output))
+				return (0, "make (cached)\n", "")
 		cp = subprocess.run(
 				"make",
 				shell = True,
@@ -318,6 +526,21 @@ class Project:
 				encoding = "UTF8",
 				capture_output = True
 			)
+		disasm = None
+		if cp.returncode == 0:
+			if key is not None:
+				try:
+					if elf_disasm:
+						output = ""
+					else:
+						output = self.run_disasm()
+						disasm = Disassembly(output)
+					cache.store(key, self.get_exec_path(), output)
+				except bass.DisassemblyException:
+					pass
+			self.prepare_disasm(disasm)
+		else:
+			self.publish_disasm(None)
 		return (cp.returncode, "make\n" + cp.stdout, cp.stderr)
 
 	def new_sim(self):
@@ -327,27 +550,78 @@ class Project:
 			self.load()
 		return self.template.get_simulator()
 
-	def get_disasm(self):
-		"""Get the disassembly of the current program."""
-
-		if self.disasm is None:
-
-			# get information
-			cp = subprocess.run(
-					"make disasm",
-					shell = True,
-					cwd = self.get_path(),
-					encoding = "UTF8",
-					capture_output = True
-				)
-
-			# build the disassembly
-			if cp.returncode == 0:
-				self.disasm = Disassembly(cp.stdout)
-			else:
-				raise bass.DisassemblyException(cp.stderr.replace('\n', ' '))
+	def run_disasm(self):
+		"""Run the disassembler and return its output. Raises
+		DisassemblyException in case of error."""
+		cp = subprocess.run(
+				"make disasm",
+				shell = True,
+				cwd = self.get_path(),
+				encoding = "UTF8",
+				capture_output = True
+			)
+		if cp.returncode != 0:
+			raise bass.DisassemblyException(cp.stderr.replace('\n', ' '))
+		return cp.stdout
+
+	def make_disasm(self):
+		"""Build the disassembly of the executable. It is built directly
+		from the executable if the template supports it, else from the output
+		of the disassembler. Raises DisassemblyException in case of error."""
+		if self.get_template().has_elf_disasm():
+			try:
+				return ELFDisassembly(self.get_exec_path())
+			except bass.DisassemblyException as e:
+				self.app.log(f"falling back to disassembler for {self.name}: {e}")
+		return Disassembly(self.run_disasm())
 
-		return self.disasm
+	def get_disasm(self):
+		"""Get the disassembly of the current program, building it if
+		required. Raises DisassemblyException in case of error."""
+		with self.lock:
+			disasm = self.disasm
+		if disasm is None:
+			disasm = self.make_disasm()
+			with self.lock:
+				if self.disasm is None:
+					self.disasm = disasm
+				disasm = self.disasm
+		return disasm
+
+	def get_lines(self):
+		"""Get the line table (dwarf.LineTable) of the current program, read
+		once from the debugging information of the executable. The table is
+		empty if there is no such information."""
+		with self.lock:
+			lines = self.lines
+		if lines is None:
+			try:
+				lines = dwarf.read_lines(elf.File(self.get_exec_path()))
+			except elf.ELFException as e:
+				self.app.log(f"no line information for {self.name}: {e}")
+				lines = dwarf.LineTable()
+			with self.lock:
+				if self.lines is None:
+					self.lines = lines
+				lines = self.lines
+		return lines
+
+	def publish_disasm(self, disasm):
+		"""Make disasm the disassembly of the current program and forget the
+		line table of the previous one."""
+		with self.lock:
+			self.disasm = disasm
+			self.lines = None
+
+	def prepare_disasm(self, disasm=None):
+		"""Build the disassembly of a new executable (if disasm is not
+		already built) and publish it, ignoring errors."""
+		if disasm is None:
+			try:
+				disasm = self.make_disasm()
+			except bass.DisassemblyException:
+				pass
+		self.publish_disasm(disasm)
 
 	def rename(self, name):
 		"""Change the name of the project."""
@@ -429,6 +703,10 @@ class User:
 	def get_projects(self):
 		return self.projects
 
+	def get_groups(self):
+		"""Get the groups the user belongs to."""
+		return self.groups
+
 	def load(self):
 		"""Load data from the user."""
 		config = configparser.ConfigParser()
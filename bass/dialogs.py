@@ -51,6 +51,52 @@ class RenameDialog(dialog.Base):
 		self.msg.show_error(msg)
 
 
+class ConditionDialog(dialog.Base):
+	"""Dialog to set the condition and the hit count of a breakpoint."""
+
+	def __init__(self, session):
+		self.session = session
+		self.cond = Var("", label="Condition")
+		self.hits = Var(1, label="Hits")
+		self.apply = None
+
+		cancel_action = Action(fun=lambda _: self.hide(), label="Cancel")
+		set_action = Action(fun=lambda _: self.apply(~self.cond, ~self.hits),
+			label="Set",
+			enable=self.hits > 0)
+
+		self.msg = MessageLabel("")
+		main = VGroup([
+				Field(var = self.cond, size=30,
+					place_holder="r0 == 0 && [counter] >= a")
+					.key(Key.ENTER, lambda: self.apply(~self.cond, ~self.hits)),
+				Field(var = self.hits, size=6),
+				HGroup([
+					hspring(),
+					Button(cancel_action),
+					Button(set_action)
+				]),
+				self.msg
+			])
+		dialog.Base.__init__(self, session.get_page(), main,
+			title="Breakpoint condition")
+
+	def edit(self, cond, hits, apply):
+		"""Show the dialog to edit the given condition and hit count.
+		apply is called with the new condition and hit count."""
+		self.apply = apply
+		self.cond.set(cond)
+		self.hits.set(hits)
+		self.show()
+
+	def on_show(self):
+		dialog.Base.on_show(self)
+		self.msg.clear_message()
+
+	def error(self, msg):
+		self.msg.show_error(msg)
+
+
 class DeleteDialog(dialog.Answer):
 	"""Dialog asking the user to validate deletion of current project."""
 
@@ -1,44 +1,55 @@
 """Disassembly module."""
 
+import re
+
 import orchid as orc
 from orchid.util import Buffer
 import bass
 
 class DisasmPane(orc.Component, bass.ApplicationPane, orc.SetObserver):
-	"""Display disassembly code."""
+	"""Display disassembly code. Only a window of rows around the visible
+	part is rendered: other rows are replaced by spacers and are requested
+	by the client when the pane is scrolled."""
 
 	MODEL = orc.Model(
 		"disasm-pane",
 		style = """
-table.disasm {
+.disasm {
 	overflow: auto;
+}
+
+.disasm table {
 	border: 0;
 	border-collapse: collapse;
 	cursor: grab;
 	user-select: none;
 }
 
-table.disasm tr td {
-	padding: 2px;
-	padding-right: 8px;
+.disasm table tbody tr {
+	height: 20px;
+}
+
+.disasm table tr td {
+	padding: 0 8px 0 2px;
 	font-family: monospace;
+	white-space: nowrap;
 }
 
-table.disasm tr td:nth-child(1) {
+.disasm table tr td:nth-child(1) {
 	min-width: 8px;
 }
 
-table.disasm tr td:nth-child(2) {
+.disasm table tr td:nth-child(2) {
 	padding-left: 4px: ;
 }
 
-table.disasm tr.disasm-bp td:nth-child(1) {
+.disasm table tr.disasm-bp td:nth-child(1) {
 	background-color: red;
 	border-radius: 12px;
 	padding-right: 0;
 }
 
-table.disasm tr th {
+.disasm table tr th {
 	text-align: left;
 	padding-right: 8px;
 	font-weight: normal;
@@ -52,35 +63,163 @@ table.disasm tr th {
 .disasm-selected {
 	background: lightblue;
 }
+
+.disasm table tr td:nth-child(5) {
+	text-align: right;
+}
+
+.disasm table caption {
+	caption-side: top;
+	text-align: left;
+	padding: 2px;
+}
+
+.disasm-heat-1 {
+	background-color: #fff3c4;
+}
+
+.disasm-heat-2 {
+	background-color: #ffd280;
+}
+
+.disasm-heat-3 {
+	background-color: #ff9e57;
+}
+
+.disasm-heat-4 {
+	background-color: #ff6040;
+}
 """,
 	script = """
-function disasm_double_click(disasm, event) {
+function disasm_tr(id, row) {
+	let body = document.getElementById(id + "-body");
+	let first = parseInt(body.dataset.first);
+	if(row < first || row >= parseInt(body.dataset.last))
+		return null;
+	return body.children[row - first + 1];
+}
+
+function disasm_row(event) {
 	var item = event.target;
 	if(item.tagName == "TD")
 		item = item.parentNode;
 	if(item.tagName != "TR")
-		return;
-	let i = ui_index(item);
-	console.log("i = " + i);
-	if(i > 0)
-		ui_send({id: disasm.id, action: "bp", index: i-1 });
+		return -1;
+	let body = item.parentNode;
+	let i = Array.prototype.indexOf.call(body.children, item);
+	if(i <= 0 || i >= body.children.length - 1)
+		return -1;
+	return parseInt(body.dataset.first) + i - 1;
+}
+
+function disasm_double_click(disasm, event) {
+	let i = disasm_row(event);
+	if(i >= 0)
+		ui_send({id: disasm.id, action: "bp", index: i });
 }
 
 function disasm_single_click(disasm, event) {
-	var item = event.target;
-	if(item.tagName == "TD")
-		item = item.parentNode;
-	if(item.tagName != "TR")
+	let i = disasm_row(event);
+	if(i >= 0)
+		ui_send({id: disasm.id, action: "select", index: i });
+}
+
+function disasm_scroll(disasm) {
+	let body = document.getElementById(disasm.id + "-body");
+	if(body == null || disasm.disasm_pending)
 		return;
-	let i = ui_index(item);
-	console.log("i = " + i);
-	if(i > 0)
-		ui_send({id: disasm.id, action: "select", index: i-1 });
+	let height = parseInt(body.dataset.height);
+	let first = Math.floor(disasm.scrollTop / height);
+	let last = Math.ceil((disasm.scrollTop + disasm.clientHeight) / height);
+	if(first < parseInt(body.dataset.first)
+	|| (last > parseInt(body.dataset.last)
+	&& parseInt(body.dataset.last) < parseInt(body.dataset.total))) {
+		disasm.disasm_pending = true;
+		ui_send({id: disasm.id, action: "window", first: first, last: last});
+	}
+}
+
+function disasm_set_window(msg) {
+	let body = document.getElementById(msg.id + "-body");
+	body.innerHTML = msg.html;
+	body.dataset.first = msg.first;
+	body.dataset.last = msg.last;
+	let disasm = document.getElementById(msg.id);
+	disasm.disasm_pending = false;
+	disasm_scroll(disasm);
+}
+
+function disasm_patch(msg) {
+	let body = document.getElementById(msg.id + "-body");
+	let template = document.createElement("tbody");
+	let row = body.children[1];
+	for(const [op, arg] of msg.ops) {
+		if(op == "k") {
+			for(let i = 0; i < arg; i++)
+				row = row.nextElementSibling;
+		}
+		else if(op == "d") {
+			for(let i = 0; i < arg; i++) {
+				let next = row.nextElementSibling;
+				body.removeChild(row);
+				row = next;
+			}
+		}
+		else {
+			template.innerHTML = arg;
+			let rows = Array.from(template.children);
+			if(op == "u") {
+				let next = row.nextElementSibling;
+				body.replaceChild(rows[0], row);
+				row = next;
+			}
+			else
+				for(const r of rows)
+					body.insertBefore(r, row);
+		}
+	}
+	body.children[0].children[0].style.height = msg.top + "px";
+	body.lastElementChild.children[0].style.height = msg.bottom + "px";
+	body.dataset.first = msg.first;
+	body.dataset.last = msg.last;
+	body.dataset.total = msg.total;
+	disasm_scroll(document.getElementById(msg.id));
+}
+
+function disasm_set_class(msg) {
+	let row = disasm_tr(msg.id, msg.row);
+	if(row == null)
+		return;
+	if(msg.on)
+		row.classList.add(msg.cls);
+	else
+		row.classList.remove(msg.cls);
+}
+
+function disasm_set_heat(msg) {
+	for(let i = 0; i < msg.rows.length; i++) {
+		let row = disasm_tr(msg.id, msg.rows[i]);
+		if(row == null)
+			continue;
+		let td = row.children[4];
+		td.innerText = msg.counts[i];
+		td.className = msg.levels[i];
+	}
+	if(msg.loops != null)
+		document.getElementById(msg.id + "-loops").innerHTML = msg.loops;
 }
 """
 )
 	BREAKPOINT = "disasm-bp"
 	SELECTED = "disasm-selected"
+	CURRENT = "disasm-current"
+	HEAT_LEVELS = 4
+	LOOP_COUNT = 5
+	BRANCH_RE = re.compile(
+		r"^b(?:eq|ne|cs|hs|cc|lo|mi|pl|vs|vc|hi|ls|ge|lt|gt|le|al)?\s+([0-9a-fA-F]+)\b")
+	ROW_HEIGHT = 20			# in pixels, as in the style
+	INITIAL_ROWS = 100		# rows rendered before the first scroll
+	MARGIN = 50				# rows rendered around the visible ones
 
 	def __init__(self):
 		orc.Component.__init__(self, self.MODEL)
@@ -88,22 +227,36 @@ function disasm_single_click(disasm, event) {
 		self.session = None
 		self.disasm = None
 		self.sim = None
-		self.update_disasm = False
-		self.map = None				# address -> index
 		self.pc_row = None
 		self.selected = None
+		self.heat = {}				# rendered index -> (count, level) displayed
+		self.profile = None			# profile of the last update
+		self.top = 0				# maximum count of the profile
+		self.back_branches = None	# (address, target) of backward branches
+		self.loops = ""
+		self.window = (0, 0)		# rendered rows
 
 		self.add_class('text-back')
 		self.add_class('disasm')
 		self.set_attr("ondblclick", "disasm_double_click(this, event);")
 		self.set_attr("onclick", "disasm_single_click(this, event);")
+		self.set_attr("onscroll", "disasm_scroll(this);")
+
+	def set_row_class(self, row, cls, on):
+		"""Add or remove a class of a row if it is rendered. Rows rendered
+		later get their classes from the state of the pane."""
+		if self.window[0] <= row < self.window[1] and self.online():
+			self.call("disasm_set_class", {
+				"id": self.get_id(),
+				"row": row,
+				"cls": cls,
+				"on": on
+			})
 
 	def deselect(self):
 		"""Remove the selection."""
 		if self.selected is not None:
-			self.remove_class(self.SELECTED,
-				id=f"{self.get_id()}-body",
-				nth=self.selected+1)
+			self.set_row_class(self.selected, self.SELECTED, False)
 			self.selected = None
 
 	def select(self, n):
@@ -111,16 +264,14 @@ function disasm_single_click(disasm, event) {
 		self.deselect()
 		self.selected = n
 		if self.selected is not None:
-			self.add_class(self.SELECTED,
-				id=f"{self.get_id()}-body",
-				nth=self.selected+1)
+			self.set_row_class(self.selected, self.SELECTED, True)
 
 	def gen(self, out):
-		out.write("<table ")
+		out.write("<div ")
 		self.gen_attrs(out)
 		out.write(">")
 		self.gen_content(out)
-		out.write("</table>")
+		out.write("</div>")
 
 	def expands_horizontal(self):
 		return True
@@ -131,48 +282,274 @@ function disasm_single_click(disasm, event) {
 	def gen_content(self, out):
 		"""Generate the content of the pane."""
 		if self.disasm is None:
-			out.write("<tr><td>Nothing to display.</td></tr>")
+			out.write("Nothing to display.")
 		else:
-			bps = self.session.get_breakpoints()
-			self.map = {}
-			out.write(f'<tbody id="{self.get_id()}-body">')
-			out.write("<tr><th></th><th>Address</th><th>Code</th><th>Instruction</th></tr>")
-			for i, (addr, bytes, inst) in enumerate(self.disasm.get_code()):
-				if addr in bps and bytes:
-					bp = f' class="{self.BREAKPOINT}"'
-				else:
-					bp = ''
-				out.write(f"<tr{bp}>\
-					<td></td>\
-					<td>{addr:08x}</td>\
-					<td>{bytes}</td>\
-					<td>{inst}</td></tr>")
-				if bytes:
-					self.map[addr] = i
-			out.write('</tbody>')
+			self.heat = {}
+			self.loops = ""
+			size = self.disasm.get_size()
+			self.window = (0, min(size, self.INITIAL_ROWS))
+			out.write('<table>')
+			out.write(f'<caption id="{self.get_id()}-loops"></caption>')
+			out.write("<thead><tr><th></th><th>Address</th><th>Code</th><th>Instruction</th><th>Count</th></tr></thead>")
+			out.write(f'<tbody id="{self.get_id()}-body" data-height="{self.ROW_HEIGHT}" '
+				f'data-first="{self.window[0]}" data-last="{self.window[1]}" data-total="{size}">')
+			self.gen_rows(out)
+			out.write('</tbody></table>')
+
+	def gen_spacer(self, out, rows):
+		"""Generate a spacer replacing the given number of rows. The rows of
+		the window are identified by their position after the first spacer."""
+		out.write(f'<tr><td colspan="5" style="height: {rows*self.ROW_HEIGHT}px; padding: 0;"></td></tr>')
+
+	def gen_row(self, out, i, bps):
+		"""Generate the row i."""
+		(addr, bytes, inst) = self.disasm.get_code()[i]
+		classes = []
+		if addr in bps and bytes:
+			classes.append(self.BREAKPOINT)
+		if i == self.pc_row:
+			classes.append(self.CURRENT)
+		if i == self.selected:
+			classes.append(self.SELECTED)
+		heat = self.get_heat(i)
+		if heat[0]:
+			self.heat[i] = heat
+		else:
+			self.heat.pop(i, None)
+		(count, level) = heat
+		out.write(f'<tr class="{" ".join(classes)}">\
+			<td></td>\
+			<td>{addr:08x}</td>\
+			<td>{bytes}</td>\
+			<td>{inst}</td>\
+			<td class="{level}">{count if count else ""}</td></tr>')
+
+	def gen_rows(self, out):
+		"""Generate the rows of the current window surrounded by spacers."""
+		(first, last) = self.window
+		bps = ~self.session.get_breakpoints()
+		self.gen_spacer(out, first)
+		for i in range(first, last):
+			self.gen_row(out, i, bps)
+		self.gen_spacer(out, self.disasm.get_size() - last)
+
+	def set_window(self, first, last):
+		"""Render the rows from first to last (excluded) with a margin."""
+		size = self.disasm.get_size()
+		first = max(0, min(first - self.MARGIN, size))
+		last = max(first, min(last + self.MARGIN, size))
+		self.window = (first, last)
+		self.heat = {}
+		buf = Buffer()
+		self.gen_rows(buf)
+		self.call("disasm_set_window", {
+			"id": self.get_id(),
+			"first": first,
+			"last": last,
+			"html": str(buf)
+		})
 
 	def set_disasm(self, disasm):
 		"""Change the displayed disassembly."""
 		self.disasm = disasm
+		self.back_branches = None
+		self.pc_row = None
+		self.selected = None
 		if self.online():
 			buf = Buffer()
 			self.gen_content(buf)
 			self.set_content(str(buf))
 
+	def patch_disasm(self, disasm):
+		"""Replace the displayed disassembly by a new version of the program:
+		only the rendered rows that differ are patched on the client."""
+		old = self.disasm
+		if old is None or disasm is None or not self.online():
+			self.set_disasm(disasm)
+			return
+		self.set_pc(None)
+		self.deselect()
+		self.clear_heat()
+
+		# compute the new window
+		ops = disasm.diff(old)
+		(first, last) = self.window
+		new_first = new_last = None
+		for (tag, i1, i2, j1, j2) in ops:
+			if new_first is None and (i1 <= first < i2 or i1 == i2 == first):
+				if tag == "equal":
+					new_first = j1 + first - i1
+				else:
+					new_first = j1 if i1 == first else j2
+			if i1 < last <= i2:
+				if tag == "equal":
+					new_last = j1 + last - i1
+				else:
+					new_last = j2 if i2 == last else j1
+		if new_first is None or new_last is None or new_last <= new_first:
+			self.set_disasm(disasm)
+			return
+		self.disasm = disasm
+		self.back_branches = None
+		self.window = (new_first, new_last)
+
+		# build the patch of the rendered rows
+		patch = []
+		def emit(op, arg):
+			if patch and patch[-1][0] == op and op in "kd":
+				patch[-1][1] += arg
+			else:
+				patch.append([op, arg])
+		bps = ~self.session.get_breakpoints()
+		old_code = old.get_code()
+		new_code = disasm.get_code()
+		old_heat = self.heat
+		self.heat = {}
+		for (tag, i1, i2, j1, j2) in ops:
+			low = max(i1, first)
+			high = min(i2, last)
+			if tag == "equal":
+				for i in range(low, high):
+					j = j1 + i - i1
+					if old_code[i] == new_code[j]:
+						emit("k", 1)
+						if i in old_heat:
+							self.heat[j] = old_heat[i]
+					else:
+						buf = Buffer()
+						self.gen_row(buf, j, bps)
+						emit("u", str(buf))
+			else:
+				if high > low:
+					emit("d", high - low)
+				buf = Buffer()
+				for j in range(max(j1, new_first), min(j2, new_last)):
+					self.gen_row(buf, j, bps)
+				if str(buf):
+					emit("i", str(buf))
+		self.call("disasm_patch", {
+			"id": self.get_id(),
+			"ops": patch,
+			"first": new_first,
+			"last": new_last,
+			"total": disasm.get_size(),
+			"top": new_first * self.ROW_HEIGHT,
+			"bottom": (disasm.get_size() - new_last) * self.ROW_HEIGHT
+		})
+
 	def set_pc(self, addr):
 		"""Change the address of the PC (and corresponding highlighted line)."""
-		try:
-			new_pc_row = self.map[addr] + 1
-		except KeyError:
-			new_pc_row = None
+		new_pc_row = None
+		if addr is not None and self.disasm is not None:
+			new_pc_row = self.disasm.row_of(addr)
 		if new_pc_row != self.pc_row:
-			if self.pc_row is not None and self.is_shown():
-				self.remove_class('disasm-current',
-					id=f"{self.get_id()}-body", nth=self.pc_row)
+			if self.pc_row is not None:
+				self.set_row_class(self.pc_row, self.CURRENT, False)
 			self.pc_row = new_pc_row
-			if self.pc_row is not None and self.is_shown():
-				self.add_class('disasm-current',
-					id=f"{self.get_id()}-body", nth=self.pc_row)
+			if self.pc_row is not None:
+				self.set_row_class(self.pc_row, self.CURRENT, True)
+
+	def get_label(self, addr):
+		"""Get the name of the address relative to the closest label."""
+		label = self.disasm.get_label(addr)
+		return f"{addr:08x}" if label is None else label
+
+	def get_back_branches(self):
+		"""Get the backward branches of the disassembly as a list of pairs
+		(address, target). The list is built once per disassembly."""
+		if self.back_branches is None:
+			self.back_branches = []
+			for (addr, bytes, inst) in self.disasm.get_code():
+				if bytes:
+					match = self.BRANCH_RE.match(inst)
+					if match is not None:
+						target = int(match.group(1), 16)
+						if target <= addr:
+							self.back_branches.append((addr, target))
+		return self.back_branches
+
+	def get_hottest_loops(self, profile):
+		"""Get the list of the hottest loops as triples (iteration count,
+		start address, end address). A loop is a taken backward branch."""
+		loops = []
+		for (addr, target) in self.get_back_branches():
+			taken = profile.get_taken(addr)
+			if taken:
+				loops.append((taken, target, addr))
+		loops.sort(reverse=True)
+		return loops[:self.LOOP_COUNT]
+
+	def get_heat(self, i):
+		"""Get the heat of row i as a pair (count, level class) from the
+		profile of the last update."""
+		if self.profile is None or self.top == 0:
+			return (0, "")
+		(addr, bytes, _) = self.disasm.get_code()[i]
+		if not bytes:
+			return (0, "")
+		count = self.profile.get_count(addr)
+		if count == 0:
+			return (0, "")
+		level = 1 + (self.HEAT_LEVELS - 1) * count // self.top
+		return (count, f"disasm-heat-{level}")
+
+	def clear_heat(self):
+		"""Remove the heat column and the summary of hottest loops."""
+		self.profile = None
+		self.top = 0
+		if self.heat or self.loops:
+			rows = list(self.heat)
+			self.call("disasm_set_heat", {
+				"id": self.get_id(),
+				"rows": rows,
+				"counts": [""] * len(rows),
+				"levels": [""] * len(rows),
+				"loops": ""
+			})
+			self.heat = {}
+			self.loops = ""
+
+	def update_profile(self, sim):
+		"""Update the heat column and the summary of hottest loops. Only the
+		rendered rows are examined: the other rows get their heat when they
+		are rendered."""
+		profile = sim.get_profile()
+		if profile is None:
+			self.clear_heat()
+			return
+		self.profile = profile
+		self.top = profile.get_max()
+		rows = []
+		counts = []
+		levels = []
+		(first, last) = self.window
+		for i in range(first, last):
+			heat = self.get_heat(i)
+			if self.heat.get(i, (0, "")) != heat:
+				rows.append(i)
+				counts.append(str(heat[0]) if heat[0] else "")
+				levels.append(heat[1])
+				if heat[0]:
+					self.heat[i] = heat
+				else:
+					del self.heat[i]
+		loops = ", ".join(
+			f"<b>{self.get_label(start)}</b> ({start:08x}-{end:08x}): {count}"
+			for (count, start, end) in self.get_hottest_loops(profile))
+		if loops:
+			loops = "Hottest loops: " + loops
+		if loops == self.loops:
+			loops = None
+		else:
+			self.loops = loops
+		if rows or loops is not None:
+			self.call("disasm_set_heat", {
+				"id": self.get_id(),
+				"rows": rows,
+				"counts": counts,
+				"levels": levels,
+				"loops": loops
+			})
 
 	def on_begin(self, session):
 		self.session = session
@@ -183,39 +560,28 @@ function disasm_single_click(disasm, event) {
 		self.session = None
 		session.get_breakpoints().remove_observer(self)
 		session.get_current_addr().remove_observer(self)
-		self.update_disasm = False
 
 	def on_compiled(self, session):
-		self.disasm = None
-		self.update_disasm = True
-		self.selected = None
-		if self.is_shown():
-			self.on_show()
+		try:
+			self.patch_disasm(session.get_project().get_disasm())
+		except bass.DisassemblyException:
+			self.set_disasm(None)
 
 	def on_show(self):
 		orc.Component.on_show(self)
-		if self.update_disasm:
-			self.update_disasm = False
-			try:
-				self.set_disasm(self.session.get_project().get_disasm())
-			except bass.DisassemblyException:
-				self.disasm = None
 		if self.sim and self.disasm:
 			self.set_pc(self.sim.get_pc())
+			self.update_profile(self.sim)
 
 	def enable_breakpoint(self, addr):
-		try:
-			i = self.map[addr]
-			self.add_class(self.BREAKPOINT, f"{self.get_id()}-body", nth=i+1)
-		except KeyError:
-			pass
+		i = self.disasm.row_of(addr)
+		if i is not None:
+			self.set_row_class(i, self.BREAKPOINT, True)
 
 	def disable_breakpoint(self, addr):
-		try:
-			i = self.map[addr]
-			self.remove_class(self.BREAKPOINT, f"{self.get_id()}-body", nth=i+1)
-		except KeyError:
-			pass
+		i = self.disasm.row_of(addr)
+		if i is not None:
+			self.set_row_class(i, self.BREAKPOINT, False)
 
 	def on_sim_start(self, session, sim):
 		self.sim = sim
@@ -226,9 +592,10 @@ function disasm_single_click(disasm, event) {
 		self.sim = None
 		self.set_pc(None)
 
-	def on_sim_update(self, session, sim):
-		if self.is_shown() and self.disasm:
+	def on_sim_update(self, session, sim, changes):
+		if self.is_shown() and self.disasm and changes.pc_moved:
 			self.set_pc(sim.get_pc())
+			self.update_profile(sim)
 
 	def on_add(self, set, item):
 		if self.disasm:
@@ -244,14 +611,17 @@ function disasm_single_click(disasm, event) {
 
 	def receive(self, msg, handler):
 		if msg["action"] == "bp":
-			addr = self.disasm.get_code()[msg["index"]][0]
+			addr = self.disasm.get_address(msg["index"])
 			if addr not in self.session.get_breakpoints():
 				self.session.get_breakpoints().add(addr)
 			else:
 				self.session.get_breakpoints().remove(addr)
 		elif msg["action"] == "select":
-			addr = self.disasm.get_code()[msg["index"]][0]
+			addr = self.disasm.get_address(msg["index"])
 			self.session.get_current_addr().set(addr)
+		elif msg["action"] == "window":
+			if self.disasm is not None:
+				self.set_window(int(msg["first"]), int(msg["last"]))
 		else:
 			orc.Component.receive(self, msg, handler)
 
@@ -260,9 +630,9 @@ function disasm_single_click(disasm, event) {
 			if ~subject is None:
 				self.deselect()
 			else:
-				try:
-					i = self.map[~subject]
+				i = self.disasm.row_of(~subject)
+				if i is not None:
 					self.select(i)
-				except KeyError:
+				else:
 					self.deselect()
 
@@ -0,0 +1,324 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Reader for the DWARF line table (.debug_line section, DWARF 2 to 5)
+of ELF files."""
+
+import bisect
+import os.path
+import struct
+
+from bass import elf
+
+# standard opcodes
+DW_LNS_copy = 1
+DW_LNS_advance_pc = 2
+DW_LNS_advance_line = 3
+DW_LNS_set_file = 4
+DW_LNS_negate_stmt = 6
+DW_LNS_const_add_pc = 8
+DW_LNS_fixed_advance_pc = 9
+
+# extended opcodes
+DW_LNE_end_sequence = 1
+DW_LNE_set_address = 2
+DW_LNE_define_file = 3
+
+# DWARF 5 entry formats
+DW_LNCT_path = 1
+DW_LNCT_directory_index = 2
+DW_FORM_block = 0x09
+DW_FORM_data1 = 0x0b
+DW_FORM_data2 = 0x05
+DW_FORM_data4 = 0x06
+DW_FORM_data8 = 0x07
+DW_FORM_data16 = 0x1e
+DW_FORM_string = 0x08
+DW_FORM_strp = 0x0e
+DW_FORM_udata = 0x0f
+DW_FORM_line_strp = 0x1f
+FIXED_FORMS = {
+	DW_FORM_data1: 1,
+	DW_FORM_data2: 2,
+	DW_FORM_data4: 4,
+	DW_FORM_data8: 8,
+	DW_FORM_data16: 16
+}
+
+
+class LineTable:
+	"""Table of the source lines of a program. rows is a list of triples
+	(address, file name, line) where file name is None for the end of a
+	sequence of instructions. Files are designed by their base name.
+	The table is indexed in both directions:
+	* find() gives the line of an address,
+	* find_address() gives the first address of a line."""
+
+	def __init__(self, rows=()):
+		rows = sorted(rows, key=lambda row: (row[0], row[1] is not None))
+		self.addrs = []
+		self.lines = []
+		for (addr, file, line) in rows:
+			if self.addrs and self.addrs[-1] == addr:
+				self.lines[-1] = None if file is None else (file, line)
+			else:
+				self.addrs.append(addr)
+				self.lines.append(None if file is None else (file, line))
+		self.firsts = {}			# (file, line) -> lowest address
+		for (addr, pos) in zip(self.addrs, self.lines):
+			if pos is not None and pos not in self.firsts:
+				self.firsts[pos] = addr
+		self.file_lines = {}		# file -> sorted lines with code
+		for (file, line) in self.firsts:
+			self.file_lines.setdefault(file, []).append(line)
+		for lines in self.file_lines.values():
+			lines.sort()
+
+	def is_empty(self):
+		"""Test if the table is empty."""
+		return not self.addrs
+
+	def find(self, addr):
+		"""Get the position of the instruction at addr as a pair (file, line)
+		or None."""
+		i = bisect.bisect_right(self.addrs, addr) - 1
+		if i < 0:
+			return None
+		else:
+			return self.lines[i]
+
+	def find_address(self, file, line):
+		"""Get the first address of the given line of the file. If the line
+		has no code, use the next line with code. Return None if there is
+		no such line."""
+		lines = self.file_lines.get(file)
+		if lines is None:
+			return None
+		i = bisect.bisect_left(lines, line)
+		if i >= len(lines):
+			return None
+		return self.firsts[(file, lines[i])]
+
+
+class Reader:
+	"""Sequential reader of bytes of an ELF file."""
+
+	def __init__(self, file, data, offset=0):
+		self.file = file
+		self.data = data
+		self.offset = offset
+		self.order = "<" if file.is_little_endian() else ">"
+
+	def unpack(self, fmt):
+		"""Read fixed-size values."""
+		try:
+			res = struct.unpack_from(self.order + fmt, self.data, self.offset)
+		except struct.error as e:
+			raise elf.ELFException(f"{self.file.path}: truncated debugging information") from e
+		self.offset += struct.calcsize(self.order + fmt)
+		return res
+
+	def u8(self):
+		"""Read an unsigned byte."""
+		return self.unpack("B")[0]
+
+	def uleb(self):
+		"""Read an unsigned LEB128."""
+		res = 0
+		shift = 0
+		while True:
+			b = self.u8()
+			res |= (b & 0x7f) << shift
+			shift += 7
+			if not b & 0x80:
+				return res
+
+	def sleb(self):
+		"""Read a signed LEB128."""
+		res = 0
+		shift = 0
+		while True:
+			b = self.u8()
+			res |= (b & 0x7f) << shift
+			shift += 7
+			if not b & 0x80:
+				if b & 0x40:
+					res -= 1 << shift
+				return res
+
+	def string(self):
+		"""Read a null-terminated string."""
+		end = self.data.find(b"\0", self.offset)
+		if end < 0:
+			raise elf.ELFException(f"{self.file.path}: truncated debugging information")
+		res = self.data[self.offset:end].decode("UTF8", errors="replace")
+		self.offset = end + 1
+		return res
+
+	def offset_value(self, size):
+		"""Read an offset of the given size (4 or 8)."""
+		return self.unpack("I" if size == 4 else "Q")[0]
+
+
+def section_string(file, name, offset):
+	"""Get the string at offset in the string section of the given name."""
+	sect = file.get_section(name)
+	if sect is None:
+		raise elf.ELFException(f"{file.path}: no {name} section")
+	return Reader(file, file.get_section_data(sect), offset).string()
+
+def read_entries(inp, file, offset_size):
+	"""Read a DWARF 5 list of directory or file entries as a list of pairs
+	(path, directory index)."""
+	formats = [(inp.uleb(), inp.uleb()) for _ in range(inp.u8())]
+	entries = []
+	for _ in range(inp.uleb()):
+		path = ""
+		directory = 0
+		for (content, form) in formats:
+			if form == DW_FORM_string:
+				value = inp.string()
+			elif form == DW_FORM_line_strp:
+				value = section_string(file, ".debug_line_str", inp.offset_value(offset_size))
+			elif form == DW_FORM_strp:
+				value = section_string(file, ".debug_str", inp.offset_value(offset_size))
+			elif form == DW_FORM_udata:
+				value = inp.uleb()
+			elif form == DW_FORM_block:
+				inp.offset += inp.uleb()
+				value = None
+			elif form in FIXED_FORMS:
+				size = FIXED_FORMS[form]
+				value = int.from_bytes(inp.data[inp.offset:inp.offset + size],
+					"little" if inp.order == "<" else "big")
+				inp.offset += size
+			else:
+				raise elf.ELFException(f"{file.path}: unsupported DWARF form {form}")
+			if content == DW_LNCT_path:
+				path = value
+			elif content == DW_LNCT_directory_index:
+				directory = value
+		entries.append((path, directory))
+	return entries
+
+def read_unit(inp, file, rows):
+	"""Read the line program unit at the current position of inp and add
+	its rows to rows."""
+	(length, ) = inp.unpack("I")
+	offset_size = 4
+	if length == 0xffffffff:
+		(length, ) = inp.unpack("Q")
+		offset_size = 8
+	end = inp.offset + length
+	(version, ) = inp.unpack("H")
+	if version < 2 or version > 5:
+		raise elf.ELFException(f"{file.path}: unsupported DWARF version {version}")
+	if version >= 5:
+		inp.unpack("BB")
+	header_length = inp.offset_value(offset_size)
+	program = inp.offset + header_length
+	min_inst = inp.u8()
+	if version >= 4:
+		inp.u8()
+	default_is_stmt = inp.u8() != 0
+	(line_base, line_range, opcode_base) = inp.unpack("bBB")
+	lengths = [0] + [inp.u8() for _ in range(opcode_base - 1)]
+
+	# read file names
+	if version >= 5:
+		read_entries(inp, file, offset_size)
+		files = [os.path.basename(path) for (path, _) in read_entries(inp, file, offset_size)]
+	else:
+		while inp.string() != "":
+			pass
+		files = [None]
+		while True:
+			name = inp.string()
+			if name == "":
+				break
+			inp.uleb()
+			inp.uleb()
+			inp.uleb()
+			files.append(os.path.basename(name))
+
+	def file_name(index):
+		return files[index] if 0 <= index < len(files) else None
+
+	# run the line program
+	inp.offset = program
+	address = 0
+	index = 1
+	line = 1
+	is_stmt = default_is_stmt
+	while inp.offset < end:
+		op = inp.u8()
+		if op >= opcode_base:
+			adj = op - opcode_base
+			address += (adj // line_range) * min_inst
+			line += line_base + adj % line_range
+			if is_stmt:
+				rows.append((address, file_name(index), line))
+		elif op == 0:
+			size = inp.uleb()
+			after = inp.offset + size
+			sub = inp.u8()
+			if sub == DW_LNE_end_sequence:
+				rows.append((address, None, 0))
+				address = 0
+				index = 1
+				line = 1
+				is_stmt = default_is_stmt
+			elif sub == DW_LNE_set_address:
+				address = int.from_bytes(inp.data[inp.offset:after],
+					"little" if inp.order == "<" else "big")
+			elif sub == DW_LNE_define_file:
+				files.append(os.path.basename(inp.string()))
+			inp.offset = after
+		elif op == DW_LNS_copy:
+			if is_stmt:
+				rows.append((address, file_name(index), line))
+		elif op == DW_LNS_advance_pc:
+			address += inp.uleb() * min_inst
+		elif op == DW_LNS_advance_line:
+			line += inp.sleb()
+		elif op == DW_LNS_set_file:
+			index = inp.uleb()
+		elif op == DW_LNS_negate_stmt:
+			is_stmt = not is_stmt
+		elif op == DW_LNS_const_add_pc:
+			address += ((255 - opcode_base) // line_range) * min_inst
+		elif op == DW_LNS_fixed_advance_pc:
+			address += inp.unpack("H")[0]
+		else:
+			for _ in range(lengths[op]):
+				inp.uleb()
+	inp.offset = end
+
+def read_lines(file):
+	"""Build the LineTable of the passed elf.File. The table is empty if the
+	file has no .debug_line section. Raises elf.ELFException if the
+	section cannot be read."""
+	sect = file.get_section(".debug_line")
+	if sect is None:
+		return LineTable()
+	data = file.get_section_data(sect)
+	inp = Reader(file, data)
+	rows = []
+	while inp.offset < len(data):
+		read_unit(inp, file, rows)
+	return LineTable(rows)
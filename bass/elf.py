@@ -0,0 +1,231 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Reader for ELF 32-bit executable files."""
+
+import struct
+
+from bass import MessageException
+
+PT_LOAD = 1
+PF_X = 1
+SHT_SYMTAB = 2
+SHF_EXECINSTR = 4
+STT_SECTION = 3
+STT_FILE = 4
+
+
+class ELFException(MessageException):
+	"""Exception raised when an ELF file cannot be read."""
+
+	def __init__(self, msg):
+		MessageException.__init__(self, msg)
+
+
+class Segment:
+	"""Segment (program header) of an ELF file."""
+
+	def __init__(self, type, offset, vaddr, filesz, memsz, flags):
+		self.type = type
+		self.offset = offset
+		self.vaddr = vaddr
+		self.filesz = filesz
+		self.memsz = memsz
+		self.flags = flags
+
+	def is_loaded(self):
+		"""Test if the segment is loaded in memory."""
+		return self.type == PT_LOAD and self.memsz != 0
+
+	def is_executable(self):
+		"""Test if the segment contains code."""
+		return self.is_loaded() and (self.flags & PF_X) != 0
+
+
+class Section:
+	"""Section of an ELF file."""
+
+	def __init__(self, name, type, flags, addr, offset, size, link, entsize):
+		self.name = name
+		self.type = type
+		self.flags = flags
+		self.addr = addr
+		self.offset = offset
+		self.size = size
+		self.link = link
+		self.entsize = entsize
+
+	def get_name(self):
+		"""Get the name of the section."""
+		return self.name
+
+	def is_executable(self):
+		"""Test if the section contains code."""
+		return (self.flags & SHF_EXECINSTR) != 0 and self.size != 0
+
+
+class Symbol:
+	"""Symbol of an ELF file. section is the index of the section it
+	belongs to."""
+
+	def __init__(self, name, value, size, type, section):
+		self.name = name
+		self.value = value
+		self.size = size
+		self.type = type
+		self.section = section
+
+	def get_name(self):
+		"""Get the name of the symbol."""
+		return self.name
+
+	def get_value(self):
+		"""Get the value (address) of the symbol."""
+		return self.value
+
+	def is_mapping(self):
+		"""Test if the symbol is an ARM mapping symbol ($a, $d, $t)."""
+		return self.name[:1] == "$"
+
+	def is_label(self):
+		"""Test if the symbol names an address."""
+		return self.name != "" and self.section != 0 \
+			and self.type not in (STT_SECTION, STT_FILE) \
+			and not self.is_mapping()
+
+
+class File:
+	"""An ELF 32-bit file. Raises ELFException if the file cannot be
+	read or is not an ELF 32-bit file."""
+
+	def __init__(self, path):
+		self.path = path
+		try:
+			with open(path, "rb") as inp:
+				self.data = inp.read()
+		except OSError as e:
+			raise ELFException(f"cannot read {path}: {e}") from e
+		self.order = "<"
+		self.entry = None
+		self.segments = []
+		self.sections = []
+		self.symbols = None
+		self.parse()
+
+	def unpack(self, fmt, offset):
+		"""Unpack data from the file at the given offset."""
+		try:
+			return struct.unpack_from(self.order + fmt, self.data, offset)
+		except struct.error as e:
+			raise ELFException(f"{self.path} is truncated") from e
+
+	def parse(self):
+		"""Parse the header and the program headers."""
+		if self.data[:4] != b"\x7fELF":
+			raise ELFException(f"{self.path} is not an ELF file")
+		if self.data[4] != 1:
+			raise ELFException(f"{self.path} is not a 32-bit ELF file")
+		self.order = "<" if self.data[5] == 1 else ">"
+		(self.entry, phoff, shoff, _, _, phentsize, phnum,
+			shentsize, shnum, shstrndx) = self.unpack("IIIIHHHHHH", 24)
+		for i in range(phnum):
+			(type, offset, vaddr, _, filesz, memsz, flags, _) = \
+				self.unpack("IIIIIIII", phoff + i*phentsize)
+			self.segments.append(
+				Segment(type, offset, vaddr, filesz, memsz, flags))
+		headers = [self.unpack("IIIIIIIIII", shoff + i*shentsize)
+			for i in range(shnum)]
+		names = headers[shstrndx] if shstrndx < shnum else None
+		for (name, type, flags, addr, offset, size, link, _, _, entsize) in headers:
+			if names is not None:
+				name = self.get_string(names[4] + name)
+			else:
+				name = ""
+			self.sections.append(
+				Section(name, type, flags, addr, offset, size, link, entsize))
+
+	def get_string(self, offset):
+		"""Get the null-terminated string at the given offset."""
+		end = self.data.find(b"\0", offset)
+		if end < 0:
+			raise ELFException(f"{self.path} is truncated")
+		return self.data[offset:end].decode("UTF8", errors="replace")
+
+	def get_entry(self):
+		"""Get the entry point address."""
+		return self.entry
+
+	def get_segments(self):
+		"""Get the segments of the file."""
+		return self.segments
+
+	def get_pages(self, size):
+		"""Get the sorted list of addresses of the memory pages of the given
+		size covered by the loaded segments."""
+		pages = set()
+		for seg in self.segments:
+			if seg.is_loaded():
+				addr = seg.vaddr & ~(size - 1)
+				while addr < seg.vaddr + seg.memsz:
+					pages.add(addr)
+					addr += size
+		return sorted(pages)
+
+	def get_code_range(self):
+		"""Get the range (start, end) of addresses covered by the executable
+		segments. Return None if there is no executable segment."""
+		segs = [seg for seg in self.segments if seg.is_executable()]
+		if not segs:
+			return None
+		return (min(seg.vaddr for seg in segs),
+			max(seg.vaddr + seg.memsz for seg in segs))
+
+	def get_sections(self):
+		"""Get the sections of the file."""
+		return self.sections
+
+	def get_section(self, name):
+		"""Get the section with the given name or None."""
+		for sect in self.sections:
+			if sect.name == name:
+				return sect
+		return None
+
+	def get_section_data(self, section):
+		"""Get the content of a section as bytes."""
+		return self.data[section.offset:section.offset + section.size]
+
+	def get_symbols(self):
+		"""Get the symbols of the file."""
+		if self.symbols is None:
+			self.symbols = []
+			for sect in self.sections:
+				if sect.type != SHT_SYMTAB:
+					continue
+				strings = self.sections[sect.link].offset
+				size = sect.entsize or 16
+				for offset in range(sect.offset, sect.offset + sect.size, size):
+					(name, value, size_, info, _, shndx) = \
+						self.unpack("IIIBBH", offset)
+					self.symbols.append(Symbol(self.get_string(strings + name),
+						value, size_, info & 0xf, shndx))
+		return self.symbols
+
+	def is_little_endian(self):
+		"""Test if the file is in little-endian."""
+		return self.order == "<"
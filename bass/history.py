@@ -0,0 +1,164 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Execution history supporting reverse execution."""
+
+import bisect
+
+from bass.arch import Run
+
+
+class History:
+	"""Records sparse checkpoints of a simulation to be able to go back in
+	time: the state at any date is obtained by restoring the closest previous
+	checkpoint and replaying the execution up to the date.
+
+	A checkpoint is taken each period (in simulation date) and the total size
+	of checkpoints is kept under capacity (in bytes): when it is exceeded,
+	every other checkpoint is dropped and the period is doubled. To bound
+	the replay time, the period does not grow beyond MAX_PERIOD_FACTOR times
+	the initial period: the oldest checkpoints are dropped instead."""
+
+	MAX_PERIOD_FACTOR = 64
+
+	def __init__(self, sim, period, capacity):
+		self.sim = sim
+		self.base_period = period
+		self.max_period = period * self.MAX_PERIOD_FACTOR
+		self.capacity = capacity
+		self.cps = []
+		self.dates = []
+		self.size = 0
+		self.period = period
+		self.next_date = 0
+		self.reset()
+
+	def reset(self):
+		"""Reset the history to the initial state of the simulator."""
+		initial = self.sim.get_initial()
+		self.cps = [initial]
+		self.dates = [initial.get_date()]
+		self.size = initial.get_size()
+		self.period = self.base_period
+		self.next_date = initial.get_date() + self.period
+
+	def record(self):
+		"""Called after an execution to record a checkpoint if required."""
+		date = self.sim.get_date()
+		if date >= self.next_date:
+			cp = self.sim.checkpoint()
+			self.cps.append(cp)
+			self.dates.append(date)
+			self.size += cp.get_size()
+			self.next_date = date + self.period
+			while self.size > self.capacity and len(self.cps) > 2:
+				if self.period < self.max_period:
+					self.thin()
+				else:
+					self.drop_oldest()
+
+	def thin(self):
+		"""Remove every other checkpoint (keeping the initial and the last ones)
+		and double the period."""
+		rest = self.cps[1:][::-1][::2][::-1]
+		self.cps = self.cps[:1] + rest
+		self.dates = [cp.get_date() for cp in self.cps]
+		self.size = sum(cp.get_size() for cp in self.cps)
+		self.period *= 2
+
+	def drop_oldest(self):
+		"""Remove the oldest checkpoint (except the initial one)."""
+		self.size -= self.cps[1].get_size()
+		del self.cps[1]
+		del self.dates[1]
+
+	def truncate(self, date):
+		"""Remove checkpoints after the given date."""
+		i = bisect.bisect_right(self.dates, date)
+		for cp in self.cps[i:]:
+			self.size -= cp.get_size()
+		del self.cps[i:]
+		del self.dates[i:]
+		self.next_date = self.dates[-1] + self.period
+
+	def find(self, date):
+		"""Find the index of the closest checkpoint before or at date."""
+		return max(bisect.bisect_right(self.dates, date) - 1, 0)
+
+	def goto(self, date):
+		"""Put back the simulator at the given date (that must be in the
+		past)."""
+		self.sim.restore(self.cps[self.find(date)])
+		while self.sim.get_date() < date:
+			self.sim.skip(date - self.sim.get_date())
+		self.truncate(date)
+
+	def can_go_back(self):
+		"""Test if the simulator can go back in time."""
+		return self.sim.get_date() > self.dates[0]
+
+	def step_back(self):
+		"""Go back to the previous instruction."""
+		date = self.sim.get_date()
+		if date <= self.dates[0]:
+			return
+		self.goto(date - 1)
+		if self.sim.get_date() < date:
+			return
+
+		# the last instruction lasted several cycles: look for its date
+		self.sim.restore(self.cps[self.find(date - 1)])
+		prev = self.sim.get_date()
+		while self.sim.get_date() < date:
+			prev = self.sim.get_date()
+			self.sim.step()
+		self.goto(prev)
+
+	def run_back(self, is_break):
+		"""Go back to the last date the simulator has stopped on a breakpoint.
+		is_break is a function taking a PC and returning True if it is a
+		breakpoint. If no breakpoint is found, go back to the initial
+		checkpoint. The replay does not change the hit counters of the
+		breakpoints, the profile and the trace."""
+		self.sim.save_counters()
+		try:
+			self.find_break(is_break)
+		finally:
+			self.sim.restore_counters()
+
+	def find_break(self, is_break):
+		"""Implementation of run_back()."""
+		end = self.sim.get_date()
+		i = self.find(end - 1)
+		while i >= 0:
+			self.sim.restore(self.cps[i])
+			last = None
+			if self.sim.get_date() < end and is_break(self.sim.get_pc()):
+				last = self.sim.get_date()
+			while self.sim.get_date() < end:
+				(res, count) = self.sim.run_batch(end - self.sim.get_date())
+				if count == 0:
+					break
+				if res != Run.OK and self.sim.get_date() < end:
+					last = self.sim.get_date()
+			if last is not None:
+				self.goto(last)
+				return
+			end = self.dates[i]
+			i -= 1
+		self.goto(self.dates[0])
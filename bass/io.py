@@ -33,8 +33,8 @@ class Pane(Display, ApplicationPane):
 			if self.board:
 				self.install(self.board)
 
-	def on_sim_update(self, session, sim):
-		if self.board:
+	def on_sim_update(self, session, sim, changes):
+		if self.board and changes.io:
 			self.board.update_input()
 
 	def on_sim_release(self, session, sim):
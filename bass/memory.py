@@ -1,5 +1,7 @@
 """Memory display pane."""
 
+import struct
+
 import orchid as orc
 from orchid import not_null
 from orchid.util import Buffer
@@ -93,18 +95,23 @@ ADDRESS_TYPE = AddressType()
 
 
 class DisplayType:
-	"""Type of display for data in memory."""
+	"""Type of display for data in memory. Code is the struct format
+	character used to decode the memory."""
 
-	def __init__(self, label, size, load=None, display=None, clazz=None):
+	def __init__(self, label, size, code, display=None, clazz=None):
 		self.label = label
 		self.size = size
-		self.load = load
+		self.code = code
 		self.display = display
 		self.clazz = clazz
 
 	def __str__(self):
 		return self.label
 
+	def decode(self, block):
+		"""Decode a block of memory (bytes) as a tuple of values."""
+		return struct.unpack(f"<{len(block)//self.size}{self.code}", block)
+
 
 class Displays:
 	"""Displays for the memory."""
@@ -116,34 +123,6 @@ class Displays:
 		32: "\u2423"
 	}
 
-	@staticmethod
-	def load_byte(sim, addr):
-		return sim.get_byte(addr)
-
-	@staticmethod
-	def load_s16(sim, addr):
-		data =sim.get_half(addr)
-		if data < 0x8000:
-			return data
-		else:
-			return -(0x10000 - data)
-
-	@staticmethod
-	def load_u16(sim, addr):
-		return sim.get_half(addr)
-
-	@staticmethod
-	def load_s32(sim, addr):
-		data =sim.get_word(addr)
-		if data < 0x80000000:
-			return data
-		else:
-			return -(0x100000000 - data)
-
-	@staticmethod
-	def load_u32(sim, addr):
-		return sim.get_word(addr)
-
 	@staticmethod
 	def display_byte(x):
 		return f"{x:02x}"
@@ -167,14 +146,14 @@ class Displays:
 			return chr(x)
 
 	LIST = [
-		DisplayType("Byte", 1, load=load_byte, display=display_byte),
-		DisplayType("Signed 16b", 2, load=load_s16, display=str, clazz="bass-16"),
-		DisplayType("Unsign. 16b", 2, load=load_u16, display=str, clazz="bass-16"),
-		DisplayType("Hexa. 16b", 2, load=load_u16, display=display_hex16),
-		DisplayType("Signed 32b", 4, load=load_s32, display=str, clazz="bass-32"),
-		DisplayType("Unsign. 32b", 4, load=load_u32, display=str, clazz="bass-32"),
-		DisplayType("Hexa. 32b", 4, load=load_u32, display=display_hex32),
-		DisplayType("Character", 1, load=load_byte, display=display_char)
+		DisplayType("Byte", 1, "B", display=display_byte),
+		DisplayType("Signed 16b", 2, "h", display=str, clazz="bass-16"),
+		DisplayType("Unsign. 16b", 2, "H", display=str, clazz="bass-16"),
+		DisplayType("Hexa. 16b", 2, "H", display=display_hex16),
+		DisplayType("Signed 32b", 4, "i", display=str, clazz="bass-32"),
+		DisplayType("Unsign. 32b", 4, "I", display=str, clazz="bass-32"),
+		DisplayType("Hexa. 32b", 4, "I", display=display_hex32),
+		DisplayType("Character", 1, "B", display=display_char)
 	]
 
 
@@ -257,15 +236,17 @@ function bass_memory_update(msg) {
 		# cleanup old type if any
 		if self.mem is not None and self.type.clazz is not None:
 			self.remove_class(self.type.clazz)
+		self.untrack()
 
 		# read the memory
 		self.base = base & 0xfffffff0
 		self.size = (((base + size*type.size + 15) & 0xfffffff0) - self.base) // type.size
-		self.mem = [0] * self.size
+		self.mem = (0,) * self.size
 		self.type = type
 		if type.clazz is not None:
 			self.add_class(type.clazz)
 		self.target = (base - self.base) // type.size
+		self.track()
 
 		# generate the content
 		self.gen_mem()
@@ -300,47 +281,63 @@ function bass_memory_update(msg) {
 			i += 16 // self.type.size
 		out.write('</tbody></table>')
 
+	def track(self):
+		"""Ask the simulator to track the changes of the displayed memory."""
+		if self.sim is not None and self.mem is not None:
+			self.sim.track_block(self.base, self.size * self.type.size)
+
+	def untrack(self):
+		"""Stop the tracking of the displayed memory."""
+		if self.sim is not None and self.mem is not None:
+			self.sim.untrack_block(self.base, self.size * self.type.size)
+
+	def read_mem(self):
+		"""Read the displayed memory from the simulator as a tuple of values."""
+		return self.type.decode(
+			self.sim.read_block(self.base, self.size * self.type.size))
+
 	def gen_mem(self):
 		"""Update the memory from the simulator.."""
 		if self.mem is not None:
-			for i in range(self.size):
-				self.mem[i] = self.type.load(self.sim, self.base + i*self.type.size)
+			self.mem = self.read_mem()
 			buf = Buffer()
 			self.gen_content(buf)
 			self.set_content(str(buf))
 
-	def update_mem(self):
-		"""Udpate the memory."""
+	def update_mem(self, changes):
+		"""Udpate the memory from the content of the changes: the memory is
+		not read again."""
 		if self.mem is not None:
-			new_changes = set()
+			mem = self.mem
 			sets = []
-			vals = []
-			for i in range(self.size):
-				data = self.type.load(self.sim, self.base + i*self.type.size)
-				if data != self.mem[i]:
-					self.mem[i] = data
-					sets.append(i)
-					vals.append(self.type.display(data))
-					new_changes.add(i)
-			old_changes = self.changes - new_changes
-			resets = list(old_changes)
+			data = changes.get_block(self.base, self.size * self.type.size)
+			if data is not None:
+				vals = self.type.decode(data)
+				sets = [i for (i, (x, y)) in enumerate(zip(vals, mem)) if x != y]
+				mem = vals
+			self.mem = mem
+			new_changes = set(sets)
+			resets = list(self.changes - new_changes)
 			self.changes = new_changes
 			if sets or resets:
+				display = self.type.display
 				self.call("bass_memory_update", {
 					"id": f"{self.get_id()}-body",
 					"len": 16//self.type.size,
 					"sets": sets,
-					"vals": vals,
+					"vals": [display(mem[i]) for i in sets],
 					"resets": resets
 				})
 
 	def start_sim(self, sim):
 		"""Start a new simulation."""
 		self.sim = sim
+		self.track()
 		self.gen_mem()
 
 	def stop_sim(self):
 		"""Stop the simulation."""
+		self.untrack()
 		self.sim = None
 
 	def expands_horizontal(self):
@@ -368,14 +365,21 @@ class MemoryPane(orc.VGroup, bass.ApplicationPane):
 			enable=not_null(self.addr) & (self.size > 0),
 			icon=orc.Icon(orc.IconType.CHECK),
 			help="Display the configured chunk of memory")
+		watch_action = orc.Action(self.toggle_watch,
+			enable=not_null(self.addr) & (self.size > 0),
+			icon=orc.Icon("!eye"),
+			help="Stop (or not) the execution when the configured chunk of memory is written")
 		self.selector = orc.HGroup([
 				orc.Field(self.addr, place_holder="address", weight=2),
 				orc.Field(self.size, place_holder="size", weight=1),
 				orc.Select(self.type),
-				orc.Button(add_action)
+				orc.Button(add_action),
+				orc.Button(watch_action)
 			]).key(orc.Key.ENTER, add_action)
 		self.selector.disable()
 		self.mdisplay = MemoryDisplayer()
+		self.session = None
+		self.sim = None
 		orc.VGroup.__init__(self, [
 			self.selector,
 			self.mdisplay
@@ -394,17 +398,41 @@ class MemoryPane(orc.VGroup, bass.ApplicationPane):
 			~self.size,
 			Displays.LIST[~self.type])
 
+	def toggle_watch(self, interface):
+		"""Add or remove a watchpoint on the configured chunk of memory. The
+		session lock is taken as the simulation may be running."""
+		addr = ADDRESS_TYPE.address(~self.addr)
+		if addr is None or self.sim is None:
+			return
+		size = ~self.size
+		with self.session.sim_lock:
+			if (addr, size) in self.sim.get_watches():
+				self.sim.remove_watch(addr, size)
+				msg = f"Watchpoint removed from {addr:08x}-{addr + size - 1:08x}."
+			else:
+				self.sim.add_watch(addr, size)
+				msg = f"Watchpoint set on {addr:08x}-{addr + size - 1:08x}."
+		self.session.console.append(orc.text(orc.INFO, msg))
+
+	def on_begin(self, session):
+		self.session = session
+
+	def on_end(self, session):
+		self.session = None
+
 	def on_sim_start(self, session, sim):
+		self.sim = sim
 		self.selector.enable()
 		ADDRESS_TYPE.set_sim(sim)
 		self.mdisplay.start_sim(sim)
 
 	def on_sim_stop(self, session, sim):
+		self.sim = None
 		self.selector.disable()
 		self.mdisplay.stop_sim()
 
-	def on_sim_update(self, session, sim):
-		self.mdisplay.update_mem()
+	def on_sim_update(self, session, sim, changes):
+		self.mdisplay.update_mem(changes)
 
 	def on_compiled(self, session):
 		ADDRESS_TYPE.set_disasm(session.get_project().get_disasm())
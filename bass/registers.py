@@ -90,6 +90,18 @@ table.register-pane tr td:nth-child(2) {
 	min-width: 4em;
 }
 
+""",
+	script = """
+function bass_register_update(msg) {
+	let rows = document.getElementById(msg.id).rows;
+	for(let i = 0; i < msg.sets.length; i++) {
+		let tr = rows[msg.sets[i]];
+		tr.classList.add("error-text");
+		tr.cells[1].innerText = msg.vals[i];
+	}
+	for(let i = 0; i < msg.resets.length; i++)
+		rows[msg.resets[i]].classList.remove("error-text");
+}
 """
 )
 
@@ -102,6 +114,9 @@ table.register-pane tr td:nth-child(2) {
 		def on_cell_set(self, table, row, col, val):
 			assert col == 1
 			self.parent.sim.set_register(self.parent.regs[row].reg, val)
+			values = list(self.parent.values)
+			values[row] = val
+			self.parent.values = values
 
 	def __init__(self):
 
@@ -144,6 +159,7 @@ table.register-pane tr td:nth-child(2) {
 		self.regs = None
 		self.add_class("register-pane")
 		self.changed = []
+		self.values = []
 		self.sim = None
 		self.updater = RegisterPane.SimUpdater(self)
 
@@ -191,27 +207,29 @@ table.register-pane tr td:nth-child(2) {
 	def expands_vertical(self):
 		return True
 
-	def on_sim_update(self, session, sim):
-		changed = []
-		self.get_table_model().remove_observer(self.updater)
-		for (row, reg) in enumerate(self.regs):
-			val = sim.get_register(reg.reg)
-			if val != reg.value:
-				self.get_table_model().set_cell(row, 1, val)
-				changed.append(row)
-				if reg not in self.changed:
-					self.add_row_class(row, "error-text")
-			else:
-				if row in self.changed:
-					self.remove_row_class(row, "error-text")
-		self.get_table_model().add_observer(self.updater)
+	def on_sim_update(self, session, sim, changes):
+		values = changes.values
+		changed = sorted(row for row in changes.regs
+			if row < len(self.values) and values[row] != self.values[row])
+		if changed:
+			self.values = values
+		resets = [row for row in self.changed if row not in changed]
 		self.changed = changed
+		if changed or resets:
+			for row in changed:
+				self.regs[row].set_value(values[row])
+			self.call("bass_register_update", {
+				"id": self.get_id(),
+				"sets": changed,
+				"vals": [self.regs[row].format() for row in changed],
+				"resets": resets
+			})
 
 	def on_sim_start(self, session, sim):
 		#print("DEBUG: registers.sim_start")
 		self.sim = sim
-		for (row, reg) in enumerate(self.regs):
-			val = sim.get_register(reg.reg)
+		self.values = sim.get_registers()
+		for (row, val) in enumerate(self.values):
 			self.get_table_model().set_cell(row, 1, val)
 		self.get_table_model().add_observer(self.updater)
 		self.enable()
@@ -225,5 +243,7 @@ table.register-pane tr td:nth-child(2) {
 			self.get_table_model().set_cell(i, 1, None)
 		for i in self.changed:
 			self.remove_row_class(i, "error-text")
+		self.changed = []
+		self.values = []
 
 
@@ -0,0 +1,579 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Execution of simulators in worker processes.
+
+Each worker process hosts several simulators. A message sent to a worker
+is a tuple (tag, simulator identifier, operation, arguments, pages) and the
+answer is a tuple (tag, success, result, state, duration). For operations
+changing the simulator state, state is a tuple (PC, date, register values,
+pages) where pages gives the content of the memory pages listed in the
+message: this way, all the data required to update the display is obtained
+in the same round-trip as the execution of a quantum. duration is the time
+spent by the worker to perform the operation.
+
+The tag identifies the request an answer belongs to: several threads may
+send requests to the same worker without waiting for the answers of the
+others (the worker processes them in order)."""
+
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+
+from bass import arch, find_symbol
+
+
+# operations changing the state of the simulator
+STATE_OPS = {
+	"load", "reset", "restore", "step", "run_batch", "skip", "set_register",
+	"recycle"
+}
+
+# operations only querying or configuring the simulator
+QUERY_OPS = {
+	"set_breakpoint", "clear_breakpoint", "set_condition", "next_pc",
+	"checkpoint", "read_page", "enable_profile", "get_profile",
+	"get_profile_delta", "add_watch", "remove_watch", "get_watch_hit",
+	"enable_trace", "get_trace_length", "get_trace", "read_trace",
+	"enable_calls", "get_calls", "save_counters", "restore_counters"
+}
+
+
+class TemplateInfo:
+	"""Description of a template that can be passed to a worker process."""
+
+	def __init__(self, template):
+		self.name = template.get_name()
+		self.sim = template.sim
+		self.board = template.get_board_path() if template.has_board() else None
+
+	def get_name(self):
+		return self.name
+
+	def has_board(self):
+		return self.board is not None
+
+	def get_board_path(self):
+		return self.board
+
+
+def describe_arch(arch_):
+	"""Build a picklable description of the registers of an architecture."""
+	desc = []
+	for reg in arch_.get_registers():
+		if isinstance(reg, arch.CPSRegister):
+			kind = "cpsr"
+		elif isinstance(reg, arch.AddrRegister):
+			kind = "addr"
+		else:
+			kind = "reg"
+		desc.append((kind, reg.get_name(), reg.get_index(), reg.get_aliases()))
+	return (arch_.get_name(), desc)
+
+def get_state(sim, pages):
+	"""Get the state of the simulator to send back to the server."""
+	return (
+		sim.get_pc(),
+		sim.get_date(),
+		sim.get_registers(),
+		{addr: sim.read_page(addr) for addr in pages}
+	)
+
+def worker_main(conn):
+	"""Main loop of a worker process."""
+	sims = {}
+	while True:
+		try:
+			(tag, id, op, args, pages) = conn.recv()
+		except (EOFError, KeyboardInterrupt):
+			break
+		start = time.perf_counter()
+		try:
+			state = None
+			if op == "new":
+				cls = find_symbol(args[0].sim)
+				if cls is None:
+					raise arch.SimException(f"cannot find class '{args[0].sim}'")
+				sim = cls(args[0])
+				sims[id] = sim
+				result = (describe_arch(sim.get_arch()), sim.get_frequency())
+			elif op == "del":
+				sims.pop(id).release()
+				result = None
+			else:
+				sim = sims[id]
+				if op == "set_register":
+					(num, value) = args
+					sim.set_register(sim.get_arch().get_registers()[num], value)
+					result = None
+				elif op == "load":
+					sim.load(*args)
+					result = sim.get_initial()
+				elif op in STATE_OPS or op in QUERY_OPS:
+					result = getattr(sim, op)(*args)
+				else:
+					raise arch.SimException(f"unknown operation {op}")
+				if op in STATE_OPS:
+					state = get_state(sim, pages)
+			conn.send((tag, True, result, state, time.perf_counter() - start))
+		except arch.SimException as e:
+			conn.send((tag, False, str(e), None, time.perf_counter() - start))
+		except Exception as e:	# pylint: disable=broad-except
+			conn.send((tag, False, f"internal error: {type(e).__name__}: {e}", None,
+				time.perf_counter() - start))
+
+
+class Worker:
+	"""A worker process hosting simulators. Each time the process crashes
+	or is killed because it does not answer in time, the generation is
+	incremented and the process is restarted on next use.
+
+	The answers are read by a thread of the server that stores them by tag
+	until they are claimed by receive(): the lock is only held to send a
+	request or to look for an answer, never while the worker computes."""
+
+	CONTEXT = multiprocessing.get_context("spawn")
+
+	def __init__(self, timeout):
+		self.timeout = timeout
+		self.lock = threading.RLock()
+		self.cond = threading.Condition(self.lock)
+		self.process = None
+		self.conn = None
+		self.generation = 0
+		self.count = 0
+		self.tags = itertools.count()
+		self.answers = {}			# tag -> answer
+
+	def start(self):
+		"""Start the worker process if required. Must be called with the lock
+		taken."""
+		if self.process is None:
+			(self.conn, child) = self.CONTEXT.Pipe()
+			self.process = self.CONTEXT.Process(
+				target=worker_main, args=(child,), daemon=True)
+			self.process.start()
+			child.close()
+			threading.Thread(target=self.read,
+				args=(self.conn, self.generation), daemon=True).start()
+
+	def read(self, conn, generation):
+		"""Loop of the thread reading the answers of the process of the given
+		generation."""
+		while True:
+			try:
+				answer = conn.recv()
+			except (OSError, EOFError):
+				break
+			with self.cond:
+				self.answers[answer[0]] = answer[1:]
+				self.cond.notify_all()
+		conn.close()
+		with self.cond:
+			if self.generation == generation:
+				self.kill()
+
+	def kill(self):
+		"""Kill the worker process. Must be called with the lock taken."""
+		if self.process is not None:
+			self.process.kill()
+			self.process.join()
+			self.process = None
+			self.conn = None
+			self.generation += 1
+			self.answers.clear()
+			self.cond.notify_all()
+
+	def get_generation(self):
+		"""Get the current generation of the worker."""
+		with self.lock:
+			self.start()
+			return self.generation
+
+	def send(self, msg):
+		"""Send a message (without tag) to the worker. Return the ticket
+		to pass to receive() to get the answer."""
+		with self.lock:
+			self.start()
+			tag = next(self.tags)
+			try:
+				self.conn.send((tag, ) + msg)
+			except (OSError, EOFError) as e:
+				self.kill()
+				raise arch.SimException("simulator crashed!") from e
+			return (tag, self.generation)
+
+	def receive(self, ticket):
+		"""Wait for the answer of the request of the given ticket. Return a
+		tuple (tag, success, result, state, duration)."""
+		(tag, generation) = ticket
+		deadline = time.monotonic() + self.timeout
+		with self.cond:
+			while tag not in self.answers:
+				if self.generation != generation:
+					raise arch.SimException("simulator crashed!")
+				delay = deadline - time.monotonic()
+				if delay <= 0:
+					self.kill()
+					raise arch.SimException("simulator does not answer!")
+				self.cond.wait(delay)
+			return (tag, ) + self.answers.pop(tag)
+
+	def call(self, msg):
+		"""Send a message and wait for the answer."""
+		return self.receive(self.send(msg))
+
+
+class WorkerPool:
+	"""Pool of worker processes. Its size defaults to the number of cores."""
+
+	def __init__(self, size=0, timeout=10):
+		if size <= 0:
+			size = os.cpu_count() or 1
+		self.workers = [Worker(timeout) for _ in range(size)]
+		self.lock = threading.Lock()
+
+	def take(self):
+		"""Get the least loaded worker to host a new simulator."""
+		with self.lock:
+			worker = min(self.workers, key=lambda w: w.count)
+			worker.count += 1
+			return worker
+
+	def give_back(self, worker):
+		"""Called when a simulator of the worker is released."""
+		with self.lock:
+			worker.count -= 1
+
+	def stop(self):
+		"""Stop all workers."""
+		for worker in self.workers:
+			with worker.lock:
+				worker.kill()
+
+
+class RemoteArch(arch.Arch):
+	"""Architecture rebuilt from the description sent by a worker. The
+	handle of a register is its number in the register list."""
+
+	KINDS = {
+		"cpsr": lambda name, index, num, aliases:
+			arch.CPSRegister(name, index, handle=num, aliases=aliases),
+		"addr": lambda name, index, num, aliases:
+			arch.AddrRegister(name, index, handle=num, aliases=aliases),
+		"reg": lambda name, index, num, aliases:
+			arch.Register(name, index, handle=num, aliases=aliases)
+	}
+
+	def __init__(self, desc):
+		(self.name, regs) = desc
+		self.regs = []
+		self.map = {}
+		for (num, (kind, name, index, aliases)) in enumerate(regs):
+			reg = self.KINDS[kind](name, index, num, aliases)
+			self.regs.append(reg)
+			self.map[reg.get_name().upper()] = reg
+			for alias in aliases:
+				self.map[alias.upper()] = reg
+
+	def get_name(self):
+		return self.name
+
+	def get_registers(self):
+		return self.regs
+
+	def find_register(self, name):
+		try:
+			return self.map[name.upper()]
+		except KeyError:
+			return None
+
+
+class RemoteSimulator(arch.Simulator):
+	"""Simulator running in a worker process. The state of the simulator
+	(PC, date, registers and recently read memory pages) is cached and
+	refreshed by each operation changing the state."""
+
+	IDS = itertools.count()
+
+	def __init__(self, template, pool):
+		arch.Simulator.__init__(self, template)
+		self.pool = pool
+		self.worker = pool.take()
+		self.id = next(self.IDS)
+		self.arch = None
+		self.frequency = None
+		self.generation = None
+		self.path = None
+		self.breaks = set()
+		self.conditions = {}
+		self.trace_config = None
+		self.tracking_calls = False
+		self.pc = None
+		self.date = 0
+		self.regs = []
+		self.pages = {}
+		self.wanted = set()
+		self.last_wanted = ()
+		self.state_tag = -1
+		self.batch_time = 0
+		try:
+			self.create()
+		except arch.SimException:
+			self.pool.give_back(self.worker)
+			raise
+
+	def create(self):
+		"""Create the simulator in the worker."""
+		self.generation = self.worker.get_generation()
+		self.profile = None
+		(desc, self.frequency) = \
+			self.call("new", TemplateInfo(self.template), check=False)
+		if self.arch is None:
+			self.arch = RemoteArch(desc)
+
+	def prepare(self, op, args, check):
+		"""Prepare the message for an operation."""
+		if check and self.worker.generation != self.generation:
+			raise arch.SimException("simulator crashed: restart the simulation.")
+		if op in STATE_OPS:
+			pages = self.wanted if self.wanted else set(self.last_wanted)
+			pages = tuple(pages | self.tracked_pages)
+		else:
+			pages = ()
+		return (self.id, op, args, pages)
+
+	def process(self, msg, answer):
+		"""Process the answer to the given message and return the result.
+		The state is only recorded if it is more recent than the current
+		one (tags are increasing)."""
+		(tag, ok, result, state, _) = answer
+		if not ok:
+			raise arch.SimException(result)
+		if state is not None and tag > self.state_tag:
+			(self.pc, self.date, self.regs, self.pages) = state
+			self.state_tag = tag
+			self.last_wanted = msg[3]
+			self.wanted = set()
+		return result
+
+	def call(self, op, *args, check=True):
+		"""Call an operation of the remote simulator."""
+		msg = self.prepare(op, args, check)
+		return self.process(msg, self.worker.call(msg))
+
+	def start_batch(self, time, until=None):
+		msg = self.prepare("run_batch", (time, until), True)
+		self.batch_result = (msg, self.worker.send(msg))
+
+	def finish_batch(self):
+		(msg, ticket) = self.batch_result
+		answer = self.worker.receive(ticket)
+		self.batch_time = answer[4]
+		return self.process(msg, answer)
+
+	def get_batch_time(self):
+		return self.batch_time
+
+	def load(self, path):
+		if self.worker.generation != self.generation:
+			self.create()
+			for addr in self.breaks:
+				self.call("set_breakpoint", addr)
+			for (addr, (cond, hits)) in self.conditions.items():
+				self.call("set_condition", addr, cond, hits)
+			for (addr, size) in self.watches:
+				self.call("add_watch", addr, size)
+			if self.trace_config is not None:
+				self.call("enable_trace", *self.trace_config)
+			if self.tracking_calls:
+				self.call("enable_calls", True)
+			if self.profiling:
+				self.call("enable_profile", True)
+		self.path = path
+		self.initial = self.call("load", path)
+
+	def reset(self):
+		self.call("reset")
+
+	def release(self):
+		try:
+			if self.worker.generation == self.generation:
+				self.call("del")
+		except arch.SimException:
+			pass
+		self.pool.give_back(self.worker)
+
+	def recycle(self):
+		arch.Simulator.recycle(self)
+		self.breaks.clear()
+		self.conditions.clear()
+		self.trace_config = None
+		self.tracking_calls = False
+		self.path = None
+		self.call("recycle")
+
+	def set_breakpoint(self, addr):
+		self.breaks.add(addr)
+		self.call("set_breakpoint", addr)
+
+	def clear_breakpoint(self, addr):
+		self.breaks.discard(addr)
+		self.conditions.pop(addr, None)
+		self.call("clear_breakpoint", addr)
+
+	def set_condition(self, addr, cond, hits=1):
+		if cond is None and hits <= 1:
+			self.conditions.pop(addr, None)
+		else:
+			self.conditions[addr] = (cond, hits)
+		self.call("set_condition", addr, cond, hits)
+
+	def get_pc(self):
+		return self.pc
+
+	def next_pc(self):
+		return self.call("next_pc")
+
+	def step(self):
+		self.call("step")
+
+	def run_batch(self, time, until=None):
+		return self.call("run_batch", time, until)
+
+	def skip(self, time):
+		self.call("skip", time)
+
+	def add_watch(self, addr, size):
+		arch.Simulator.add_watch(self, addr, size)
+		self.call("add_watch", addr, size)
+
+	def remove_watch(self, addr, size):
+		arch.Simulator.remove_watch(self, addr, size)
+		self.call("remove_watch", addr, size)
+
+	def get_watch_hit(self):
+		return self.call("get_watch_hit")
+
+	def enable_trace(self, size, regs=False):
+		self.trace_config = (size, regs) if size > 0 else None
+		self.call("enable_trace", size, regs)
+
+	def get_trace_length(self):
+		return self.call("get_trace_length")
+
+	def get_trace(self, first, count):
+		return self.call("get_trace", first, count)
+
+	def read_trace(self, first, count):
+		return self.call("read_trace", first, count)
+
+	def save_counters(self):
+		self.call("save_counters")
+
+	def restore_counters(self):
+		self.call("restore_counters")
+
+	def enable_calls(self, enable=True):
+		self.tracking_calls = enable
+		self.call("enable_calls", enable)
+
+	def get_calls(self):
+		return self.call("get_calls")
+
+	def enable_profile(self, enable=True):
+		self.profiling = enable
+		self.profile = None
+		self.call("enable_profile", enable)
+
+	def get_profile(self):
+		"""The profile is a local copy updated with the changes of the
+		counters since the previous call."""
+		if not self.profiling:
+			return None
+		delta = self.call("get_profile_delta", self.profile is None)
+		if delta is None:
+			self.profile = None
+			return None
+		(base, size, changes) = delta
+		if self.profile is None or self.profile.base != base or self.profile.size != size:
+			self.profile = arch.Profile(base, base + size * arch.Profile.INST_SIZE)
+			(base, size, changes) = self.call("get_profile_delta", True)
+		for (i, count, taken) in changes:
+			self.profile.counts[i] = count
+			self.profile.taken[i] = taken
+		return self.profile
+
+	def checkpoint(self):
+		return self.call("checkpoint")
+
+	def restore(self, cp):
+		self.call("restore", cp)
+
+	def get_register(self, reg):
+		return self.regs[reg.get_handle()]
+
+	def get_registers(self):
+		return self.regs
+
+	def set_register(self, reg, value):
+		self.call("set_register", reg.get_handle(), value)
+
+	def get_arch(self):
+		return self.arch
+
+	def get_frequency(self):
+		return self.frequency
+
+	def get_date(self):
+		return self.date
+
+	def read_page(self, addr):
+		self.wanted.add(addr)
+		try:
+			return self.pages[addr]
+		except KeyError:
+			page = self.call("read_page", addr)
+			self.pages[addr] = page
+			return page
+
+	def read_block(self, addr, size):
+		mask = arch.PAGE_SIZE - 1
+		chunks = []
+		while size > 0:
+			offset = addr & mask
+			chunk = min(size, arch.PAGE_SIZE - offset)
+			chunks.append(self.read_page(addr & ~mask)[offset:offset + chunk])
+			addr += chunk
+			size -= chunk
+		return b"".join(chunks)
+
+	def read(self, addr, size):
+		"""Read size bytes at the given address as an unsigned integer."""
+		return int.from_bytes(self.read_block(addr, size), "little")
+
+	def get_byte(self, addr):
+		return self.read(addr, 1)
+
+	def get_half(self, addr):
+		return self.read(addr, 2)
+
+	def get_word(self, addr):
+		return self.read(addr, 4)
@@ -0,0 +1,168 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Scheduling of the simulation quanta."""
+
+import threading
+import time
+
+
+class QuantumController:
+	"""Computes the size (in instructions) of the simulation quanta from the
+	measured speed of the previous ones so that a quantum lasts the target
+	fraction of the period (in seconds). The size is kept between min and
+	max."""
+
+	ALPHA = 0.3		# weight of the last measure in the speed average
+
+	def __init__(self, period, target, min, max, initial):
+		self.period = period
+		self.target = target
+		self.min = min
+		self.max = max
+		self.ips = None
+		self.quantum = self.clamp(initial)
+
+	def clamp(self, quantum):
+		"""Bound the quantum size."""
+		return max(self.min, min(self.max, int(quantum)))
+
+	def get_quantum(self):
+		"""Get the size of the next quantum."""
+		return self.quantum
+
+	def get_quantum_for(self, duration):
+		"""Get the size of the next quantum if it must not last more than
+		duration seconds."""
+		if self.ips is None:
+			return self.quantum
+		else:
+			return self.clamp(min(self.quantum, self.ips * duration))
+
+	def get_ips(self):
+		"""Get the measured speed in instructions per second or None if no
+		measure has been done."""
+		return self.ips
+
+	def update(self, count, duration):
+		"""Update the controller after the execution of count instructions
+		in duration seconds."""
+		if count <= 0 or duration <= 0:
+			return
+		ips = count / duration
+		if self.ips is None:
+			self.ips = ips
+		else:
+			self.ips = (1 - self.ALPHA) * self.ips + self.ALPHA * ips
+		self.quantum = self.clamp(self.ips * self.period * self.target)
+
+
+class Scheduler:
+	"""Application-level scheduler running the simulation quanta of all
+	running jobs in one thread. Each period (in seconds), the jobs are run
+	round-robin and share a CPU budget (fraction of the period) according
+	to their weight. When there are too many jobs, their quanta shrink so
+	that the budget is not exceeded and the server remains responsive.
+
+	A job provides the following methods:
+	* get_weight() -- weight of the job,
+	* start_quantum(duration) -- start a quantum lasting at most duration
+	  seconds,
+	* end_quantum() -- wait for the end of the quantum.
+
+	Quanta of all jobs are started before waiting for their end so that
+	simulators running in worker processes run in parallel."""
+
+	def __init__(self, period, budget, weights, log):
+		self.period = period
+		self.budget = budget
+		self.weights = weights
+		self.log = log
+		self.jobs = []
+		self.cond = threading.Condition()
+		self.thread = None
+		self.load = 0
+
+	@staticmethod
+	def parse_weights(text):
+		"""Parse weights of the form GROUP:WEIGHT;GROUP:WEIGHT;..."""
+		weights = {}
+		for item in text.split(";"):
+			if item.strip():
+				(group, weight) = item.split(":")
+				weights[group.strip()] = float(weight)
+		return weights
+
+	def get_weight(self, groups):
+		"""Get the weight for a user belonging to the given groups."""
+		weights = [self.weights[g] for g in groups if g in self.weights]
+		if weights:
+			return max(weights)
+		else:
+			return 1.
+
+	def get_load(self):
+		"""Get the fraction of the last period used to simulate."""
+		return self.load
+
+	def is_overloaded(self):
+		"""Test if the simulation exceeds the budget."""
+		return self.load > self.budget
+
+	def add(self, job):
+		"""Add a job to schedule."""
+		with self.cond:
+			if job not in self.jobs:
+				self.jobs.append(job)
+			if self.thread is None:
+				self.thread = threading.Thread(target=self.run, daemon=True)
+				self.thread.start()
+			self.cond.notify()
+
+	def remove(self, job):
+		"""Remove a job from the scheduler."""
+		with self.cond:
+			if job in self.jobs:
+				self.jobs.remove(job)
+
+	def call(self, fun, *args):
+		"""Call a job function protecting the scheduler from its errors."""
+		try:
+			fun(*args)
+		except Exception as e:	# pylint: disable=broad-except
+			self.log(f"ERROR: scheduled job failed: {e}")
+
+	def run(self):
+		"""Main loop of the scheduler."""
+		while True:
+			with self.cond:
+				while not self.jobs:
+					self.cond.wait()
+				jobs = list(self.jobs)
+				self.jobs.append(self.jobs.pop(0))
+			start = time.perf_counter()
+			total = sum(job.get_weight() for job in jobs)
+			budget = self.period * self.budget
+			for job in jobs:
+				self.call(job.start_quantum, budget * job.get_weight() / total)
+			for job in jobs:
+				self.call(job.end_quantum)
+			duration = time.perf_counter() - start
+			self.load = duration / self.period
+			if duration < self.period:
+				time.sleep(self.period - duration)
@@ -29,9 +29,17 @@ from bass.login import LoginDialog, RegisterDialog, SelectDialog
 from bass.data import Project, Template, User, DataException
 from bass.registers import RegisterPane
 from bass.memory import MemoryPane
-from bass.dialogs import RenameDialog, DeleteDialog, ErrorDialog, HelpDialog
+from bass.trace import TracePane
+from bass.backtrace import BacktracePane
+from bass.dialogs import RenameDialog, DeleteDialog, ErrorDialog, HelpDialog, \
+	ConditionDialog
 from bass.arch import SimException, Run
-from bass import io
+from bass.breaks import ConditionException, parse_condition
+from bass.build import BuildCache, CompileService
+from bass.history import History
+from bass.remote import WorkerPool
+from bass.sched import QuantumController, Scheduler
+from bass import io, DisassemblyException
 
 LINE_RE = re.compile(r"^([^\.]+\.[^:]:[0-9]+:).*$")
 
@@ -45,6 +53,7 @@ DEFAULT_PORT = 8888
 class Session(orc.Session):
 
 	AUTO_BP = { "main", "_exit" }
+	COMPILE_PERIOD = 250	# period to check compilation progress (ms)
 
 	def __init__(self, app, man):
 		orc.Session.__init__(self, app, man)
@@ -59,6 +68,7 @@ class Session(orc.Session):
 
 			def on_clear(self, set):
 				self.session.clear_breakpoints()
+				self.session.conditions.clear()
 
 			def on_change(self, set):
 				self.session.clear_breakpoints()
@@ -69,29 +79,46 @@ class Session(orc.Session):
 
 			def on_remove(self, set, item):
 				self.session.clear_breakpoint(item)
+				self.session.conditions.pop(item, None)
 
 		# get configuration
 		self.sim_freq = app.get_config("sim_freq", 5)
+		self.display_rate = app.get_config("display_rate", 10)
 
 		# application state
 		self.user = None
 		self.project = None
 		self.sim = None
+		self.sim_loaded = False
 		self.compiled = orc.Var(False)
 		self.started = orc.Var(False)
 		self.running = orc.Var(False)
 		self.ready_count = 0
-		self.quantum_inst = None
+		self.quantum = None
 		self.quantum_period = 1000 / self.sim_freq
+		self.frame_period = 1000 / self.display_rate
+		self.tick_period = min(self.quantum_period, self.frame_period)
+		self.frame_date = None
+		self.frame_time = 0
+		self.quantum_started = False
+		self.sim_lock = threading.RLock()
+		self.sim_active = False
+		self.sim_status = None
+		self.weight = 1.
 		self.date = orc.Var(None, orc.Types.INT)
+		self.ips = orc.Var(None, orc.Types.INT)
 		self.sim_timeout = orc.Var(False,
 			icon=orc.Icon(orc.IconType.STOPWATCH, color="green"))
 		self.timeout_icon = orc.Icon(orc.IconType.STOPWATCH, color="red")
 		self.breakpoints = orc.SetVar(set(), item_type=int)
+		self.conditions = {}		# address -> (text, tree, hit count)
 		self.breakpoints.add_observer(BreakPointObserver(self))
-		self.restore_bp = False
+		self.until = None
 		self.bp_to_remove = set()
 		self.current_addr = orc.Var(None, type=int)
+		self.history = None
+		self.profiling = False
+		self.turbo = False
 
 		# compilation and simulation actions
 		self.start_icon = orc.Icon(orc.IconType.PLAY, color="green")
@@ -113,10 +140,26 @@ class Session(orc.Session):
 			icon=orc.Icon(orc.IconType.SKIP_FORWARD), help="Run to current position.")
 		self.go_on_action = orc.Action(self.go_on, enable=paused,
 			icon=orc.Icon(orc.IconType.FAST_FORWARD), help="Go on execution.")
+		self.turbo_action = orc.Action(self.run_turbo, enable=paused,
+			icon=orc.Icon("!lightning"),
+			help="Run to completion without updating the display.")
+		self.step_back_action = orc.Action(self.step_back, enable=paused,
+			icon=orc.Icon("!skip-backward"),
+			help="Go back to the previous instruction.")
+		self.run_back_action = orc.Action(self.run_back, enable=paused,
+			icon=orc.Icon("!rewind"),
+			help="Go back to the previous breakpoint.")
 		self.pause_action = orc.Action(self.pause, enable=self.running,
 			icon=orc.Icon(orc.IconType.PAUSE), help="Pause the execution")
 		self.reset_action = orc.Action(self.reset, enable=paused,
 			icon=orc.Icon(orc.IconType.RESET), help="Reset the simulation.")
+		self.condition_action = orc.Action(self.edit_condition,
+			enable=orc.not_null(self.current_addr),
+			icon=orc.Icon("!patch-question"),
+			help="Set the condition of the breakpoint at the current position.")
+		self.profile_action = orc.Action(self.toggle_profile, enable=self.started,
+			icon=orc.Icon("!fire"),
+			help="Enable/disable the execution profile.")
 
 		self.open_new_project_action = orc.Action(self.open_new_project,
 			label="Open/New", help="Close current project and open/create another.")
@@ -139,6 +182,11 @@ class Session(orc.Session):
 		self.project_label = None
 		self.console = None
 		self.sim_timer = None
+		self.compile_timer = None
+		self.compile_job = None
+		self.compile_done = None
+		self.compile_disasm = None
+		self.compile_status = None
 		self.timeout_button = None
 		self.editors = None
 		self.disasm = None
@@ -151,6 +199,7 @@ class Session(orc.Session):
 		self.select_dialog = None
 		self.user_config_dialog = None
 		self.rename_dialog = None
+		self.condition_dialog = None
 		self.delete_dialog = None
 		self.error_dialog = None
 		self.help_dialog = None
@@ -161,12 +210,31 @@ class Session(orc.Session):
 
 	def release(self):
 		orc.Session.release(self)
+		self.release_sim()
 		if self.user is None:
 			name = "no user"
 		else:
 			name = self.user.get_name()
 		self.get_logger().info(f"session {self.get_number()} ({name}) closed!")
 
+	def release_sim(self):
+		"""Give back the simulator to its pool. The simulation is first
+		stopped under the lock so that the scheduler cannot run a quantum
+		on a recycled simulator (a started quantum is completed)."""
+		with self.sim_lock:
+			sim = self.sim
+			self.sim_active = False
+			self.app.get_scheduler().remove(self)
+			if self.quantum_started:
+				self.quantum_started = False
+				try:
+					sim.finish_batch()
+				except SimException:
+					pass
+			self.sim = None
+		if sim is not None:
+			sim.get_template().release_simulator(sim)
+
 	def get_logger(self):
 		"""Get the logger of the application."""
 		return self.app.get_logger()
@@ -193,9 +261,11 @@ class Session(orc.Session):
 
 	def update_sim_display(self):
 		"""Udpdate the display according to the current simulator state."""
+		changes = self.sim.get_changes()
 		for pane in self.panes:
-			pane.on_sim_update(self, self.sim)
-		self.date.set(self.sim.get_date())
+			pane.on_sim_update(self, self.sim, changes)
+		self.frame_date = self.sim.get_date()
+		self.date.set(self.frame_date)
 
 	def is_breakpoint(self, pc):
 		"""Test if the given PC is a breakpoint."""
@@ -205,6 +275,9 @@ class Session(orc.Session):
 		"""Add a breakpoint to the simulator."""
 		if self.sim:
 			self.sim.set_breakpoint(addr)
+			if addr in self.conditions:
+				(_, tree, hits) = self.conditions[addr]
+				self.sim.set_condition(addr, tree, hits)
 
 	def clear_breakpoint(self, addr):
 		"""Remove breakpoint from the simulator."""
@@ -225,23 +298,82 @@ class Session(orc.Session):
 			for addr in bps:
 				self.set_breakpoint(addr)
 
-	def execute_quantum(self):
-		"""Execute a quantum of instruction if not interrupted by a BP."""
-		timeout = time.time() + self.quantum_period / 1000
-		result = self.sim.run(self.quantum_inst)
-		if time.time() >= timeout:
-			self.sim_timeout.set(True)
-		if result == Run.BP:
-			self.complete_quantum()
-		else:
-			self.update_sim_display()
+	def get_weight(self):
+		"""Get the weight of the session for the simulation scheduler."""
+		return self.weight
+
+	def start_quantum(self, duration):
+		"""Called by the scheduler to start a quantum lasting at most duration
+		seconds. end_quantum() is always called after. The lock of the
+		session is only held while the quantum is started, not while it
+		runs in a worker process."""
+		with self.sim_lock:
+			self.quantum_started = False
+			if self.sim_active and self.sim_status is None:
+				try:
+					self.sim.start_batch(self.quantum.get_quantum_for(duration),
+						self.until)
+					self.quantum_started = True
+				except SimException as e:
+					self.sim_status = e
+
+	def end_quantum(self):
+		"""Called by the scheduler to wait for the end of the quantum."""
+		with self.sim_lock:
+			try:
+				if self.quantum_started:
+					self.quantum_started = False
+					(result, count) = self.sim.finish_batch()
+					self.quantum.update(count, self.sim.get_batch_time())
+					if self.history is not None:
+						self.history.record()
+					if result != Run.OK:
+						self.sim_status = result
+			except SimException as e:
+				self.sim_status = e
+			finally:
+				if self.sim_status is not None:
+					self.app.get_scheduler().remove(self)
+
+	def on_sim_tick(self):
+		"""Called at the quantum rate while the simulation is running to stop
+		as soon as the simulation has been interrupted (breakpoint,
+		watchpoint, error). The quanta run at the pace of the scheduler: the
+		display is only refreshed at the display rate and if the simulation
+		has advanced."""
+		with self.sim_lock:
+			status = self.sim_status
+			if status is None:
+				now = time.perf_counter()
+				if (now - self.frame_time) * 1000 < self.frame_period:
+					return
+				self.frame_time = now
+				ips = self.quantum.get_ips()
+				self.ips.set(None if ips is None else int(ips))
+				self.sim_timeout.set(self.app.get_scheduler().is_overloaded())
+				if self.turbo:
+					self.date.set(self.sim.get_date())
+				elif self.sim.get_date() != self.frame_date:
+					self.update_sim_display()
+			else:
+				if isinstance(status, SimException):
+					self.console.append(orc.text(orc.ERROR, f"ERROR: {status}"))
+				elif status == Run.WATCH:
+					hit = self.sim.get_watch_hit()
+					if hit is not None:
+						(addr, size) = hit
+						self.console.append(orc.text(orc.INFO,
+							f"Watched memory {addr:08x}-{addr + size - 1:08x} written."))
+				self.complete_quantum()
 
 	def complete_quantum(self):
 		"""Complete an execution sequence."""
-		if self.restore_bp:
-			self.restore_bp = False
-			self.clear_breakpoints()
-			self.set_breakpoints()
+		with self.sim_lock:
+			self.sim_active = False
+			self.sim_status = None
+			self.app.get_scheduler().remove(self)
+		self.turbo = False
+		self.until = None
 		self.update_sim_display()
 		self.sim_timer.stop()
 		self.running.set(False)
@@ -254,14 +386,21 @@ class Session(orc.Session):
 	def start_sim(self):
 		"""Start the simulation."""
 
-		# reset the simulator
-		self.sim.reset()
-
-		# load the code
-		try:
-			self.sim.load(self.project.get_exec_path())
-		except SimException as e:
-			self.console.append(orc.text(orc.ERROR, f"ERROR: {e}"))
+		# load the code or just restore the state after load
+		if self.sim_loaded:
+			self.sim.reset()
+		else:
+			try:
+				self.sim.load(self.project.get_exec_path())
+				self.sim_loaded = True
+			except SimException as e:
+				self.console.append(orc.text(orc.ERROR, f"ERROR: {e}"))
+		self.sim.enable_profile(self.profiling)
+		if self.sim.get_initial() is None:
+			self.history = None
+		else:
+			self.history = History(self.sim,
+				self.app.history_period, self.app.history_size * 1024)
 
 		# prepare simulation
 		self.started.set(True)
@@ -284,10 +423,12 @@ class Session(orc.Session):
 			self.pause(None)
 
 		# stop the simulator
+		self.history = None
 		self.started.set(False)
 		self.console.append(orc.text(orc.INFO, "Stop simulation."))
 		self.timeout_button.disable()
 		self.date.set(None)
+		self.ips.set(None)
 		self.sim_timeout.set(False)
 
 		# update panes
@@ -304,31 +445,58 @@ class Session(orc.Session):
 
 	def step(self, interface):
 		"""Perform the execution of one instruction."""
-		self.sim.step()
+		try:
+			self.sim.step()
+		except SimException as e:
+			self.console.append(orc.text(orc.ERROR, f"ERROR: {e}"))
+			return
+		if self.history is not None:
+			self.history.record()
 		self.update_sim_display()
 
+	def step_back(self, interface):
+		"""Go back to the previous instruction."""
+		if self.history is not None:
+			self.history.step_back()
+			self.update_sim_display()
+
+	def run_back(self, interface):
+		"""Go back in the execution to the previous breakpoint."""
+		if self.history is not None:
+			self.history.run_back(self.is_breakpoint)
+			self.update_sim_display()
+
 	def step_over(self, interface):
 		"""Perform the execution of the current line."""
-		self.clear_breakpoints()
-		addr = self.sim.next_pc()
-		self.set_breakpoint(addr)
-		self.restore_bp = True
+		self.until = self.sim.next_pc()
 		self.go_on(interface)
 
 	def run_to(self, interface):
 		"""Run to the current cursor position."""
 		if ~self.current_addr is not None:
-			self.clear_breakpoints()
-			self.set_breakpoint(~self.current_addr)
-			self.restore_bp = True
+			self.until = ~self.current_addr
 			self.go_on(interface)
 
 	def go_on(self, interface):
 		"""Go on with the execution."""
 		self.running.set(True)
 		self.sim_timeout.set(True)
+		with self.sim_lock:
+			self.sim_status = None
+			self.sim_active = True
+		self.app.get_scheduler().add(self)
 		self.sim_timer.start()
 
+	def run_turbo(self, interface):
+		"""Run until a breakpoint, the end of the program or a pause without
+		updating the display: only the date and the speed are shown."""
+		try:
+			self.until = self.project.get_disasm().find_label("_exit")
+		except DisassemblyException:
+			self.until = None
+		self.turbo = True
+		self.go_on(interface)
+
 	def pause(self, interface):
 		"""Pause the execution."""
 		self.complete_quantum()
@@ -336,8 +504,21 @@ class Session(orc.Session):
 	def reset(self, interface):
 		"""Reset the simulation."""
 		self.sim.reset()
+		if self.history is not None:
+			self.history.reset()
 		self.update_sim_display()
 
+	def toggle_profile(self, interface):
+		"""Enable or disable the execution profile."""
+		self.profiling = not self.profiling
+		with self.sim_lock:
+			self.sim.enable_profile(self.profiling)
+			self.update_sim_display()
+		if self.profiling:
+			self.console.append(orc.text(orc.INFO, "Profile enabled."))
+		else:
+			self.console.append(orc.text(orc.INFO, "Profile disabled."))
+
 	def save_all(self, on_done):
 		"""Save all editors and call function on_done() when it is completed.
 		Other parameters must not be used."""
@@ -354,10 +535,51 @@ class Session(orc.Session):
 		self.save_all(self.then_compile)
 
 	def then_compile(self):
-		"""Whan all is saved, finally perform the compilation."""
+		"""Whan all is saved, ask for the compilation."""
 		self.console.clear()
-		self.console.append("<b>Compiling...</b>")
-		(result, output, error) = self.project.compile()
+		self.compile_status = None
+		self.compile_done = None
+		self.compile_disasm = None
+		if ~self.compiled:
+			try:
+				self.compile_disasm = self.project.get_disasm()
+			except DisassemblyException:
+				pass
+		self.compile_job = self.app.get_compiler().submit(
+			self.project, self.on_compile_done)
+		self.compile_timer.start()
+		self.on_compile_tick()
+
+	def on_compile_done(self, job):
+		"""Called from the compilation service when the job is completed.
+		The result is processed by the compilation timer."""
+		self.compile_done = job
+
+	def on_compile_tick(self):
+		"""Called periodically during a compilation to display its progress
+		and to process its result."""
+		job = self.compile_done
+		if job is not None:
+			self.compile_done = None
+			self.compile_timer.stop()
+			if job is self.compile_job and job.get_project() is self.project:
+				self.compile_job = None
+				self.end_compile(job.get_result())
+		elif self.compile_job is not None:
+			position = self.app.get_compiler().get_position(self.compile_job)
+			if position != self.compile_status:
+				self.compile_status = position
+				if position == 0:
+					self.console.append("<b>Compiling...</b>")
+				else:
+					self.console.append(orc.text(orc.INFO,
+						f"Waiting for compilation (position {position} in queue)..."))
+		else:
+			self.compile_timer.stop()
+
+	def end_compile(self, result):
+		"""Process the result of a compilation."""
+		(result, output, error) = result
 		for line in output.split("\n"):
 			self.print_line(line)
 		for line in error.split("\n"):
@@ -370,21 +592,116 @@ class Session(orc.Session):
 			# record success
 			self.console.append(orc.text(orc.SUCCESS, "SUCCESS!"))
 			self.compiled.set(True)
+			self.sim_loaded = False
 			self.current_addr.set(None)
 
+			# remove breakpoints not found anymore
+			disasm = self.project.get_disasm()
+			old = self.compile_disasm
+			self.compile_disasm = None
+			conditions = self.conditions
+			self.conditions = {}
+			if old is None:
+				self.breakpoints.clear()
+				moved = []
+			else:
+				moved = self.map_breakpoints(old, disasm)
+				kept = [(addr, addr) for addr in ~self.breakpoints]
+
 			# alert panes
 			for pane in self.panes:
 				pane.on_compiled(self)
 
-			# put default breakpoints
-			self.breakpoints.clear()
-			self.restore_bp = False
-			disasm = self.project.get_disasm()
-			for lab in ["main", "_exit"]:
-				addr = disasm.find_label(lab)
-				if addr is not None:
-					self.breakpoints.add(addr)
-					self.bp_to_remove.add(addr)
+			# put moved or default breakpoints
+			if old is not None:
+				for (_, addr) in moved:
+					if addr not in ~self.breakpoints:
+						self.breakpoints.add(addr)
+
+				# parse again the conditions as labels may have moved
+				for (old_addr, addr) in kept + moved:
+					if old_addr in conditions:
+						(text, _, hits) = conditions[old_addr]
+						try:
+							self.set_condition(addr, text, hits)
+						except ConditionException as e:
+							self.console.append(orc.text(orc.ERROR,
+								f"ERROR: condition removed at {addr:08x}: {e}"))
+			else:
+				for lab in ["main", "_exit"]:
+					addr = disasm.find_label(lab)
+					if addr is not None:
+						self.breakpoints.add(addr)
+						self.bp_to_remove.add(addr)
+
+	def map_breakpoints(self, old, new):
+		"""Map the breakpoints from the old disassembly to the new one
+		according to their label and offset. The breakpoints that cannot
+		be mapped or that change of address are removed and the latter are
+		returned as pairs (old address, new address)."""
+		moved = []
+		for addr in list(~self.breakpoints):
+			loc = old.locate(addr)
+			new_addr = None if loc is None else new.resolve(*loc)
+			if new_addr != addr:
+				self.breakpoints.remove(addr)
+				if new_addr is not None:
+					moved.append((addr, new_addr))
+		return moved
+
+	def find_label(self, label):
+		"""Find the address of a label of the program or None."""
+		try:
+			return self.project.get_disasm().find_label(label)
+		except DisassemblyException:
+			return None
+
+	def find_register(self, name):
+		"""Find the number of a register in the simulator architecture
+		or None."""
+		if self.sim is None:
+			return None
+		arch = self.sim.get_arch()
+		reg = arch.find_register(name)
+		if reg is None:
+			return None
+		return arch.get_registers().index(reg)
+
+	def set_condition(self, addr, text, hits):
+		"""Set the condition (as text) and the hit count of the breakpoint at
+		addr, adding the breakpoint if required. Raise a ConditionException
+		if the condition is not valid."""
+		text = text.strip()
+		tree = None
+		if text:
+			tree = parse_condition(text, self.find_label, self.find_register)
+		if tree is None and hits <= 1:
+			self.conditions.pop(addr, None)
+		else:
+			self.conditions[addr] = (text, tree, hits)
+		if addr not in ~self.breakpoints:
+			self.breakpoints.add(addr)
+		elif self.sim:
+			self.sim.set_condition(addr, tree, hits)
+
+	def edit_condition(self, interface):
+		"""Display the dialog to set the condition of the breakpoint at the
+		current position."""
+		addr = ~self.current_addr
+		if addr is None:
+			return
+
+		def apply(text, hits):
+			try:
+				self.set_condition(addr, text, hits)
+				self.condition_dialog.hide()
+			except ConditionException as e:
+				self.condition_dialog.error(e)
+
+		if self.condition_dialog is None:
+			self.condition_dialog = ConditionDialog(self)
+		(text, _, hits) = self.conditions.get(addr, ("", None, 1))
+		self.condition_dialog.edit(text, hits, apply)
 
 	def print_line(self, line):
 		m = LINE_RE.match(line)
@@ -479,7 +796,12 @@ class Session(orc.Session):
 		self.panes.append(memory_pane)
 		io_pane = io.Pane()
 		self.panes.append(io_pane)
-		self.addons = orc.TabbedPane([("Memory", memory_pane), ("Input/Output", io_pane)])
+		trace_pane = TracePane()
+		self.panes.append(trace_pane)
+		backtrace_pane = BacktracePane()
+		self.panes.append(backtrace_pane)
+		self.addons = orc.TabbedPane([("Memory", memory_pane), ("Input/Output", io_pane),
+			("Trace", trace_pane), ("Backtrace", backtrace_pane)])
 		editor_group = split.Pane(
 			self.editors,
 			self.addons
@@ -498,12 +820,17 @@ class Session(orc.Session):
 				orc.ToolBar([
 					orc.Button(self.compile_action),
 					orc.Button(self.playstop_action),
+					orc.Button(self.run_back_action),
+					orc.Button(self.step_back_action),
 					orc.Button(self.step_action),
 					orc.Button(self.step_over_action),
 					orc.Button(self.run_to_action),
 					orc.Button(self.go_on_action),
+					orc.Button(self.turbo_action),
 					orc.Button(self.pause_action),
 					orc.Button(self.reset_action),
+					orc.Button(self.condition_action),
+					orc.Button(self.profile_action),
 					orc.Spring(hexpand = True),
 					orc.Button(orc.Icon(orc.IconType.HELP), on_click=self.help),
 					orc.Button(orc.Icon(orc.IconType.ABOUT), on_click=self.about)
@@ -518,14 +845,17 @@ class Session(orc.Session):
 				),
 				orc.StatusBar([
 					orc.hspring(),
+					orc.Field(self.ips, read_only=True, place_holder="inst/s"),
 					orc.Field(self.date, read_only=True, place_holder="date"),
 					self.timeout_button
 				])
 			]),
 			app = self.get_application()
 		)
-		self.sim_timer = orc.Timer(self.page, self.execute_quantum,
-			period=self.quantum_period)
+		self.sim_timer = orc.Timer(self.page, self.on_sim_tick,
+			period=self.tick_period)
+		self.compile_timer = orc.Timer(self.page, self.on_compile_tick,
+			period=self.COMPILE_PERIOD)
 
 		# start session
 		for pane in self.panes:
@@ -576,17 +906,23 @@ class Session(orc.Session):
 		if self.sim is not None:
 			for pane in self.panes:
 				pane.on_sim_release(self, self.sim)
-			self.sim.release()
-			self.sim = None
+			self.release_sim()
 
 		# display project
 		self.project = project
 		self.project_label.set_text(project.get_name())
 
 		# load the simulator
+		self.sim_loaded = False
 		try:
 			self.sim = project.new_sim()
-			self.quantum_inst = int(self.sim.get_frequency() / self.sim_freq)
+			template = project.get_template()
+			self.quantum = QuantumController(
+				self.quantum_period / 1000,
+				self.app.quantum_target,
+				template.get_quantum_min(),
+				template.get_quantum_max(),
+				self.sim.get_frequency() / self.sim_freq)
 		except (SimException, DataException) as e:
 			self.console.append(orc.text(orc.ERROR, f"ERROR: {e}"))
 			self.sim = None
@@ -680,6 +1016,7 @@ class Session(orc.Session):
 		"""Set the user in the main window."""
 		user.connect(self)
 		self.user = user
+		self.weight = self.app.get_scheduler().get_weight(user.get_groups())
 		self.user_label.set_text(user.get_name())
 		self.get_logger().info(f"Logging {self.user.get_name()}")
 
@@ -857,6 +1194,12 @@ class Application(orc.Application):
 		self.default_group = "students"
 		self.anon_enable = True
 		self.anon_group = "anonymous"
+		self.history_size = 1024
+		self.history_period = 10000
+		self.trace_size = 100000
+		self.sim_pool = 4
+		self.workers = None
+		self.quantum_target = 0.5
 
 		# parse configuration
 		self.config = config
@@ -869,6 +1212,18 @@ class Application(orc.Application):
 		self.anon_removal = int(config.get("bass", "anon_removal", fallback=1))
 		self.register_enable = config.get("bass", "register_enable", fallback="yes") == "yes"
 		self.template_path = config.get("bass", "template_dir", fallback="templates")
+		self.history_size = int(config.get("bass", "history_size", fallback=self.history_size))
+		self.history_period = int(config.get("bass", "history_period", fallback=self.history_period))
+		self.trace_size = int(config.get("bass", "trace_size", fallback=self.trace_size))
+		self.sim_pool = int(config.get("bass", "sim_pool", fallback=self.sim_pool))
+		self.quantum_target = float(config.get("bass", "quantum_target", fallback=self.quantum_target))
+		self.sched_budget = float(config.get("bass", "sched_budget", fallback=0.8))
+		self.sched_weights = Scheduler.parse_weights(
+			config.get("bass", "sched_weights", fallback=""))
+		if config.get("bass", "sim_backend", fallback="local") == "process":
+			self.workers = WorkerPool(
+				int(config.get("bass", "sim_workers", fallback=0)),
+				int(config.get("bass", "sim_answer_timeout", fallback=10)))
 
 		# finalize configuration
 		self.data_dir = os.path.join(os.getcwd(), self.data_dir)
@@ -891,6 +1246,25 @@ class Application(orc.Application):
 		#self.template_path = os.path.join(self.base_dir, "templates")
 		self.load_templates()
 
+		# prepare compilation service
+		self.build_cache = None
+		cache_size = int(config.get("bass", "build_cache_size", fallback=256))
+		if cache_size > 0:
+			self.build_cache = BuildCache(
+				os.path.join(self.data_dir, "cache"),
+				cache_size * 1024 * 1024,
+				self.log)
+		self.compiler = CompileService(
+			int(config.get("bass", "compile_workers", fallback=0)),
+			self.log)
+
+		# prepare simulation scheduler
+		self.scheduler = Scheduler(
+			1 / self.get_config("sim_freq", 5),
+			self.sched_budget,
+			self.sched_weights,
+			self.log)
+
 		# run threads
 		self.anon_thread = None
 		if self.anon_enable:
@@ -908,6 +1282,23 @@ class Application(orc.Application):
 		"""Get the name of the anonymous group."""
 		return self.anon_group
 
+	def get_scheduler(self):
+		"""Get the scheduler of simulations."""
+		return self.scheduler
+
+	def get_build_cache(self):
+		"""Get the build cache or None if it is disabled."""
+		return self.build_cache
+
+	def get_compiler(self):
+		"""Get the compilation service."""
+		return self.compiler
+
+	def get_workers(self):
+		"""Get the pool of worker processes running the simulators or None
+		if the simulators run in the server process."""
+		return self.workers
+
 	def log(self, msg, level=logging.INFO):
 		"""Log a message."""
 		self.logger.log(level, msg)
@@ -975,6 +1366,8 @@ class Application(orc.Application):
 			template = Template(self, name)
 			template.load()
 			self.templates[name] = template
+			if template.is_enabled():
+				template.prepare_simulators()
 
 	def get_template(self, name):
 		"""Find the template with the given name or return None."""
@@ -0,0 +1,119 @@
+#
+#	BASS is an online training assembly simulator.
+#	Copyright (C) 2024 University of Toulouse <hugues.casse@irit.fr>
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Tests of the readers of executables.
+
+The executable tests/data/loop.elf is built from tests/data/loop.s and
+tests/data/loop.dis is the expected output of objdump -d for it.
+
+Usage: python3 -m bass.test
+"""
+
+import os.path
+import tempfile
+import unittest
+
+import bass
+from bass import armdis, dwarf, elf
+from bass.data import Disassembly, ELFDisassembly
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+ELF_PATH = os.path.join(DATA_DIR, "loop.elf")
+DISASM_PATH = os.path.join(DATA_DIR, "loop.dis")
+
+
+class ELFTest(unittest.TestCase):
+	"""Tests of the ELF reader."""
+
+	def test_code_range(self):
+		file = elf.File(ELF_PATH)
+		self.assertEqual(file.get_entry(), 0x8000)
+		self.assertEqual(file.get_code_range(), (0x8000, 0x8034))
+		self.assertEqual(file.get_pages(4096), [0x8000])
+
+	def test_symbols(self):
+		labels = {sym.get_name(): sym.get_value()
+			for sym in elf.File(ELF_PATH).get_symbols() if sym.is_label()}
+		self.assertEqual(labels, {
+			"_start": 0x8000,
+			"loop": 0x8008,
+			"end": 0x8018,
+			"func": 0x801c,
+			"value": 0x8030
+		})
+
+
+class DisassemblyTest(unittest.TestCase):
+	"""Comparison of the ELF disassembler with objdump."""
+
+	def setUp(self):
+		self.disasm = ELFDisassembly(ELF_PATH)
+		with open(DISASM_PATH, encoding="UTF8") as inp:
+			self.objdump = Disassembly(inp.read())
+
+	def test_code(self):
+		self.assertEqual(list(self.disasm.get_code()),
+			list(self.objdump.get_code()))
+
+	def test_labels(self):
+		for label in ["_start", "loop", "end", "func", "value"]:
+			self.assertEqual(self.disasm.find_label(label),
+				self.objdump.find_label(label))
+		self.assertEqual(self.disasm.locate(0x8014), ("loop", 0xc))
+		self.assertEqual(self.disasm.resolve("func", 8), 0x8024)
+
+	def test_thumb(self):
+		with open(ELF_PATH, "rb") as inp:
+			data = inp.read().replace(b"$d\0", b"$t\0")
+		with tempfile.TemporaryDirectory() as dir:
+			path = os.path.join(dir, "thumb.elf")
+			with open(path, "wb") as out:
+				out.write(data)
+			self.assertRaises(bass.DisassemblyException, ELFDisassembly, path)
+
+	def test_immediates(self):
+		self.assertEqual(armdis.disassemble(0xe3a0000a, 0), "mov\tr0, #10")
+		self.assertEqual(armdis.disassemble(0xe3a004ff, 0),
+			"mov\tr0, #-16777216\t@ 0xff000000")
+		self.assertEqual(armdis.disassemble(0xe51b3014, 0),
+			"ldr\tr3, [fp, #-20]\t@ 0xffffffec")
+		self.assertEqual(armdis.disassemble(0xe5b10000, 0), "ldr\tr0, [r1, #0]!")
+
+
+class LineTableTest(unittest.TestCase):
+	"""Tests of the DWARF line table reader."""
+
+	def setUp(self):
+		self.lines = dwarf.read_lines(elf.File(ELF_PATH))
+
+	def test_find(self):
+		self.assertEqual(self.lines.find(0x8000), ("loop.s", 2))
+		self.assertEqual(self.lines.find(0x800c), ("loop.s", 6))
+		self.assertEqual(self.lines.find(0x802c), ("loop.s", 16))
+		self.assertIsNone(self.lines.find(0x8030))
+		self.assertIsNone(self.lines.find(0x7ffc))
+
+	def test_find_address(self):
+		self.assertEqual(self.lines.find_address("loop.s", 5), 0x8008)
+		self.assertEqual(self.lines.find_address("loop.s", 4), 0x8008)
+		self.assertIsNone(self.lines.find_address("loop.s", 17))
+		self.assertIsNone(self.lines.find_address("other.s", 1))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,223 @@
+"""Pane displaying the trace of the executed instructions."""
+
+import html
+import os
+import struct
+import tempfile
+
+import orchid as orc
+from orchid.util import Buffer
+import bass
+from bass.arch import Trace
+
+
+class TableView(orc.Component):
+	"""Display an HTML table (as the trace or the call stack) or a message
+	if there is nothing to display."""
+
+	MODEL = orc.Model(
+		"bass-table-view",
+		style = """
+.bass-table-view {
+	overflow: auto;
+}
+
+.bass-table-view table {
+	border-collapse: collapse;
+}
+
+.bass-table-view table tr td {
+	padding: 0 8px 0 2px;
+	font-family: monospace;
+	white-space: nowrap;
+}
+
+.bass-table-view table tr th {
+	text-align: left;
+	padding-right: 8px;
+	font-weight: normal;
+	text-decoration-line: underline;
+}
+"""
+	)
+
+	def __init__(self, content):
+		orc.Component.__init__(self, self.MODEL)
+		self.add_class("text-back")
+		self.content = content
+
+	def gen(self, out):
+		out.write('<div ')
+		self.gen_attrs(out)
+		out.write('>')
+		out.write(self.content)
+		out.write('</div>')
+
+	def show(self, content):
+		"""Change the displayed content."""
+		self.content = content
+		if self.online():
+			self.set_content(content)
+
+	def expands_horizontal(self):
+		return True
+
+	def expands_vertical(self):
+		return True
+
+
+class TracePane(orc.VGroup, bass.ApplicationPane):
+	"""Application pane to record and display the trace of the executed
+	instructions."""
+
+	SHOWN = 100			# number of displayed instructions
+	CHUNK = 65536		# number of instructions read at once for download
+	MODES = ["addresses", "addresses and registers"]
+
+	def __init__(self):
+		self.mode = orc.Var(0, orc.Types.enum(self.MODES, 0),
+			help="Recorded information.")
+		self.recording = orc.Var(False)
+		record_action = orc.Action(self.toggle_record,
+			icon=orc.Icon("!record-circle"),
+			help="Start/stop the recording of the trace.")
+		download_action = orc.Action(self.download,
+			enable=self.recording,
+			icon=orc.Icon("!download"),
+			help="Download the recorded trace in binary format.")
+		self.selector = orc.HGroup([
+			orc.Select(self.mode),
+			orc.Button(record_action),
+			orc.Button(download_action)
+		])
+		self.selector.disable()
+		self.view = TableView("Trace disabled.")
+		orc.VGroup.__init__(self, [
+			self.selector,
+			self.view
+		])
+		self.session = None
+		self.sim = None
+		self.disasm = None
+		self.download_path = None
+
+	def expands_horizontal(self):
+		return True
+
+	def expands_vertical(self):
+		return True
+
+	def enable_trace(self):
+		"""Configure the trace in the simulator."""
+		if ~self.recording:
+			self.sim.enable_trace(self.session.get_application().trace_size,
+				~self.mode == 1)
+		else:
+			self.sim.enable_trace(0)
+
+	def toggle_record(self, interface):
+		"""Start or stop the trace recording."""
+		self.recording.set(not ~self.recording)
+		if self.sim is not None:
+			with self.session.sim_lock:
+				self.enable_trace()
+				self.update()
+
+	def get_label(self, addr):
+		"""Get the address relative to the closest label."""
+		label = None if self.disasm is None else self.disasm.get_label(addr)
+		return "" if label is None else label
+
+	def get_inst(self, addr):
+		"""Get the instruction text at addr."""
+		row = None if self.disasm is None else self.disasm.row_of(addr)
+		if row is None:
+			return ""
+		else:
+			return self.disasm.get_code()[row][2]
+
+	def update(self):
+		"""Display the last instructions of the trace."""
+		if self.sim is None or not ~self.recording:
+			self.view.show("Trace disabled.")
+			return
+		length = self.sim.get_trace_length()
+		entries = self.sim.get_trace(max(0, length - self.SHOWN), self.SHOWN)
+		regs = self.sim.get_arch().get_registers()
+		out = Buffer()
+		out.write("<table><tr><th></th><th>Address</th><th>Label</th>"
+			"<th>Instruction</th><th>Changes</th></tr>")
+		for (i, (addr, changes)) in enumerate(reversed(entries)):
+			if changes is None:
+				changes = ""
+			else:
+				changes = " ".join(f"{regs[num].get_name()}={regs[num].format(value)}"
+					for (num, value) in changes)
+			out.write(f"<tr><td>-{i}</td><td>{addr:08x}</td>"
+				f"<td>{html.escape(self.get_label(addr))}</td>"
+				f"<td>{html.escape(self.get_inst(addr))}</td>"
+				f"<td>{changes}</td></tr>")
+		out.write("</table>")
+		self.view.show(str(out))
+
+	def remove_download(self):
+		"""Remove the temporary file of the previous download, if any."""
+		if self.download_path is not None:
+			try:
+				os.remove(self.download_path)
+			except OSError:
+				pass
+			self.download_path = None
+
+	def download(self, interface):
+		"""Write the trace in a temporary file and download it. The file
+		starts with Trace.MAGIC, a byte of flags (1 if registers are recorded)
+		and the number of instructions (64-bit) followed by the entries as
+		encoded by Trace.encode(). The file is kept until the next download
+		or the end of the session."""
+		if self.sim is None:
+			return
+		self.remove_download()
+		user = self.session.get_user()
+		name = f"{self.session.get_project().get_name()}-trace.bin"
+		(fd, path) = tempfile.mkstemp(prefix="bass-trace-", suffix=".bin")
+		self.download_path = path
+		with self.session.sim_lock:
+			length = self.sim.get_trace_length()
+			with os.fdopen(fd, "wb") as out:
+				out.write(Trace.MAGIC)
+				out.write(struct.pack("<BQ", 1 if ~self.mode == 1 else 0, length))
+				for first in range(0, length, self.CHUNK):
+					out.write(self.sim.read_trace(first, self.CHUNK))
+		url = f"/download/{user.get_name()}/{name}"
+		page = self.session.get_page()
+		page.publish_file(url, path, mime="application/octet-stream")
+		page.open_url(url, "_blank")
+
+	def on_begin(self, session):
+		self.session = session
+
+	def on_end(self, session):
+		self.remove_download()
+		self.session = None
+
+	def on_compiled(self, session):
+		try:
+			self.disasm = session.get_project().get_disasm()
+		except bass.DisassemblyException:
+			self.disasm = None
+
+	def on_sim_start(self, session, sim):
+		self.sim = sim
+		self.selector.enable()
+		self.enable_trace()
+		self.update()
+
+	def on_sim_stop(self, session, sim):
+		self.sim = None
+		self.selector.disable()
+		self.update()
+
+	def on_sim_update(self, session, sim, changes):
+		if changes.pc_moved and ~self.recording and self.is_shown():
+			self.update()
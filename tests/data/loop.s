@@ -0,0 +1,18 @@
+_start:
+	mov	r0, #0
+	ldr	r1, =value
+loop:
+	add	r0, r0, #1
+	cmp	r0, #100
+	bne	loop
+	bl	func
+end:
+	b	end
+func:
+	push	{r4, lr}
+	sub	sp, sp, #36
+	str	r0, [r1, #-8]!
+	add	sp, sp, #36
+	pop	{r4, pc}
+value:
+	.word	0x12345678